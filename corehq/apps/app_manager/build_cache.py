@@ -0,0 +1,200 @@
+"""
+Caches used while making an app build so that work isn't repeated within the build,
+or repeated from the previous build.
+"""
+from copy import deepcopy
+import hashlib
+import json
+import os
+import sys
+from multiprocessing.pool import ThreadPool
+from couchdbkit.resource import ResourceNotFound
+from dimagi.utils.decorators.memoized import memoized
+import commcare_translations
+
+# Validating a form shells out to formtranslate, so rendering is mostly spent
+# waiting and threads are enough to render forms in parallel.
+XFORM_RENDER_WORKERS = 4
+
+# Fields that differ from build to build without changing the files that are built from them.
+# Forms' versions are passed in separately for the forms they belong to.
+_VOLATILE_APP_FIELDS = (
+    '_id', '_rev', '_attachments', 'doc_type', 'copy_of', 'version',
+    'short_url', 'short_odk_url', 'short_odk_media_url', 'recipients',
+    'built_with', 'built_on', 'build_comment', 'comment_from',
+    'build_broken', 'build_broken_reason', 'is_released',
+    'multimedia_map', 'build_file_hashes',
+)
+_VOLATILE_FORM_FIELDS = ('version', 'validation_cache')
+
+
+def _hash(val):
+    if isinstance(val, unicode):
+        val = val.encode('utf-8')
+    return hashlib.md5(val).hexdigest()
+
+
+class XFormRenderCache(object):
+    """
+    Rendered xforms for the lifetime of one build.
+
+    Forms are keyed by their unique_id along with hashes of their source and of
+    their JSON (which includes their version and case actions), so a form is only
+    rendered again if something it is rendered from has changed.
+    """
+
+    def __init__(self, render):
+        """
+        render is a function taking a form and returning its rendered xform
+        """
+        self.render = render
+        self._results = {}
+
+    def get_key(self, form):
+        return (
+            form.unique_id,
+            _hash(form.source or ''),
+            _hash(json.dumps(form.to_json(), sort_keys=True)),
+        )
+
+    def _render(self, form):
+        try:
+            return self.render(form), None
+        except Exception:
+            return None, sys.exc_info()
+
+    def render_many(self, forms):
+        """
+        Renders (and validates) every form that isn't already in the cache in parallel.
+        Errors are raised when the form is fetched so that they surface in the
+        same place as they would when rendering one form at a time.
+        """
+        to_render = {}
+        for form in forms:
+            # the key, and so the source, is read up front rather than from the pool
+            key = self.get_key(form)
+            if key not in self._results:
+                to_render[key] = form
+        if not to_render:
+            return
+
+        keys = to_render.keys()
+        if len(keys) == 1:
+            results = [self._render(to_render[keys[0]])]
+        else:
+            pool = ThreadPool(min(XFORM_RENDER_WORKERS, len(keys)))
+            try:
+                results = pool.map(self._render, [to_render[key] for key in keys])
+            finally:
+                pool.close()
+                pool.join()
+        self._results.update(zip(keys, results))
+
+    def fetch(self, form):
+        key = self.get_key(form)
+        if key not in self._results:
+            self._results[key] = self._render(form)
+        xform, exc_info = self._results[key]
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return xform
+
+
+@memoized
+def get_code_fingerprint():
+    """
+    A hash of the code and data files that builds are generated from,
+    so that nothing is reused from a build made before a deploy changed them.
+    """
+    import corehq.apps.app_manager
+    md5 = hashlib.md5()
+    for package in (corehq.apps.app_manager, commcare_translations):
+        root = os.path.dirname(package.__file__)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in ('static', 'tests', 'migrations'))
+            for filename in sorted(filenames):
+                if filename.endswith(('.pyc', '.pyo')):
+                    continue
+                path = os.path.join(dirpath, filename)
+                md5.update(os.path.relpath(path, root))
+                with open(path, 'rb') as f:
+                    md5.update(f.read())
+    return md5.hexdigest()
+
+
+def _get_app_inputs(app_json):
+    app_json = deepcopy({key: value for key, value in app_json.items()
+                         if key not in _VOLATILE_APP_FIELDS})
+    forms = [form for module in app_json.get('modules', []) for form in module.get('forms', [])]
+    if app_json.get('user_registration'):
+        forms.append(app_json['user_registration'])
+    for form in forms:
+        for field in _VOLATILE_FORM_FIELDS:
+            form.pop(field, None)
+    return app_json
+
+
+def get_xform_inputs(form):
+    return [form.unique_id, form.get_version(), _hash(form.source or '')]
+
+
+def get_app_strings_inputs(app, lang):
+    """
+    App strings also include the column headers of reports in report modules,
+    which are saved in their own docs rather than in the app
+    """
+    reports = [
+        [config.report._id, config.report._rev]
+        for module in app.modules if hasattr(module, 'report_configs')
+        for config in module.report_configs
+    ]
+    return [lang, reports]
+
+
+class BuildFileCache(object):
+    """
+    Reuses files from the previous build that were made from the same inputs.
+
+    Each file's inputs (the app's JSON, the code it is generated with and
+    anything specific to the file, like a form's source) are hashed into a key.
+    The keys are saved with the build in `build_file_hashes` for the next build
+    to compare its own against.
+    """
+
+    def __init__(self, app, previous_version):
+        self.app = app
+        self.previous_version = previous_version
+        # The app's JSON is hashed up front. Nothing that the files depend on
+        # changes during the build, only form and media versions.
+        self.app_hash = _hash(json.dumps(_get_app_inputs(app.to_json()), sort_keys=True))
+        self._previous_files = {}
+
+    def get_key(self, filename, *inputs):
+        return _hash(json.dumps([get_code_fingerprint(), self.app_hash, filename] + list(inputs)))
+
+    def add_file(self, filename, key):
+        self.app.build_file_hashes[filename] = key
+
+    def matches_previous(self, filename, key):
+        return (self.previous_version is not None
+                and self.previous_version.build_file_hashes.get(filename) == key)
+
+    def remember_previous_file(self, filename, content):
+        self._previous_files[filename] = content
+
+    def get_previous_file(self, filename, key):
+        """
+        Returns the previous build's copy of the file if it was made from the same inputs,
+        otherwise None
+        """
+        if not self.matches_previous(filename, key):
+            return None
+        if filename not in self._previous_files:
+            try:
+                content = self.previous_version.fetch_attachment('files/%s' % filename)
+            except ResourceNotFound:
+                return None
+            if isinstance(content, unicode):
+                content = content.encode('utf-8')
+            self._previous_files[filename] = content
+        return self._previous_files[filename]
@@ -12,7 +12,7 @@ import types
 import re
 from collections import defaultdict
 from datetime import datetime
-from functools import wraps
+from functools import partial, wraps
 from copy import deepcopy
 from urllib2 import urlopen
 from urlparse import urljoin
@@ -43,6 +43,8 @@ from dimagi.utils.couch.bulk import get_docs
 from django_prbac.exceptions import PermissionDenied
 from corehq.apps.accounting.utils import domain_has_privilege
 
+from corehq.apps.app_manager.build_cache import (XFormRenderCache, BuildFileCache, get_xform_inputs,
+    get_app_strings_inputs)
 from corehq.apps.app_manager.commcare_settings import check_condition
 from corehq.apps.app_manager.const import *
 from corehq.apps.app_manager.xpath import dot_interpolate, LocationXpath
@@ -4142,6 +4144,7 @@ class ApplicationBase(VersionedDoc, SnapshotMixin,
             # but check explicitly so as not to change the _id if it exists
             copy._id = copy.get_db().server.next_uuid()
 
+        copy.start_build_caches(previous_version)
         copy.set_form_versions(previous_version)
         copy.set_media_versions(previous_version)
         copy.create_jadjar(save=True)
@@ -4175,6 +4178,10 @@ class ApplicationBase(VersionedDoc, SnapshotMixin,
         record.save()
         return record
 
+    def start_build_caches(self, previous_version):
+        # by default doing nothing here is fine.
+        pass
+
     def set_form_versions(self, previous_version):
         # by default doing nothing here is fine.
         pass
@@ -4262,6 +4269,8 @@ class Application(ApplicationBase, TranslationMixin, HQMediaMixin):
     auto_gps_capture = BooleanProperty(default=False)
     created_from_template = StringProperty()
     use_grid_menus = BooleanProperty(default=False)
+    # hashes of the inputs each of a build's files were made from, see BuildFileCache
+    build_file_hashes = DictProperty()
 
     @property
     @memoized
@@ -4356,10 +4365,47 @@ class Application(ApplicationBase, TranslationMixin, HQMediaMixin):
     def default_language(self):
         return self.build_langs[0] if len(self.build_langs) > 0 else "en"
 
+    @staticmethod
+    def _render_xform(form):
+        return form.validate_form().render_xform().encode('utf-8')
+
     def fetch_xform(self, module_id=None, form_id=None, form=None):
         if not form:
             form = self.get_module(module_id).get_form(form_id)
-        return form.validate_form().render_xform().encode('utf-8')
+        render_cache = getattr(self, '_xform_render_cache', None)
+        if render_cache is not None:
+            return render_cache.fetch(form)
+        return self._render_xform(form)
+
+    def start_build_caches(self, previous_version):
+        self._xform_render_cache = XFormRenderCache(self._render_xform)
+        self.build_file_hashes = {}
+        self._build_file_cache = BuildFileCache(self, previous_version)
+
+    def _get_build_file(self, filename, inputs, render):
+        """
+        Reuses the previous build's copy of the file if it was made from the same inputs
+        """
+        build_files = getattr(self, '_build_file_cache', None)
+        if build_files is None:
+            return render()
+        key = build_files.get_key(filename, *inputs)
+        build_files.add_file(filename, key)
+        content = build_files.get_previous_file(filename, key)
+        return content if content is not None else render()
+
+    def _has_previous_build_file(self, filename, inputs):
+        build_files = getattr(self, '_build_file_cache', None)
+        return (build_files is not None
+                and build_files.matches_previous(filename, build_files.get_key(filename, *inputs)))
+
+    def prepare_xforms(self, forms):
+        """
+        Renders the forms in parallel ahead of fetch_xform when building
+        """
+        render_cache = getattr(self, '_xform_render_cache', None)
+        if render_cache is not None:
+            render_cache.render_many(forms)
 
     def set_form_versions(self, previous_version):
         """
@@ -4370,31 +4416,34 @@ class Application(ApplicationBase, TranslationMixin, HQMediaMixin):
             return hashlib.md5(val).hexdigest()
 
         if previous_version:
+            build_files = getattr(self, '_build_file_cache', None)
+            candidates = []
             for form_stuff in self.get_forms(bare=False):
-                filename = 'files/%s' % self.get_form_filename(**form_stuff)
+                filename = self.get_form_filename(**form_stuff)
                 form = form_stuff["form"]
-                form_version = None
+                form.version = None
                 try:
                     previous_form = previous_version.get_form(form.unique_id)
                     # take the previous version's compiled form as-is
                     # (generation code may have changed since last build)
-                    previous_source = previous_version.fetch_attachment(filename)
+                    previous_source = previous_version.fetch_attachment('files/%s' % filename)
                 except (ResourceNotFound, FormNotFoundException):
                     pass
                 else:
-                    previous_hash = _hash(previous_source)
-
                     # hack - temporarily set my version to the previous version
                     # so that that's not treated as the diff
-                    previous_form_version = previous_form.get_version()
-                    form.version = previous_form_version
-                    my_hash = _hash(self.fetch_xform(form=form))
-                    if previous_hash == my_hash:
-                        form_version = previous_form_version
-                if form_version is None:
+                    form.version = previous_form.get_version()
+                    if self._has_previous_build_file(filename, get_xform_inputs(form)):
+                        # made from the same inputs as the previous build's copy, so it's unchanged
+                        build_files.remember_previous_file(filename, previous_source)
+                    else:
+                        candidates.append((form, _hash(previous_source)))
+
+            self.prepare_xforms([form for form, _ in candidates])
+            for form, previous_hash in candidates:
+                my_hash = _hash(self.fetch_xform(form=form))
+                if previous_hash != my_hash:
                     form.version = None
-                else:
-                    form.version = form_version
 
     def set_media_versions(self, previous_version):
         """
@@ -4551,12 +4600,22 @@ class Application(ApplicationBase, TranslationMixin, HQMediaMixin):
         }
 
         for lang in ['default'] + self.build_langs:
-            files["%s/app_strings.txt" % lang] = self.create_app_strings(lang)
-        for form_stuff in self.get_forms(bare=False):
+            filename = "%s/app_strings.txt" % lang
+            files[filename] = self._get_build_file(
+                filename, get_app_strings_inputs(self, lang), partial(self.create_app_strings, lang))
+
+        forms_stuff = list(self.get_forms(bare=False))
+        self.prepare_xforms([
+            form_stuff['form'] for form_stuff in forms_stuff
+            if not self._has_previous_build_file(self.get_form_filename(**form_stuff),
+                                                 get_xform_inputs(form_stuff['form']))
+        ])
+        for form_stuff in forms_stuff:
             filename = self.get_form_filename(**form_stuff)
             form = form_stuff['form']
             try:
-                files[filename] = self.fetch_xform(form=form)
+                files[filename] = self._get_build_file(
+                    filename, get_xform_inputs(form), partial(self.fetch_xform, form=form))
             except XFormException as e:
                 raise XFormException(_('Error in form "{}": {}').format(trans(form.name), unicode(e)))
         return files
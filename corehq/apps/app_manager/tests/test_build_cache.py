@@ -0,0 +1,137 @@
+from django.test import SimpleTestCase
+from corehq.apps.app_manager.build_cache import XFormRenderCache, BuildFileCache, get_app_strings_inputs
+
+
+class FakeForm(object):
+
+    def __init__(self, unique_id, source, version=None):
+        self.unique_id = unique_id
+        self.source = source
+        self.version = version
+
+    def to_json(self):
+        return {'unique_id': self.unique_id, 'version': self.version}
+
+
+class XFormRenderCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.rendered = []
+        self.cache = XFormRenderCache(self._render)
+
+    def _render(self, form):
+        self.rendered.append(form.unique_id)
+        if form.source == 'bad':
+            raise ValueError(form.unique_id)
+        return '{}:{}:{}'.format(form.unique_id, form.source, form.version)
+
+    def test_render_once(self):
+        forms = [FakeForm('a', 'source-a'), FakeForm('b', 'source-b')]
+        self.cache.render_many(forms)
+        self.assertEqual(sorted(self.rendered), ['a', 'b'])
+        self.assertEqual(self.cache.fetch(forms[0]), 'a:source-a:None')
+        self.assertEqual(self.cache.fetch(forms[1]), 'b:source-b:None')
+        self.cache.render_many(forms)
+        self.assertEqual(len(self.rendered), 2)
+
+    def test_changed_form(self):
+        form = FakeForm('a', 'source-a', version=1)
+        self.assertEqual(self.cache.fetch(form), 'a:source-a:1')
+        form.version = None
+        self.assertEqual(self.cache.fetch(form), 'a:source-a:None')
+        form.source = 'source-a2'
+        self.assertEqual(self.cache.fetch(form), 'a:source-a2:None')
+        self.assertEqual(self.rendered, ['a', 'a', 'a'])
+
+    def test_errors_raised_on_fetch(self):
+        forms = [FakeForm('a', 'source-a'), FakeForm('b', 'bad')]
+        self.cache.render_many(forms)
+        self.assertEqual(self.cache.fetch(forms[0]), 'a:source-a:None')
+        with self.assertRaisesRegexp(ValueError, 'b'):
+            self.cache.fetch(forms[1])
+
+
+class FakeBuild(object):
+
+    def __init__(self, app_json, files=None, build_file_hashes=None, modules=None):
+        self.app_json = app_json
+        self.files = files or {}
+        self.build_file_hashes = build_file_hashes or {}
+        self.modules = modules or []
+
+    def to_json(self):
+        return self.app_json
+
+    def fetch_attachment(self, name):
+        return self.files[name]
+
+
+class BuildFileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.app_json = {
+            'name': 'App',
+            'version': 3,
+            'modules': [{'forms': [{'unique_id': 'a', 'version': 2}]}],
+        }
+
+    def _make_previous_build(self):
+        previous = FakeBuild(dict(self.app_json, version=2), files={'files/a.xml': 'old a'})
+        cache = BuildFileCache(previous, None)
+        cache.add_file('a.xml', cache.get_key('a.xml', 'a', 2))
+        return previous
+
+    def test_reuse(self):
+        previous = self._make_previous_build()
+        app = FakeBuild(self.app_json)
+        cache = BuildFileCache(app, previous)
+        key = cache.get_key('a.xml', 'a', 2)
+        self.assertEqual(cache.get_previous_file('a.xml', key), 'old a')
+        self.assertIsNone(cache.get_previous_file('a.xml', cache.get_key('a.xml', 'a', 3)))
+
+    def test_app_changed(self):
+        previous = self._make_previous_build()
+        app = FakeBuild(dict(self.app_json, name='Renamed'))
+        cache = BuildFileCache(app, previous)
+        self.assertIsNone(cache.get_previous_file('a.xml', cache.get_key('a.xml', 'a', 2)))
+
+    def test_app_json_unchanged(self):
+        BuildFileCache(FakeBuild(self.app_json), None)
+        self.assertEqual(self.app_json['modules'][0]['forms'][0]['version'], 2)
+
+    def test_report_changed(self):
+        report = FakeReport('report-id', '1-abc')
+        previous = FakeBuild(dict(self.app_json, version=2), files={'files/en/app_strings.txt': 'old strings'},
+                             modules=[FakeReportModule([report])])
+        cache = BuildFileCache(previous, None)
+        cache.add_file('en/app_strings.txt',
+                       cache.get_key('en/app_strings.txt', *get_app_strings_inputs(previous, 'en')))
+
+        app = FakeBuild(self.app_json, modules=[FakeReportModule([report])])
+        cache = BuildFileCache(app, previous)
+        key = cache.get_key('en/app_strings.txt', *get_app_strings_inputs(app, 'en'))
+        self.assertEqual(cache.get_previous_file('en/app_strings.txt', key), 'old strings')
+
+        # the report's columns are edited
+        report._rev = '2-def'
+        key = cache.get_key('en/app_strings.txt', *get_app_strings_inputs(app, 'en'))
+        self.assertIsNone(cache.get_previous_file('en/app_strings.txt', key))
+
+
+class FakeReport(object):
+
+    def __init__(self, _id, _rev):
+        self._id = _id
+        self._rev = _rev
+
+
+class FakeReportConfig(object):
+
+    def __init__(self, report):
+        self.report = report
+
+
+class FakeReportModule(object):
+
+    def __init__(self, reports):
+        self.report_configs = [FakeReportConfig(report) for report in reports]
@@ -83,15 +83,16 @@ Language
 
 .. TODOs:
     sorting
-    Add esquery.iter() method
 """
 from collections import namedtuple
 from copy import deepcopy
+from itertools import islice
 import json
 
 from dimagi.utils.decorators.memoized import memoized
 
-from corehq.elastic import ES_URLS, ESError, run_query, SIZE_LIMIT
+from corehq.elastic import ES_URLS, ESError, run_query, SIZE_LIMIT, scroll_query, \
+    SCROLL_CHUNKSIZE, SCROLL_KEEPALIVE
 
 from . import facets
 from . import filters
@@ -177,6 +178,18 @@ class ESQuery(object):
         raw = run_query(self.url, self.raw_query)
         return ESQuerySet(raw, deepcopy(self))
 
+    def scroll(self, chunksize=SCROLL_CHUNKSIZE, keepalive=SCROLL_KEEPALIVE):
+        """
+        Run the query using the scroll API and return an iterator over the raw hits,
+        fetching `chunksize` at a time. Unlike ``run`` there is no limit on the
+        number of results unless ``size`` is set.
+        """
+        start = self._start or 0
+        limit = start + self._size if self._size is not None else None
+        hits = scroll_query(self.url, self.raw_query, chunksize=chunksize,
+                            keepalive=keepalive, limit=limit)
+        return islice(hits, start, None)
+
     @property
     def _filters(self):
         return self.es_query['query']['filtered']['filter']['and']
@@ -1,8 +1,9 @@
 import json
 from datetime import date
 from unittest import TestCase
+from mock import patch
 
-from corehq.elastic import ESError, SIZE_LIMIT
+from corehq.elastic import ESError, SIZE_LIMIT, bulk_send_to_elasticsearch
 from .es_query import HQESQuery, ESQuerySet
 from . import filters
 from . import forms, users
@@ -186,6 +187,108 @@ class TestESQuerySet(TestCase):
             ESQuerySet(self.example_error, HQESQuery('forms'))
 
 
+class FakeScrollES(object):
+    """Serves the pages of a scan/scroll request, recording the requests made"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self.cleared = []
+
+    def delete(self, path):
+        self.cleared.append(path)
+
+    def get(self, path, params=None, data=None):
+        self.requests.append((path, params))
+        if path != '_search/scroll':
+            # scan responses start with a page of no hits
+            return {'_scroll_id': '0', 'hits': {'hits': [], 'total': 0}}
+        page = int(params['scroll_id'])
+        hits = self.pages[page] if page < len(self.pages) else []
+        return {'_scroll_id': str(page + 1), 'hits': {'hits': hits, 'total': 0}}
+
+
+class TestScroll(TestCase):
+
+    def _scroll(self, query, pages, **kwargs):
+        es = FakeScrollES(pages)
+        with patch('corehq.elastic.get_es', return_value=es):
+            return list(query.scroll(**kwargs)), es.requests
+
+    def test_scroll(self):
+        pages = [[{'_id': 'a'}, {'_id': 'b'}], [{'_id': 'c'}]]
+        hits, requests = self._scroll(HQESQuery('forms'), pages, chunksize=2, keepalive='1m')
+        self.assertEqual(['a', 'b', 'c'], [hit['_id'] for hit in hits])
+        path, params = requests[0]
+        self.assertEqual({'scroll': '1m', 'search_type': 'scan'}, params)
+        # one request to start, one per page and one more to find the end
+        self.assertEqual(4, len(requests))
+
+    def test_scroll_start_and_size(self):
+        pages = [[{'_id': 'a'}, {'_id': 'b'}], [{'_id': 'c'}, {'_id': 'd'}]]
+        hits, _ = self._scroll(HQESQuery('forms').start(1).size(2), pages)
+        self.assertEqual(['b', 'c'], [hit['_id'] for hit in hits])
+
+    def test_scroll_cleared_at_limit(self):
+        es = FakeScrollES([[{'_id': 'a'}, {'_id': 'b'}], [{'_id': 'c'}]])
+        with patch('corehq.elastic.get_es', return_value=es):
+            hits = list(HQESQuery('forms').size(1).scroll(chunksize=2))
+        self.assertEqual(['a'], [hit['_id'] for hit in hits])
+        self.assertEqual(['_search/scroll/1'], es.cleared)
+
+    def test_scroll_not_cleared_when_exhausted(self):
+        es = FakeScrollES([[{'_id': 'a'}]])
+        with patch('corehq.elastic.get_es', return_value=es):
+            list(HQESQuery('forms').scroll())
+        self.assertEqual([], es.cleared)
+
+    def test_scroll_error(self):
+        es = FakeScrollES([])
+        es.get = lambda *args, **kwargs: TestESQuerySet.example_error
+        with patch('corehq.elastic.get_es', return_value=es):
+            with self.assertRaises(ESError):
+                list(HQESQuery('forms').scroll())
+
+
+class FakeBulkES(object):
+    """Responds to _bulk requests with the statuses given for each doc, in turn"""
+
+    def __init__(self, statuses_by_doc_id):
+        self.statuses_by_doc_id = statuses_by_doc_id
+        self.requests = []
+
+    def post(self, path, data=None):
+        lines = [json.loads(line) for line in data.strip().split('\n')]
+        self.requests.append(lines)
+        items = []
+        for line in lines[::2]:
+            doc_id = line['update']['_id']
+            status = self.statuses_by_doc_id[doc_id].pop(0)
+            result = {'_id': doc_id, 'status': status}
+            if status >= 400:
+                result['error'] = 'error {}'.format(status)
+            items.append({'update': result})
+        return {'errors': True, 'items': items}
+
+
+class TestBulkSend(TestCase):
+
+    def test_bulk_send(self):
+        es = FakeBulkES({
+            'ok': [201],
+            'busy': [429, 200],
+            'bad': [400],
+        })
+        docs = [{'_id': doc_id} for doc_id in ('ok', 'busy', 'bad')]
+        with patch('corehq.elastic.get_es', return_value=es), patch('corehq.elastic.time.sleep'):
+            failures = bulk_send_to_elasticsearch('forms', docs, chunk_size=3)
+
+        self.assertEqual([('bad', 'error 400')], failures)
+        self.assertEqual(2, len(es.requests))
+        # only the doc that elasticsearch was too busy for is retried
+        self.assertEqual([{'_id': 'busy'}], [line['doc'] for line in es.requests[1][1::2]])
+
+
 class TestESFacet(ElasticTestMixin, TestCase):
     def test_terms_facet(self):
         json_output = {
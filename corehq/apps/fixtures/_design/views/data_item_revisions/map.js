@@ -0,0 +1,6 @@
+function (doc) {
+    if (doc.doc_type === 'FixtureDataItem') {
+        // the start of the revision's hash, which changes whenever the item is saved
+        emit([doc.domain, doc.data_type_id], parseInt(doc._rev.split('-')[1].substring(0, 8), 16));
+    }
+}
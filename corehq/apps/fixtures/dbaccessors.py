@@ -32,3 +32,21 @@ def get_owner_ids_by_type(domain, owner_type, data_item_id):
         reduce=False,
         wrapper=lambda r: r['value']
     )
+
+
+def get_fixture_items_checksums(domain, data_type_ids):
+    """
+    Returns a dict of data type id to a string which changes whenever an item
+    of that type is added, changed or deleted
+    """
+    from corehq.apps.fixtures.models import FixtureDataItem
+    results = FixtureDataItem.get_db().view(
+        'fixtures/data_item_revisions',
+        keys=[[domain, data_type_id] for data_type_id in data_type_ids],
+        reduce=True,
+        group=True,
+    )
+    checksums = {data_type_id: '' for data_type_id in data_type_ids}
+    for row in results:
+        checksums[row['key'][1]] = '{}-{}'.format(int(row['value']['sum']), row['value']['count'])
+    return checksums
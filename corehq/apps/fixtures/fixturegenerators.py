@@ -1,9 +1,17 @@
 from collections import defaultdict
+import hashlib
 from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+from corehq.apps.fixtures.dbaccessors import get_fixture_items_checksums
 from corehq.apps.fixtures.models import FixtureDataItem, FixtureDataType
 from corehq.apps.users.models import CommCareUser
 from corehq.apps.products.fixtures import product_fixture_generator_json
 from corehq.apps.programs.fixtures import program_fixture_generator_json
+from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
+
+# how long the XML of global lookup tables is cached for (in seconds). Entries are
+# never reused after a table changes, so this is only for cleanup.
+GLOBAL_FIXTURE_CACHE_TIMEOUT = 24 * 60 * 60
 
 
 def item_lists_by_domain(domain):
@@ -49,6 +57,11 @@ class ItemListsProvider(object):
     id = 'item-list'
 
     def __call__(self, user, version, last_sync=None):
+        """
+        Global lookup tables are the same for every user in the domain, so their
+        XML is cached until the table or one of its items changes. Their fixtures
+        are returned as serialized XML.
+        """
         assert isinstance(user, CommCareUser)
 
         all_types = dict([(t._id, t) for t in FixtureDataType.by_domain(user.domain)])
@@ -61,11 +74,6 @@ class ItemListsProvider(object):
             # have to do another db trip later
             item._data_type = data_type
 
-        for global_fixture in global_types.values():
-            items = list(FixtureDataItem.by_data_type(user.domain, global_fixture))
-            _ = [_set_cached_type(item, global_fixture) for item in items]
-            items_by_type[global_fixture._id] = items
-
         other_items = FixtureDataItem.by_user(user)
         data_types = {}
 
@@ -81,15 +89,62 @@ class ItemListsProvider(object):
             _set_cached_type(item, data_types[item.data_type_id])
 
         fixtures = []
-        all_types = data_types.values() + global_types.values()
-        for data_type in all_types:
-            xFixture = ElementTree.Element('fixture', attrib={'id': ':'.join((self.id, data_type.tag)),
-                                                              'user_id': user.user_id})
-            xItemList = ElementTree.Element('%s_list' % data_type.tag)
-            xFixture.append(xItemList)
-            for item in sorted(items_by_type[data_type.get_id], key=lambda x: x.sort_key):
-                xItemList.append(item.to_xml())
+        for data_type in data_types.values():
+            xFixture = self._get_fixture_element(data_type, user)
+            xFixture.append(_item_list_to_xml(data_type, items_by_type[data_type.get_id]))
             fixtures.append(xFixture)
+
+        if global_types:
+            checksums = get_fixture_items_checksums(user.domain, global_types.keys())
+            for data_type in global_types.values():
+                # the cached XML is used as is rather than being parsed and serialized again
+                fixtures.append(''.join([
+                    self._get_fixture_start_tag(data_type, user),
+                    _get_global_item_list_xml(user.domain, data_type, checksums[data_type.get_id]),
+                    '</fixture>',
+                ]))
         return fixtures
 
+    def _get_fixture_id(self, data_type):
+        return ':'.join((self.id, data_type.tag))
+
+    def _get_fixture_element(self, data_type, user):
+        return ElementTree.Element('fixture', attrib={'id': self._get_fixture_id(data_type),
+                                                      'user_id': user.user_id})
+
+    def _get_fixture_start_tag(self, data_type, user):
+        return u'<fixture id={} user_id={}>'.format(
+            quoteattr(self._get_fixture_id(data_type)),
+            quoteattr(user.user_id),
+        ).encode('utf-8')
+
 item_lists = ItemListsProvider()
+
+
+def _item_list_to_xml(data_type, items):
+    xItemList = ElementTree.Element('%s_list' % data_type.tag)
+    for item in sorted(items, key=lambda x: x.sort_key):
+        xItemList.append(item.to_xml())
+    return xItemList
+
+
+def _global_fixture_cache_key(domain, data_type, items_checksum):
+    return hashlib.md5('global-fixture-{}-{}-{}-{}'.format(
+        domain, data_type.get_id, data_type._rev, items_checksum
+    )).hexdigest()
+
+
+def _get_global_item_list_xml(domain, data_type, items_checksum):
+    """
+    The serialized item list of a global lookup table
+    """
+    cache = get_redis_default_cache()
+    key = _global_fixture_cache_key(domain, data_type, items_checksum)
+    xml = cache.get(key)
+    if xml is None:
+        items = list(FixtureDataItem.by_data_type(domain, data_type))
+        for item in items:
+            item._data_type = data_type
+        xml = ElementTree.tostring(_item_list_to_xml(data_type, items), 'utf-8')
+        cache.set(key, xml, GLOBAL_FIXTURE_CACHE_TIMEOUT)
+    return xml
@@ -136,6 +136,24 @@ class FixtureDataTest(TestCase):
             self.assertEqual(delhi_id, 'Delhi_id')
 
 
+    def test_global_fixture_cache(self):
+        self.data_type.is_global = True
+        self.data_type.save()
+
+        def _district_ids():
+            fixture, = fixturegenerators.item_lists(self.user, V2)
+            fixture = ElementTree.fromstring(fixture)
+            self.assertEqual('item-list:district', fixture.attrib['id'])
+            return [node.text for node in fixture.findall('district_list/district/district_id')]
+
+        self.assertEqual(_district_ids(), ['Delhi_id'])
+        self.assertEqual(_district_ids(), ['Delhi_id'])
+
+        self.data_item.fields['district_id'].field_list[0].field_value = 'New_Delhi_id'
+        self.data_item.save()
+        self.assertEqual(_district_ids(), ['New_Delhi_id'])
+
+
 class DBAccessorTest(TestCase):
     @classmethod
     def setUpClass(cls):
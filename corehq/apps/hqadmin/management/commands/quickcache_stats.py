@@ -0,0 +1,55 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from corehq.util.quickcache_stats import get_shared_totals, reset_shared_totals, ALL_TIERS
+
+
+class Command(BaseCommand):
+    help = ("Print hit rates, fill times and payload sizes for quickcached functions, "
+            "optionally only those whose prefix contains the given string")
+    args = '[<prefix_filter>]'
+    option_list = BaseCommand.option_list + (
+        make_option('--sort',
+                    action='store',
+                    dest='sort',
+                    default='fill_seconds',
+                    help='Stat to sort by (hits, misses, fill_seconds, payload_bytes)'),
+        make_option('--reset',
+                    action='store_true',
+                    dest='reset',
+                    default=False,
+                    help='Clear the stats collected so far'),
+    )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_shared_totals()
+            return
+
+        prefix_filter = args[0] if args else ''
+        totals = {
+            prefix: tiers for prefix, tiers in get_shared_totals().items()
+            if prefix_filter in prefix
+        }
+        sort_key = options['sort']
+
+        def _sort_value(item):
+            _, tiers = item
+            return tiers.get(ALL_TIERS, {}).get(sort_key, 0)
+
+        for prefix, tiers in sorted(totals.items(), key=_sort_value, reverse=True):
+            print prefix
+            for tier, stats in sorted(tiers.items()):
+                calls = stats['hits'] + stats['misses']
+                fill_count = stats['fill_count'] or 1
+                print '    {tier:<20} {calls:>10} calls {hit_rate:>6.1%} hit rate'.format(
+                    tier=tier,
+                    calls=calls,
+                    hit_rate=float(stats['hits']) / calls if calls else 0,
+                ),
+                if stats['fill_count']:
+                    print '  {:>8.3f}s avg fill {:>10} bytes avg payload'.format(
+                        stats['fill_seconds'] / fill_count,
+                        stats['payload_bytes'] / (stats.get('payload_samples') or 1),
+                    )
+                else:
+                    print
@@ -1,8 +1,17 @@
-from collections import defaultdict
-from xml.etree.ElementTree import Element
-from corehq.apps.locations.models import SQLLocation
+from collections import defaultdict, namedtuple
+from datetime import datetime
+import hashlib
+from operator import itemgetter
+from xml.etree.ElementTree import Element, fromstring, tostring
+from django.db.models import Count, Max, Q
+from corehq.apps.locations.models import SQLLocation, LocationType
 from corehq import toggles
 from corehq.apps.fixtures.models import UserFixtureType
+from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
+
+# how long cached fixture XML is kept for (in seconds). Entries are never
+# reused after a change to the domain's locations, so this is only for cleanup.
+LOCATION_FIXTURE_CACHE_TIMEOUT = 24 * 60 * 60
 
 
 class LocationSet(object):
@@ -67,36 +76,50 @@ class LocationFixtureProvider(object):
 
         There is an admin feature flag that will make this generate
         a fixture with ALL locations for the domain.
-        """
-        if toggles.SYNC_ALL_LOCATIONS.enabled(user.domain):
-            locations = SQLLocation.active_objects.filter(domain=user.domain)
-        else:
-            locations = []
-            user_location = user.sql_location
-            if user_location:
-                # add users location (and ancestors) to fixture
-                locations.append(user_location)
-
-                # add all descendants as well
-                locations += (user_location.get_descendants()
-                                           .filter(is_archived=False))
-
-            if user.project.supports_multiple_locations_per_user:
-                # this might add duplicate locations but we filter that out later
-                location_ids = [loc._id for loc in user.locations]
-                locations += SQLLocation.active_objects.filter(
-                    location_id__in=location_ids
-                )
 
-        location_db = _location_footprint(locations)
-
-        if not should_sync_locations(last_sync, location_db, user):
+        The parts of the fixture that are the same for every user in the domain
+        (the user's location and its descendants, or everything when syncing all
+        locations) are cached as XML until a location in the domain changes.
+        """
+        watermark = get_location_watermark(user.domain)
+        if not _domain_changed_since(last_sync, watermark, user):
             return []
 
         root = Element('fixture',
                        {'id': self.id,
                         'user_id': user.user_id})
 
+        if toggles.SYNC_ALL_LOCATIONS.enabled(user.domain):
+            fragments = _get_domain_fragments(user.domain, watermark)
+            if not fragments:
+                return []
+            _append_fragments(root, fragments)
+            return [root]
+
+        # the user's location(s) and ancestors, but not descendants which are cached
+        locations = []
+        user_location = user.sql_location
+        if user_location:
+            locations.append(user_location)
+
+        if user.project.supports_multiple_locations_per_user:
+            # this might add duplicate locations but we filter that out later
+            location_ids = [loc._id for loc in user.locations]
+            locations += SQLLocation.active_objects.filter(
+                location_id__in=location_ids
+            ).select_related(*LOCATION_TYPE_FIELDS)
+
+        location_db = _location_footprint(locations)
+
+        subtrees = {}
+        if user_location and user_location.location_id in location_db:
+            # add all descendants of the user's location as well
+            subtrees[user_location.location_id] = _get_subtree_fragment(user_location, watermark)
+
+        if (not should_sync_locations(last_sync, location_db, user)
+                and not any(subtree.last_modified >= last_sync.date for subtree in subtrees.values())):
+            return []
+
         root_locations = filter(
             lambda loc: loc.parent is None, location_db.by_id.values()
         )
@@ -104,12 +127,16 @@ class LocationFixtureProvider(object):
         if not root_locations:
             return []
         else:
-            _append_children(root, location_db, root_locations)
+            _append_children(root, location_db, root_locations,
+                             {location_id: subtree.xml for location_id, subtree in subtrees.items()})
             return [root]
 
 
 location_fixture_generator = LocationFixtureProvider()
 
+# everything about a location's type that building the fixture looks at
+LOCATION_TYPE_FIELDS = ('location_type', 'location_type__parent_type')
+
 
 def _valid_parent_type(location):
     parent = location.parent
@@ -117,12 +144,45 @@ def _valid_parent_type(location):
     return parent_type == location.location_type.parent_type
 
 
+def _get_ancestors(locations):
+    """
+    All ancestors of the locations, with a single query
+    """
+    opts = SQLLocation._mptt_meta
+    query = Q()
+    for loc in locations:
+        query |= Q(**{
+            opts.tree_id_attr: getattr(loc, opts.tree_id_attr),
+            '{}__lt'.format(opts.left_attr): getattr(loc, opts.left_attr),
+            '{}__gt'.format(opts.right_attr): getattr(loc, opts.right_attr),
+        })
+    return SQLLocation.objects.filter(query).select_related(*LOCATION_TYPE_FIELDS)
+
+
+def _link_parents(locations):
+    """
+    Fetches any ancestors that aren't in `locations` and sets each location's parent
+    from them, so that walking up the tree doesn't need a query per location.
+    """
+    by_pk = {loc.pk: loc for loc in locations}
+    orphans = [loc for loc in locations
+               if loc.parent_id is not None and loc.parent_id not in by_pk]
+    ancestors = list(_get_ancestors(orphans)) if orphans else []
+    for ancestor in ancestors:
+        by_pk.setdefault(ancestor.pk, ancestor)
+    for loc in locations + ancestors:
+        if loc.parent_id is not None and loc.parent_id in by_pk:
+            loc.parent = by_pk[loc.parent_id]
+
+
 def _location_footprint(locations):
     """
     Given a list of locations, generate the footprint of those by walking up parents.
 
     Returns a dict of location ids to location objects.
     """
+    locations = list(locations)
+    _link_parents(locations)
     all_locs = LocationSet(locations)
     queue = list(locations)
     while queue:
@@ -142,11 +202,11 @@ def _location_footprint(locations):
     return all_locs
 
 
-def _append_children(node, location_db, locations):
+def _append_children(node, location_db, locations, subtrees=None):
     by_type = _group_by_type(locations)
     for type, locs in by_type.items():
         locs = sorted(locs, key=lambda loc: loc.name)
-        node.append(_types_to_fixture(location_db, type, locs))
+        node.append(_types_to_fixture(location_db, type, locs, subtrees))
 
 
 def _group_by_type(locations):
@@ -156,10 +216,13 @@ def _group_by_type(locations):
     return by_type
 
 
-def _types_to_fixture(location_db, type, locs):
+def _types_to_fixture(location_db, type, locs, subtrees=None):
     type_node = Element('%ss' % type.code)  # hacky pluralization
     for loc in locs:
-        type_node.append(_location_to_fixture(location_db, loc, type))
+        if subtrees and loc.location_id in subtrees:
+            type_node.append(fromstring(subtrees[loc.location_id]))
+        else:
+            type_node.append(_location_to_fixture(location_db, loc, type, subtrees))
     return type_node
 
 
@@ -172,7 +235,7 @@ def _get_metadata_node(location):
     return node
 
 
-def _location_to_fixture(location_db, location, type):
+def _location_to_fixture(location_db, location, type, subtrees=None):
     root = Element(type.code, {'id': location.location_id})
     fixture_fields = [
         'name',
@@ -190,5 +253,110 @@ def _location_to_fixture(location_db, location, type):
         root.append(field_node)
 
     root.append(_get_metadata_node(location))
-    _append_children(root, location_db, location_db.by_parent[location.location_id])
+    _append_children(root, location_db, location_db.by_parent[location.location_id], subtrees)
     return root
+
+
+LocationWatermark = namedtuple('LocationWatermark', ['last_modified', 'key'])
+# the XML for a location and everything below it, and when any of it was last modified
+SubtreeFragment = namedtuple('SubtreeFragment', ['xml', 'last_modified'])
+
+
+def get_location_watermark(domain):
+    """
+    Summarizes the domain's locations and location types. The key changes whenever
+    one is saved or deleted, and last_modified is the most recent save.
+    """
+    dates = []
+    key_parts = [domain]
+    for model in (SQLLocation, LocationType):
+        summary = model.objects.filter(domain=domain).aggregate(
+            last_modified=Max('last_modified'),
+            count=Count('pk'),
+        )
+        if summary['last_modified']:
+            dates.append(summary['last_modified'])
+        key_parts.extend([summary['count'], summary['last_modified']])
+    return LocationWatermark(
+        last_modified=max(dates) if dates else None,
+        key=hashlib.md5(repr(key_parts)).hexdigest(),
+    )
+
+
+def _domain_changed_since(last_sync, watermark, user):
+    """
+    A cheap check which is False if nothing could need syncing, without
+    looking at the user's locations
+    """
+    return (
+        not last_sync or
+        not last_sync.date or
+        fixture_last_modified(user) >= last_sync.date or
+        (watermark.last_modified is not None and watermark.last_modified >= last_sync.date)
+    )
+
+
+def _get_last_modified(locations):
+    dates = [date for loc in locations for date in (loc.last_modified, loc.location_type.last_modified)]
+    # locations without a date are always synced
+    return datetime.max if None in dates else max(dates)
+
+
+def _fragment_cache_key(watermark, name):
+    return hashlib.md5('location-fixture-{}-{}'.format(watermark.key, name)).hexdigest()
+
+
+def _get_subtree_fragment(location, watermark):
+    """
+    The fixture XML for a location and all its unarchived descendants
+    """
+    cache = get_redis_default_cache()
+    key = _fragment_cache_key(watermark, location.location_id)
+    cached = cache.get(key)
+    if cached:
+        return SubtreeFragment(*cached)
+
+    locations = [location] + list(location.get_descendants()
+                                          .filter(is_archived=False)
+                                          .select_related(*LOCATION_TYPE_FIELDS))
+    location_db = _location_footprint(locations)
+    fragment = SubtreeFragment(
+        xml=tostring(_location_to_fixture(location_db, location, location.location_type), 'utf-8'),
+        last_modified=_get_last_modified(locations),
+    )
+    cache.set(key, tuple(fragment), LOCATION_FIXTURE_CACHE_TIMEOUT)
+    return fragment
+
+
+def _get_domain_fragments(domain, watermark):
+    """
+    The fixture XML for every unarchived location in the domain, as a
+    list of (type code, name, XML) for each root location.
+    """
+    cache = get_redis_default_cache()
+    key = _fragment_cache_key(watermark, 'all')
+    fragments = cache.get(key)
+    if fragments is not None:
+        return fragments
+
+    locations = (SQLLocation.active_objects.filter(domain=domain)
+                 .select_related(*LOCATION_TYPE_FIELDS))
+    location_db = _location_footprint(locations)
+    fragments = [
+        (loc.location_type.code, loc.name,
+         tostring(_location_to_fixture(location_db, loc, loc.location_type), 'utf-8'))
+        for loc in location_db.by_id.values() if loc.parent is None
+    ]
+    cache.set(key, fragments, LOCATION_FIXTURE_CACHE_TIMEOUT)
+    return fragments
+
+
+def _append_fragments(node, fragments):
+    by_type = defaultdict(list)
+    for type_code, name, xml in fragments:
+        by_type[type_code].append((name, xml))
+    for type_code, locs in by_type.items():
+        type_node = Element('%ss' % type_code)  # hacky pluralization
+        for name, xml in sorted(locs, key=itemgetter(0)):
+            type_node.append(fromstring(xml))
+        node.append(type_node)
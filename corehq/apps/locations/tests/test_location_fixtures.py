@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta
 from django.test import TestCase
 from corehq.apps.locations.models import SQLLocation, LocationType, Location
-from corehq.apps.locations.tests.util import delete_all_locations
+from corehq.apps.locations.tests.util import delete_all_locations, _setup_location_types, _setup_locations
 from casexml.apps.phone.models import SyncLog
 from corehq.apps.users.models import CouchUser, CommCareUser
-from ..fixtures import _location_to_fixture, _location_footprint, should_sync_locations
+from ..fixtures import (_location_to_fixture, _location_footprint, should_sync_locations,
+                        LOCATION_TYPE_FIELDS, get_location_watermark, _get_subtree_fragment)
 from corehq.apps.fixtures.models import UserFixtureStatus
 
 
@@ -112,3 +113,51 @@ class LocationFixturesTest(TestCase):
         location_db = _location_footprint([location])
         self.assertTrue(should_sync_locations(SyncLog(date=after_save), location_db, self.user))
         self.assertFalse(should_sync_locations(SyncLog(date=after_archive), location_db, self.user))
+
+    def test_footprint_fetches_ancestors_at_once(self):
+        domain = 'lonely-mountain'
+        location_types = ['kingdom', 'hall', 'chamber']
+        _setup_location_types(domain, location_types)
+        locations = _setup_locations(domain, [
+            ('Erebor', [
+                ('Great Hall', [
+                    ('Treasury', []),
+                ]),
+            ]),
+        ], location_types)
+
+        treasury = (SQLLocation.objects.select_related(*LOCATION_TYPE_FIELDS)
+                    .get(location_id=locations['Treasury'].location_id))
+        with self.assertNumQueries(1):
+            location_db = _location_footprint([treasury])
+            fixture = _location_to_fixture(location_db, treasury, treasury.location_type)
+
+        self.assertEqual(
+            {loc.name for loc in location_db.by_id.values()},
+            {'Erebor', 'Great Hall', 'Treasury'}
+        )
+        self.assertEqual(fixture.find('name').text, 'Treasury')
+
+    def test_subtree_fragment_cache(self):
+        domain = 'iron-hills'
+        location_types = ['realm', 'mine']
+        _setup_location_types(domain, location_types)
+        locations = _setup_locations(domain, [
+            ('Iron Hills', [
+                ('Deep Mine', []),
+            ]),
+        ], location_types)
+        realm = locations['Iron Hills']
+
+        watermark = get_location_watermark(domain)
+        fragment = _get_subtree_fragment(realm, watermark)
+        self.assertIn('Deep Mine', fragment.xml)
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_subtree_fragment(realm, watermark), fragment)
+
+        mine = SQLLocation.objects.get(location_id=locations['Deep Mine'].location_id)
+        mine.name = 'Deeper Mine'
+        mine.save()
+        new_watermark = get_location_watermark(domain)
+        self.assertNotEqual(new_watermark.key, watermark.key)
+        self.assertIn('Deeper Mine', _get_subtree_fragment(realm, new_watermark).xml)
@@ -48,7 +48,8 @@ def prime_restore(domain, usernames_or_ids, version=V1, cache_timeout_hours=None
                     force_cache=True,
                     cache_timeout=cache_timeout_hours * 60 * 60,
                     overwrite_cache=overwrite_cache
-                )
+                ),
+                is_async=False,
             )
 
             if check_cache_only:
@@ -1,3 +1,4 @@
+import re
 from django.core.urlresolvers import reverse
 from django.shortcuts import redirect
 from django.utils.decorators import method_decorator
@@ -41,14 +42,20 @@ def get_restore_params(request):
         'version': request.GET.get('version', "1.0"),
         'state': request.GET.get('state'),
         'items': request.GET.get('items') == 'true',
-        'force_restore_mode': request.GET.get('mode', None)
+        'force_restore_mode': request.GET.get('mode', None),
+        'compress': _accepts_gzip(request),
     }
 
 
+def _accepts_gzip(request):
+    # same check as django's GZipMiddleware
+    return bool(re.search(r'\bgzip\b', request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
 def get_restore_response(domain, couch_user, since=None, version='1.0',
                          state=None, items=False, force_cache=False,
                          cache_timeout=None, overwrite_cache=False,
-                         force_restore_mode=None):
+                         force_restore_mode=None, compress=False):
     # not a view just a view util
     if not couch_user.is_commcare_user():
         return HttpResponse("No linked chw found for %s" % couch_user.username,
@@ -67,6 +74,7 @@ def get_restore_response(domain, couch_user, since=None, version='1.0',
             state_hash=state,
             include_item_count=items,
             force_restore_mode=force_restore_mode,
+            compress=compress and toggles.COMPRESSED_RESTORE.enabled(domain),
         ),
         cache_settings=RestoreCacheSettings(
             force_cache=force_cache,
@@ -4,6 +4,8 @@ urlpatterns = patterns('corehq.apps.receiverwrapper.views',
     url(r'^/?$', 'post', name='receiver_post'),
     url(r'^/secure/(?P<app_id>[\w-]+)/$', 'secure_post', name='receiver_secure_post_with_app_id'),
     url(r'^/secure/$', 'secure_post', name='receiver_secure_post'),
+    url(r'^/batch/(?P<app_id>[\w-]+)/$', 'batch_post', name='receiver_batch_post_with_app_id'),
+    url(r'^/batch/$', 'batch_post', name='receiver_batch_post'),
 
     # odk urls
     url(r'^/submission/?$',  'post', name="receiver_odk_post"),
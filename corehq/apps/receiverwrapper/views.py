@@ -192,3 +192,72 @@ def secure_post(request, domain, app_id=None):
         )
 
     return decorated_view(request, domain, app_id=app_id)
+
+
+def _process_batch(request, domain, app_id, user_id, authenticated):
+    submissions = couchforms.get_batch_instances_and_attachments(request)
+    app_id, build_id = get_app_and_build_ids(domain, app_id)
+    return couchforms.BatchSubmissionPost(
+        submissions=submissions,
+        domain=domain,
+        app_id=app_id,
+        build_id=build_id,
+        auth_context=AuthContext(
+            domain=domain,
+            user_id=user_id,
+            authenticated=authenticated,
+        ),
+        location=couchforms.get_location(request),
+        received_on=couchforms.get_received_on(request),
+        date_header=couchforms.get_date_header(request),
+        path=couchforms.get_path(request),
+        submit_ip=couchforms.get_submit_ip(request),
+        last_sync_token=couchforms.get_last_sync_token(request),
+        openrosa_headers=couchforms.get_openrosa_headers(request),
+    ).get_response()
+
+
+@login_or_digest_ex(allow_cc_users=True)
+def _batch_post_digest(request, domain, app_id=None):
+    """only ever called from batch_post"""
+    return _process_batch(
+        request=request,
+        domain=domain,
+        app_id=app_id,
+        user_id=request.couch_user.get_id,
+        authenticated=True,
+    )
+
+
+@login_or_basic_ex(allow_cc_users=True)
+def _batch_post_basic(request, domain, app_id=None):
+    """only ever called from batch_post"""
+    return _process_batch(
+        request=request,
+        domain=domain,
+        app_id=app_id,
+        user_id=request.couch_user.get_id,
+        authenticated=True,
+    )
+
+
+@csrf_exempt
+@require_POST
+def batch_post(request, domain, app_id=None):
+    """
+    Accepts several forms from the same device in one multipart request.
+    See couchforms.get_batch_instances_and_attachments for the expected format.
+    """
+    authtype_map = {
+        'digest': _batch_post_digest,
+        'basic': _batch_post_basic,
+    }
+
+    try:
+        decorated_view = authtype_map[determine_authtype(request)]
+    except KeyError:
+        return HttpResponseBadRequest(
+            'authtype must be one of: {0}'.format(','.join(authtype_map.keys()))
+        )
+
+    return decorated_view(request, domain, app_id=app_id)
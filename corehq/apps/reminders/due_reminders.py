@@ -0,0 +1,144 @@
+"""
+Reminders which are scheduled to fire, kept in a redis sorted set scored by next_fire.
+
+Finding the reminders which are due is then a range query on the set rather than a
+scan of the reminders/by_next_fire view. CaseReminder.save keeps the set up to date.
+Reminders saved some other way (e.g. bulk soft deletes) are cleaned up when they
+come due. The set is filled from couch the first time it is read, and again if
+redis ever loses it (see ensure_due_reminders). The rebuild_due_reminders command
+does the same on demand.
+"""
+import calendar
+from datetime import datetime
+from dimagi.utils.chunked import chunked
+from dimagi.utils.couch import release_lock
+from dimagi.utils.couch.cache.cache_core import get_redis_client
+from dimagi.utils.parsing import string_to_datetime
+
+DUE_REMINDERS_KEY = 'reminders-due'
+# set once the set has been filled from couch
+DUE_REMINDERS_BUILT_KEY = 'reminders-due-built'
+DUE_REMINDERS_BATCH_SIZE = 1000
+# how long (in seconds) filling the set from couch may take before another process can try
+DUE_REMINDERS_REBUILD_TIMEOUT = 60 * 60
+
+
+def _get_score(next_fire):
+    return calendar.timegm(next_fire.utctimetuple()) + next_fire.microsecond / 1e6
+
+
+def _from_score(score):
+    return datetime.utcfromtimestamp(score)
+
+
+def is_scheduled(reminder):
+    # matches the reminders/by_next_fire view
+    return (reminder.doc_type == 'CaseReminder' and reminder.active
+            and not reminder.error and reminder.next_fire is not None)
+
+
+def update_due_reminder(reminder, client=None):
+    """
+    Adds the reminder to the set (or moves it) if it is scheduled to fire,
+    otherwise removes it.
+    """
+    client = client or get_redis_client()
+    if is_scheduled(reminder):
+        client.zadd(DUE_REMINDERS_KEY, **{reminder._id: _get_score(reminder.next_fire)})
+    else:
+        client.zrem(DUE_REMINDERS_KEY, reminder._id)
+
+
+def remove_due_reminders(reminder_ids, client=None):
+    if reminder_ids:
+        client = client or get_redis_client()
+        client.zrem(DUE_REMINDERS_KEY, *reminder_ids)
+
+
+def add_due_reminders(entries, client=None):
+    """
+    entries is a list of (reminder_id, next_fire) tuples
+    """
+    if entries:
+        client = client or get_redis_client()
+        client.zadd(DUE_REMINDERS_KEY, **{
+            reminder_id: _get_score(next_fire) for reminder_id, next_fire in entries
+        })
+
+
+def clear_due_reminders(client=None):
+    client = client or get_redis_client()
+    client.delete(DUE_REMINDERS_KEY, DUE_REMINDERS_BUILT_KEY)
+
+
+def rebuild_due_reminders(client=None):
+    """
+    Adds every scheduled reminder in couch to the set. Returns the number added.
+    """
+    from corehq.apps.reminders.models import CaseReminder
+    from corehq.util.couch_helpers import paginate_view
+    client = client or get_redis_client()
+    rows = paginate_view(
+        CaseReminder.get_db(),
+        'reminders/by_next_fire',
+        DUE_REMINDERS_BATCH_SIZE,
+        startkey=[None],
+        endkey=[None, {}],
+        reduce=False,
+        include_docs=False,
+    )
+    count = 0
+    for chunk in chunked(rows, DUE_REMINDERS_BATCH_SIZE):
+        entries = [(row["id"], string_to_datetime(row["key"][1]).replace(tzinfo=None))
+                   for row in chunk if row["key"][1]]
+        add_due_reminders(entries, client=client)
+        count += len(entries)
+    client.set(DUE_REMINDERS_BUILT_KEY, datetime.utcnow().isoformat())
+    return count
+
+
+def ensure_due_reminders(client=None):
+    """
+    Fills the set from couch if that hasn't been done yet, e.g. just after
+    this was deployed or if redis was flushed. Reminders saved in the
+    meantime are already in the set, so it can't be checked for directly.
+    """
+    client = client or get_redis_client()
+    if client.exists(DUE_REMINDERS_BUILT_KEY):
+        return
+    lock = client.lock('reminders-due-rebuild', timeout=DUE_REMINDERS_REBUILD_TIMEOUT)
+    lock.acquire()
+    try:
+        # another process may have filled it while this one waited for the lock
+        if not client.exists(DUE_REMINDERS_BUILT_KEY):
+            rebuild_due_reminders(client=client)
+    finally:
+        release_lock(lock, True)
+
+
+def iter_due_reminders(due_before, batch_size=DUE_REMINDERS_BATCH_SIZE, client=None):
+    """
+    Yields (reminder_id, next_fire) for each reminder with next_fire <= due_before,
+    earliest first.
+
+    The set is paged through by score rather than by offset so that reminders
+    which are fired (and so rescheduled or removed) along the way don't cause
+    others to be skipped.
+    """
+    client = client or get_redis_client()
+    max_score = _get_score(due_before)
+    min_score = '-inf'
+    # ids at min_score which were yielded with the previous batch
+    seen = set()
+    while True:
+        num = batch_size + len(seen)
+        batch = client.zrangebyscore(DUE_REMINDERS_KEY, min_score, max_score,
+                                     start=0, num=num, withscores=True)
+        for reminder_id, score in batch:
+            if reminder_id not in seen:
+                yield reminder_id, _from_score(score)
+
+        if len(batch) < num:
+            return
+        min_score = batch[-1][1]
+        seen = {reminder_id for reminder_id, score in batch if score == min_score}
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from corehq.apps.reminders.due_reminders import rebuild_due_reminders, clear_due_reminders
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    """
+    Usage:
+        python manage.py rebuild_due_reminders
+            - adds every active reminder in couch to the redis set of due reminders
+        python manage.py rebuild_due_reminders --clear
+            - empties the set first, dropping any stale entries
+    """
+    args = ""
+    help = "Rebuilds the redis set of due reminders from the reminders/by_next_fire view"
+    option_list = BaseCommand.option_list + (
+        make_option("--clear",
+                    action="store_true",
+                    dest="clear",
+                    default=False,
+                    help="Empty the set before rebuilding it."),
+    )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            clear_due_reminders()
+
+        count = rebuild_due_reminders()
+        print "Added %s reminders" % count
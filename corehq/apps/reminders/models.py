@@ -14,18 +14,21 @@ from corehq.apps.locations.models import SQLLocation
 from dimagi.utils.parsing import string_to_datetime, json_format_datetime
 from dateutil.parser import parse
 from corehq.apps.reminders.util import enqueue_reminder_directly, get_verified_number_for_recipient
+from corehq.apps.reminders.due_reminders import (iter_due_reminders, is_scheduled,
+    update_due_reminder, remove_due_reminders, ensure_due_reminders)
 from couchdbkit.exceptions import ResourceConflict
 from couchdbkit.resource import ResourceNotFound
 from corehq.apps.sms.util import create_task, close_task, update_task
 from corehq.apps.smsforms.app import submit_unfinished_form
 from corehq.util.timezones.conversions import ServerTime, UserTime
-from dimagi.utils.couch import LockableMixIn, CriticalSection
+from dimagi.utils.couch import LockableMixIn, CriticalSection, release_lock
 from dimagi.utils.couch.cache.cache_core import get_redis_client
 from dimagi.utils.multithreading import process_fast
 from dimagi.utils.logging import notify_exception
 from random import randint
 from django.conf import settings
 from dimagi.utils.couch.database import iter_docs
+from dimagi.utils.chunked import chunked
 
 class IllegalModelStateException(Exception):
     pass
@@ -291,6 +294,13 @@ class CaseReminderEvent(DocumentSchema):
     form_unique_id = StringProperty()
 
 
+def get_rule_update_key(handler_id, case_id):
+    """
+    The lock key held while a handler's reminder for a case is created or updated
+    """
+    return "rule-update-definition-%s-case-%s" % (handler_id, case_id)
+
+
 def run_rule(case_id, handler, schedule_changed, prev_definition):
     case = CommCareCase.get(case_id)
     try:
@@ -590,6 +600,22 @@ class CaseReminderHandler(Document):
             include_docs=True,
         ).one()
 
+    @classmethod
+    def get_reminders_by_handler_and_case(cls, handler_case_pairs):
+        """
+        Looks up the reminders for many (handler, case) pairs with one view query.
+
+        return  a dict of {(handler_id, case_id): CaseReminder}
+        """
+        keys = [[handler.domain, handler._id, case._id] for handler, case in handler_case_pairs]
+        if not keys:
+            return {}
+        result = CaseReminder.view('reminders/by_domain_handler_case',
+            keys=keys,
+            include_docs=True,
+        ).all()
+        return {(reminder.handler_id, reminder.case_id): reminder for reminder in result}
+
     def get_reminders(self, ids_only=False):
         domain = self.domain
         handler_id = self._id
@@ -1000,12 +1026,19 @@ class CaseReminderHandler(Document):
         else:
             return False
 
-    def case_changed(self, case, now=None, schedule_changed=False, prev_definition=None):
-        key = "rule-update-definition-%s-case-%s" % (self._id, case._id)
-        with CriticalSection([key]):
-            self._case_changed(case, now, schedule_changed, prev_definition)
+    def case_changed(self, case, now=None, schedule_changed=False, prev_definition=None,
+                     existing_reminders=None, lock=True):
+        """
+        See _case_changed. Pass lock=False if the caller already holds the
+        get_rule_update_key lock for this handler and case.
+        """
+        if lock:
+            with CriticalSection([get_rule_update_key(self._id, case._id)]):
+                self._case_changed(case, now, schedule_changed, prev_definition, existing_reminders)
+        else:
+            self._case_changed(case, now, schedule_changed, prev_definition, existing_reminders)
 
-    def _case_changed(self, case, now, schedule_changed, prev_definition):
+    def _case_changed(self, case, now, schedule_changed, prev_definition, existing_reminders=None):
         """
         This method is used to manage updates to CaseReminderHandler's whose start_condition_type == CASE_CRITERIA.
         
@@ -1016,11 +1049,20 @@ class CaseReminderHandler(Document):
         
         case    The case that is being updated.
         now     The current date and time to use; if not specified, datetime.utcnow() is used.
+        existing_reminders  Optional result of get_reminders_by_handler_and_case which
+                            includes this handler and case, to save looking up the reminder.
+                            It must have been looked up while holding the
+                            get_rule_update_key lock, so that a missing reminder
+                            doesn't exist.
         
         return  void
         """
         now = now or self.get_now()
-        reminder = self.get_reminder(case)
+        reminder = None
+        if existing_reminders is not None:
+            reminder = existing_reminders.get((self._id, case._id))
+        else:
+            reminder = self.get_reminder(case)
 
         if case and case.user_id and (case.user_id != case._id):
             try:
@@ -1389,26 +1431,49 @@ class CaseReminderHandler(Document):
     @classmethod
     def fire_reminders(cls, now=None):
         now = now or cls.get_now()
-        for reminder in cls.get_all_reminders(due_before=now):
-            if reminder.acquire_lock(now) and now >= reminder.next_fire:
-                handler = reminder.handler
-                if handler.fire(reminder):
-                    handler.set_next_fire(reminder, now)
-                    try:
-                        reminder.save()
-                    except ResourceConflict:
-                        # Submitting a form updates the case, which can update the reminder.
-                        # Grab the latest version of the reminder and set the next fire if it's still in use.
-                        reminder = CaseReminder.get(reminder._id)
-                        if not reminder.retired:
-                            handler.set_next_fire(reminder, now)
-                            reminder.save()
+        client = get_redis_client()
+        ensure_due_reminders(client=client)
+        due_ids = (reminder_id for reminder_id, next_fire in iter_due_reminders(now, client=client))
+        for reminder_ids in chunked(due_ids, 100):
+            locks = {}
+            for reminder_id in reminder_ids:
+                lock = client.lock("fire-reminder-%s" % reminder_id,
+                    timeout=(settings.REMINDERS_QUEUE_PROCESSING_LOCK_TIMEOUT*60))
+                if lock.acquire(blocking=False):
+                    locks[reminder_id] = lock
+
+            try:
+                # load the reminders once they are locked so that they're current
+                reminders = [CaseReminder.wrap(doc)
+                             for doc in iter_docs(CaseReminder.get_db(), locks.keys())]
+                cls._fire_due_reminders(reminders, now)
+                found_ids = {reminder._id for reminder in reminders}
+                remove_due_reminders([reminder_id for reminder_id in locks
+                                      if reminder_id not in found_ids], client=client)
+            finally:
+                for lock in locks.values():
+                    release_lock(lock, True)
+
+    @classmethod
+    def _fire_due_reminders(cls, reminders, now):
+        for reminder in reminders:
+            if not is_scheduled(reminder) or now < reminder.next_fire:
+                # the set is out of date, e.g. the reminder was retired with a bulk save
+                update_due_reminder(reminder)
+                continue
+
+            handler = reminder.handler
+            if handler.fire(reminder):
+                handler.set_next_fire(reminder, now)
                 try:
-                    reminder.release_lock()
+                    reminder.save()
                 except ResourceConflict:
-                    # This should go away once we move the locking to Redis
+                    # Submitting a form updates the case, which can update the reminder.
+                    # Grab the latest version of the reminder and set the next fire if it's still in use.
                     reminder = CaseReminder.get(reminder._id)
-                    reminder.release_lock()
+                    if not reminder.retired:
+                        handler.set_next_fire(reminder, now)
+                        reminder.save()
 
     def retire(self):
         self.doc_type += "-Deleted"
@@ -1529,6 +1594,11 @@ class CaseReminder(SafeSaveDocument, LockableMixIn):
     def save(self, *args, **kwargs):
         self.last_modified = datetime.utcnow()
         super(CaseReminder, self).save(*args, **kwargs)
+        try:
+            update_due_reminder(self)
+        except Exception:
+            # rebuild_due_reminders will pick it up
+            notify_exception(None, message="Could not schedule reminder %s" % self._id)
 
     def retire(self):
         self.doc_type += "-Deleted"
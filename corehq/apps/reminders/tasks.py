@@ -1,13 +1,17 @@
 from datetime import datetime, timedelta
 from celery.task import periodic_task, task
 from corehq.apps.reminders.models import (CaseReminderHandler, CaseReminder,
-    CASE_CRITERIA, REMINDER_TYPE_DEFAULT)
+    CASE_CRITERIA, REMINDER_TYPE_DEFAULT, get_rule_update_key)
+from corehq.apps.reminders.due_reminders import update_due_reminder, remove_due_reminders
+from couchdbkit.exceptions import ResourceConflict
+from couchdbkit.resource import ResourceNotFound
 from django.conf import settings
 from dimagi.utils.logging import notify_exception
 from casexml.apps.case.models import CommCareCase
 from dimagi.utils.chunked import chunked
 from dimagi.utils.couch import CriticalSection
 from dimagi.utils.couch.bulk import soft_delete_docs
+from dimagi.utils.couch.database import iter_docs
 
 # In minutes
 CASE_CHANGED_RETRY_INTERVAL = 5
@@ -21,12 +25,9 @@ if not settings.REMINDERS_QUEUE_ENABLED:
         CaseReminderHandler.fire_reminders()
 
 def get_subcases(case):
-    indices = case.reverse_indices
-    subcases = []
-    for index in indices:
-        if index.identifier == "parent":
-            subcases.append(CommCareCase.get(index.referenced_id))
-    return subcases
+    subcase_ids = [index.referenced_id for index in case.reverse_indices
+                   if index.identifier == "parent"]
+    return [CommCareCase.wrap(doc) for doc in iter_docs(CommCareCase.get_db(), subcase_ids)]
 
 @task(queue=settings.CELERY_REMINDER_CASE_UPDATE_QUEUE, ignore_result=True)
 def case_changed(case_id, handler_ids, retry_num=0):
@@ -48,22 +49,38 @@ def case_changed(case_id, handler_ids, retry_num=0):
 
 
 def _case_changed(case_id, handler_ids):
-    subcases = None
     case = CommCareCase.get(case_id)
-    for handler in CaseReminderHandler.get_handlers_from_ids(handler_ids):
-        if handler.start_condition_type == CASE_CRITERIA:
+    handlers = [handler for handler in CaseReminderHandler.get_handlers_from_ids(handler_ids)
+                if handler.start_condition_type == CASE_CRITERIA]
+    subcases = []
+    if any(handler.uses_parent_case_property for handler in handlers):
+        subcases = get_subcases(case)
+
+    handler_cases = []
+    for handler in handlers:
+        handler_cases.append((handler, case))
+        if handler.uses_parent_case_property:
+            handler_cases.extend((handler, subcase) for subcase in subcases)
+
+    # Holding the locks for every pair means no reminder can be created or updated
+    # by another rule update in the meantime, so one lookup covers them all.
+    keys = [get_rule_update_key(handler._id, c._id) for handler, c in handler_cases]
+    with CriticalSection(keys):
+        existing_reminders = CaseReminderHandler.get_reminders_by_handler_and_case(handler_cases)
+
+        for handler, c in handler_cases:
             kwargs = {}
             if handler.uses_time_case_property:
                 kwargs = {
                     'schedule_changed': True,
                     'prev_definition': handler,
                 }
-            handler.case_changed(case, **kwargs)
-            if handler.uses_parent_case_property:
-                if subcases is None:
-                    subcases = get_subcases(case)
-                for subcase in subcases:
-                    handler.case_changed(subcase, **kwargs)
+            try:
+                handler.case_changed(c, existing_reminders=existing_reminders, lock=False, **kwargs)
+            except ResourceConflict:
+                # The reminder was updated some other way after it was looked up,
+                # so try again with the latest version.
+                handler.case_changed(c, lock=False, **kwargs)
 
 @task(queue=settings.CELERY_REMINDER_RULE_QUEUE, ignore_result=True)
 def process_reminder_rule(handler, schedule_changed, prev_definition,
@@ -89,9 +106,13 @@ def reminder_is_stale(reminder, utcnow):
 
 def _fire_reminder(reminder_id):
     utcnow = datetime.utcnow()
-    reminder = CaseReminder.get(reminder_id)
+    try:
+        reminder = CaseReminder.get(reminder_id)
+    except ResourceNotFound:
+        remove_due_reminders([reminder_id])
+        return
     # This key prevents doc update conflicts with rule running
-    key = "rule-update-definition-%s-case-%s" % (reminder.handler_id, reminder.case_id)
+    key = get_rule_update_key(reminder.handler_id, reminder.case_id)
     with CriticalSection([key],
         timeout=(settings.REMINDERS_QUEUE_PROCESSING_LOCK_TIMEOUT*60)):
         # Refresh the reminder
@@ -106,6 +127,9 @@ def _fire_reminder(reminder_id):
             if handler.fire(reminder):
                 handler.set_next_fire(reminder, utcnow)
                 reminder.save()
+        else:
+            # the set of due reminders is out of date, e.g. the reminder was retired with a bulk save
+            update_due_reminder(reminder)
 
 
 @task(queue='background_queue', ignore_result=True, acks_late=True)
@@ -1,4 +1,5 @@
 from django.test import TestCase
+from mock import patch
 from casexml.apps.case.sharedmodels import CommCareCaseIndex
 from corehq.apps.accounting.models import (
     BillingAccount,
@@ -10,14 +11,16 @@ from corehq.apps.accounting.models import (
 from corehq.apps.accounting.tests import BaseAccountingTest
 from corehq.apps.reminders.models import *
 from corehq.apps.reminders.event_handlers import get_message_template_params
+from corehq.apps.reminders.tasks import _case_changed
 from corehq.apps.users.models import CommCareUser
 from corehq.apps.sms.models import CallLog, ExpectedCallbackEventLog, CALLBACK_RECEIVED, CALLBACK_PENDING, CALLBACK_MISSED
 from corehq.apps.sms.mixin import BackendMapping
 from corehq.messaging.smsbackends.test.api import TestSMSBackend
 from dimagi.utils.parsing import json_format_datetime
-from dimagi.utils.couch import LOCK_EXPIRATION
+from dimagi.utils.couch import LOCK_EXPIRATION, CriticalSection
 from corehq.apps.domain.models import Domain
 from corehq.apps.reminders.tests.test_util import *
+from corehq.apps.reminders.tests.test_due_reminders import *
 
 
 class BaseReminderTestCase(BaseAccountingTest):
@@ -170,6 +173,92 @@ class ReminderTestCase(BaseReminderTestCase):
         self.assertEqual(reminder.active, False)
 
 
+class BatchedCaseChangedTestCase(BaseReminderTestCase):
+    """
+    Tests case_changed when the reminders are looked up up front for many handlers.
+    """
+    def setUp(self):
+        super(BatchedCaseChangedTestCase, self).setUp()
+        self.domain = "test"
+        self.case_type = "my_case_type"
+        self.handler = CaseReminderHandler(
+            domain=self.domain,
+            case_type=self.case_type,
+            method=METHOD_SMS,
+            start_property='start_sending',
+            start_value="ok",
+            start_date=None,
+            start_offset=1,
+            start_match_type=MATCH_EXACT,
+            default_lang='en',
+            max_iteration_count=REPEAT_SCHEDULE_INDEFINITELY,
+            schedule_length=3,
+            event_interpretation=EVENT_AS_OFFSET,
+            events=[
+                CaseReminderEvent(
+                    day_num=0,
+                    fire_time=time(0, 0, 0),
+                    message={"en": "Hello"},
+                    callback_timeout_intervals=[],
+                )
+            ]
+        )
+        self.handler.save()
+        self.user_id = "USER-ID-109348"
+        self.user = CommCareUser.create(self.domain, 'chw.batched', '****', uuid=self.user_id,
+                                        phone_number="99912346")
+        self.case = CommCareCase(
+            domain=self.domain,
+            type=self.case_type,
+            user_id=self.user_id,
+        )
+        self.case.set_case_property('start_sending', 'ok')
+        self.case.save()
+        CaseReminderHandler.now = datetime(year=2011, month=7, day=7, hour=19, minute=8)
+
+    def tearDown(self):
+        for reminder in self.handler.get_reminders():
+            reminder.delete()
+        self.handler.delete()
+        self.user.delete()
+        super(BatchedCaseChangedTestCase, self).tearDown()
+
+    def test_get_reminders_by_handler_and_case(self):
+        self.handler.case_changed(self.case)
+        reminder = self.handler.get_reminder(self.case)
+        self.assertNotEqual(reminder, None)
+        self.assertEqual(
+            CaseReminderHandler.get_reminders_by_handler_and_case([(self.handler, self.case)]),
+            {(self.handler._id, self.case._id): reminder}
+        )
+
+    def test_existing_reminders_are_not_looked_up_again(self):
+        existing_reminders = CaseReminderHandler.get_reminders_by_handler_and_case(
+            [(self.handler, self.case)])
+        with patch.object(CaseReminderHandler, 'get_reminder') as get_reminder:
+            self.handler.case_changed(self.case, existing_reminders=existing_reminders)
+        self.assertFalse(get_reminder.called)
+        self.assertEqual(len(self.handler.get_reminders()), 1)
+
+    def test_tasks_case_changed_locks_before_lookup(self):
+        with patch('corehq.apps.reminders.tasks.CriticalSection', wraps=CriticalSection) as critical_section, \
+                patch.object(CaseReminderHandler, 'get_reminder') as get_reminder:
+            _case_changed(self.case._id, [self.handler._id])
+        critical_section.assert_called_once_with([get_rule_update_key(self.handler._id, self.case._id)])
+        self.assertFalse(get_reminder.called)
+        self.assertEqual(len(self.handler.get_reminders()), 1)
+
+    def test_tasks_case_changed(self):
+        _case_changed(self.case._id, [self.handler._id])
+        reminder = self.handler.get_reminder(self.case)
+        self.assertNotEqual(reminder, None)
+        self.assertEqual(reminder.next_fire,
+                         CaseReminderHandler.now + timedelta(days=self.handler.start_offset))
+
+        _case_changed(self.case._id, [self.handler._id])
+        self.assertEqual(len(self.handler.get_reminders()), 1)
+
+
 class ReminderIrregularScheduleTestCase(BaseReminderTestCase):
     """
     This use case represents an irregular reminder schedule which is repeated twice:
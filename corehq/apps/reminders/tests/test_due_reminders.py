@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from django.test import SimpleTestCase
+from mock import patch
+from corehq.apps.reminders.due_reminders import (add_due_reminders, iter_due_reminders,
+    remove_due_reminders, ensure_due_reminders, clear_due_reminders, DUE_REMINDERS_KEY,
+    DUE_REMINDERS_BUILT_KEY)
+
+
+class FakeSortedSetClient(object):
+    """
+    Just enough of a redis client for the sorted set commands used by due_reminders
+    """
+
+    def __init__(self):
+        self.sets = {}
+        self.values = {}
+
+    def exists(self, name):
+        return name in self.sets or name in self.values
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def delete(self, *names):
+        for name in names:
+            self.sets.pop(name, None)
+            self.values.pop(name, None)
+
+    def lock(self, name, timeout=None):
+        return FakeLock()
+
+    def zadd(self, name, **mapping):
+        self.sets.setdefault(name, {}).update(mapping)
+
+    def zrem(self, name, *values):
+        for value in values:
+            self.sets.get(name, {}).pop(value, None)
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        min = float(min)
+        items = sorted(
+            ((value, score) for value, score in self.sets.get(name, {}).items()
+             if min <= score <= max),
+            key=lambda item: (item[1], item[0])
+        )
+        items = items[start:start + num]
+        return items if withscores else [value for value, score in items]
+
+
+class FakeLock(object):
+
+    def acquire(self, blocking=True):
+        return True
+
+    def release(self):
+        pass
+
+
+class DueRemindersTest(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeSortedSetClient()
+        self.start = datetime(2015, 6, 1, 12, 0)
+
+    def _iter_ids(self, due_before, batch_size):
+        return [reminder_id for reminder_id, next_fire in
+                iter_due_reminders(due_before, batch_size=batch_size, client=self.client)]
+
+    def test_only_due(self):
+        add_due_reminders([
+            ('a', self.start),
+            ('b', self.start + timedelta(minutes=1)),
+            ('c', self.start + timedelta(minutes=2)),
+        ], client=self.client)
+        self.assertEqual(self._iter_ids(self.start + timedelta(minutes=1), 10), ['a', 'b'])
+
+    def test_next_fire(self):
+        next_fire = self.start + timedelta(seconds=30)
+        add_due_reminders([('a', next_fire)], client=self.client)
+        self.assertEqual(list(iter_due_reminders(next_fire, client=self.client)), [('a', next_fire)])
+
+    def test_batches_with_same_score(self):
+        ids = ['r%02d' % i for i in range(25)]
+        add_due_reminders([(reminder_id, self.start + timedelta(minutes=i // 10))
+                           for i, reminder_id in enumerate(ids)], client=self.client)
+        self.assertEqual(self._iter_ids(self.start + timedelta(hours=1), 4), ids)
+
+    def test_removed_while_iterating(self):
+        ids = ['r%02d' % i for i in range(10)]
+        add_due_reminders([(reminder_id, self.start + timedelta(minutes=i))
+                           for i, reminder_id in enumerate(ids)], client=self.client)
+        found = []
+        for reminder_id, next_fire in iter_due_reminders(self.start + timedelta(hours=1),
+                                                         batch_size=3, client=self.client):
+            found.append(reminder_id)
+            remove_due_reminders([reminder_id], client=self.client)
+        self.assertEqual(found, ids)
+        self.assertEqual(self.client.sets[DUE_REMINDERS_KEY], {})
+
+    @patch('corehq.apps.reminders.due_reminders.rebuild_due_reminders')
+    def test_ensure_due_reminders(self, rebuild):
+        rebuild.side_effect = lambda client: client.set(DUE_REMINDERS_BUILT_KEY, 'built')
+        # a reminder saved before the set was ever filled
+        add_due_reminders([('a', self.start)], client=self.client)
+        ensure_due_reminders(client=self.client)
+        self.assertEqual(rebuild.call_count, 1)
+        ensure_due_reminders(client=self.client)
+        self.assertEqual(rebuild.call_count, 1)
+
+        # e.g. redis was flushed
+        clear_due_reminders(client=self.client)
+        ensure_due_reminders(client=self.client)
+        self.assertEqual(rebuild.call_count, 2)
@@ -8,7 +8,7 @@ from corehq.apps.reports.models import FormExportSchema
 from corehq.elastic import stream_es_query
 from corehq.pillows.mappings.xform_mapping import XFORM_INDEX
 import couchexport
-from couchexport.export import get_headers, get_writer, export_raw, get_formatted_rows
+from couchexport.export import get_headers, get_writer, export_raw, SchemaFlattener
 from couchexport.models import DefaultExportSchema, Format, SavedExportSchema
 from couchexport.util import SerializableFunction
 
@@ -57,11 +57,12 @@ class BulkExport(object):
 
             # now that the headers are set, lets build the rows
             for i, config in enumerate(configs):
+                flattener = SchemaFlattener(schemas[i])
                 for doc in config.get_docs():
                     if self.export_objects[i].transform:
                         doc = self.export_objects[i].transform(doc)
-                    table = get_formatted_rows(
-                        doc, schemas[i], separator=self.separator,
+                    table = flattener.get_formatted_rows(
+                        doc, separator=self.separator,
                         include_headers=isinstance(self, CustomBulkExport))
                     if isinstance(self, CustomBulkExport):
                         table = self.export_objects[i].trim(table, doc)
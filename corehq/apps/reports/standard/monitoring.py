@@ -2,6 +2,7 @@ from collections import defaultdict
 import datetime
 from urllib import urlencode
 import math
+from django.db import connection
 from django.db.models.aggregates import Max, Min, Avg, StdDev, Count
 import operator
 from corehq.apps.es import filters
@@ -141,45 +142,24 @@ class CaseActivityReport(WorkerMonitoringCaseReportTableBase):
                        "We are working to correct this shortly.")
 
     class Row(object):
-        def __init__(self, report, user):
+        def __init__(self, report, user, case_counts):
             self.report = report
             self.user = user
+            self.case_counts = case_counts
 
-        @memoized
         def active_count(self):
             """Open clients seen in the last 120 days"""
-            return self.report.get_number_cases(
-                user_id=self.user.user_id,
-                modified_after=self.report.utc_now - self.report.milestone,
-                modified_before=self.report.utc_now,
-                closed=False,
-            )
+            return self.case_counts['active']
 
-        @memoized
         def inactive_count(self):
             """Open clients not seen in the last 120 days"""
-            return self.report.get_number_cases(
-                user_id=self.user.user_id,
-                modified_before=self.report.utc_now - self.report.milestone,
-                closed=False,
-            )
+            return self.case_counts['inactive']
 
-        def modified_count(self, startdate=None, enddate=None):
-            enddate = enddate or self.report.utc_now
-            return self.report.get_number_cases(
-                user_id=self.user.user_id,
-                modified_after=startdate,
-                modified_before=enddate,
-            )
+        def modified_count(self, landmark):
+            return self.case_counts[('modified', landmark)]
 
-        def closed_count(self, startdate=None, enddate=None):
-            enddate = enddate or self.report.utc_now
-            return self.report.get_number_cases(
-                user_id=self.user.user_id,
-                modified_after=startdate,
-                modified_before=enddate,
-                closed=True
-            )
+        def closed_count(self, landmark):
+            return self.case_counts[('closed', landmark)]
 
         def header(self):
             return self.report.get_user_link(self.user)
@@ -195,11 +175,11 @@ class CaseActivityReport(WorkerMonitoringCaseReportTableBase):
         def inactive_count(self):
             return sum([row.inactive_count() for row in self.rows])
 
-        def modified_count(self, startdate=None, enddate=None):
-            return sum([row.modified_count(startdate, enddate) for row in self.rows])
+        def modified_count(self, landmark):
+            return sum([row.modified_count(landmark) for row in self.rows])
 
-        def closed_count(self, startdate=None, enddate=None):
-            return sum([row.closed_count(startdate, enddate) for row in self.rows])
+        def closed_count(self, landmark):
+            return sum([row.closed_count(landmark) for row in self.rows])
 
         def header(self):
             return self._header
@@ -272,7 +252,9 @@ class CaseActivityReport(WorkerMonitoringCaseReportTableBase):
     def rows(self):
         users_data = EMWF.pull_users_and_groups(
             self.domain, self.request, True, True)
-        rows = [self.Row(self, user) for user in users_data.combined_users]
+        users = users_data.combined_users
+        case_counts = self.get_case_counts([user.user_id for user in users])
+        rows = [self.Row(self, user, case_counts[user.user_id]) for user in users]
 
         total_row = self.TotalRow(rows, _("All Users"))
 
@@ -288,9 +270,9 @@ class CaseActivityReport(WorkerMonitoringCaseReportTableBase):
                 cells.append(util.format_datatables_data(text=text, sort_key=value))
 
             for landmark in self.landmarks:
-                value = row.modified_count(self.utc_now - landmark)
+                value = row.modified_count(landmark)
                 active = row.active_count()
-                closed = row.closed_count(self.utc_now - landmark)
+                closed = row.closed_count(landmark)
                 total = active + closed
 
                 try:
@@ -311,23 +293,58 @@ class CaseActivityReport(WorkerMonitoringCaseReportTableBase):
         self.total_row = format_row(total_row)
         return map(format_row, rows)
 
-    def get_number_cases(self, user_id, modified_after=None, modified_before=None, closed=None):
-        kwargs = {}
-        if closed is not None:
-            kwargs['closed'] = bool(closed)
-        if modified_after:
-            kwargs['modified_on__gte'] = ServerTime(modified_after).phone_time(self.timezone).done()
-        if modified_before:
-            kwargs['modified_on__lt'] = ServerTime(modified_before).phone_time(self.timezone).done()
-        if self.case_type:
-            kwargs['type'] = self.case_type
+    def get_case_counts(self, user_ids):
+        """
+        Counts every bucket in the report for all the users with a single grouped query.
+        Returns a dict of user ID to a dict of counts, keyed by 'active', 'inactive',
+        and ('modified', landmark) and ('closed', landmark) for each landmark.
+        """
+        def _phone_time(server_time):
+            return ServerTime(server_time).phone_time(self.timezone).done()
+
+        now = _phone_time(self.utc_now)
+        milestone_start = _phone_time(self.utc_now - self.milestone)
+        columns = [
+            ('active', 'closed = false AND modified_on >= %s AND modified_on < %s', [milestone_start, now]),
+            ('inactive', 'closed = false AND modified_on < %s', [milestone_start]),
+        ]
+        for landmark in self.landmarks:
+            landmark_start = _phone_time(self.utc_now - landmark)
+            columns.extend([
+                (('modified', landmark), 'modified_on >= %s AND modified_on < %s', [landmark_start, now]),
+                (('closed', landmark), 'closed = true AND modified_on >= %s AND modified_on < %s',
+                 [landmark_start, now]),
+            ])
 
-        qs = CaseData.objects.filter(
-            domain=self.domain,
-            user_id=user_id,
-            **kwargs
+        case_counts = defaultdict(lambda: {key: 0 for key, _, _ in columns})
+        user_ids = [user_id for user_id in user_ids if user_id]
+        if not user_ids:
+            return case_counts
+
+        params = [param for _, _, column_params in columns for param in column_params]
+        where = 'domain = %s AND user_id IN %s'
+        params.extend([self.domain, tuple(user_ids)])
+        if self.case_type:
+            where += ' AND type = %s'
+            params.append(self.case_type)
+
+        sql = 'SELECT user_id, {columns} FROM {table} WHERE {where} GROUP BY user_id'.format(
+            columns=', '.join(
+                'SUM(CASE WHEN {} THEN 1 ELSE 0 END)'.format(condition) for _, condition, _ in columns
+            ),
+            table=CaseData._meta.db_table,
+            where=where,
         )
-        return qs.count()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            for row in cursor.fetchall():
+                case_counts[row[0]] = {
+                    key: int(count or 0) for (key, _, _), count in zip(columns, row[1:])
+                }
+        finally:
+            cursor.close()
+        return case_counts
 
 
 class SubmissionsByFormReport(WorkerMonitoringFormReportTableBase,
@@ -1,4 +1,5 @@
 try:
+    from .test_case_activity import *
     from .test_case_export import *
     from .test_cache import *
     from .test_data_sources import *
@@ -9,6 +10,7 @@ try:
     from .test_filters import *
     from .test_ledgers_by_location import *
     from .test_pillows_cases import *
+    from .test_pillows_export_schema import *
     from .test_pillows_xforms import *
     from .test_readable_formdata import *
     from .test_report_api import *
@@ -0,0 +1,116 @@
+import datetime
+from uuid import uuid4
+
+import pytz
+from django.test import TestCase
+
+from corehq.apps.reports.standard.monitoring import CaseActivityReport
+from corehq.apps.sofabed.models import CaseData
+from corehq.util.timezones.conversions import ServerTime
+
+DOMAIN = 'case-activity-test'
+NOW = datetime.datetime(2015, 6, 15, 12, 0)
+
+
+class CaseActivityReportForTest(CaseActivityReport):
+    """
+    Just the parts of the report that get_case_counts uses
+    """
+    timezone = pytz.timezone('Africa/Nairobi')
+    utc_now = NOW
+    milestone = datetime.timedelta(days=120)
+    landmarks = [datetime.timedelta(days=30), datetime.timedelta(days=60)]
+
+    def __init__(self, case_type):
+        self.domain = DOMAIN
+        self._case_type = case_type
+
+    @property
+    def case_type(self):
+        return self._case_type
+
+
+class CaseActivityCountsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        report = CaseActivityReportForTest('')
+
+        def _phone_time(days_ago, seconds=0):
+            server_time = NOW - datetime.timedelta(days=days_ago) + datetime.timedelta(seconds=seconds)
+            return ServerTime(server_time).phone_time(report.timezone).done()
+
+        # on and either side of now, the landmarks and the milestone
+        modified_dates = [_phone_time(days, seconds)
+                          for days in (0, 30, 60, 120) for seconds in (-1, 0, 1)]
+        modified_dates.append(_phone_time(10))
+        for user_id in ('user1', 'user2', None):
+            for modified_on in modified_dates:
+                for closed in (True, False):
+                    for case_type in ('a', 'b'):
+                        CaseData.objects.create(
+                            case_id=uuid4().hex,
+                            domain=DOMAIN,
+                            type=case_type,
+                            closed=closed,
+                            user_id=user_id,
+                            modified_on=modified_on,
+                        )
+        # a case in another domain
+        CaseData.objects.create(
+            case_id=uuid4().hex,
+            domain='other-domain',
+            type='a',
+            user_id='user1',
+            modified_on=_phone_time(10),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        CaseData.objects.filter(domain__in=[DOMAIN, 'other-domain']).delete()
+
+    def _count(self, report, user_id, modified_after=None, modified_before=None, closed=None):
+        # the per-bucket count the report made before get_case_counts
+        kwargs = {}
+        if closed is not None:
+            kwargs['closed'] = bool(closed)
+        if modified_after:
+            kwargs['modified_on__gte'] = ServerTime(modified_after).phone_time(report.timezone).done()
+        if modified_before:
+            kwargs['modified_on__lt'] = ServerTime(modified_before).phone_time(report.timezone).done()
+        if report.case_type:
+            kwargs['type'] = report.case_type
+        return CaseData.objects.filter(domain=DOMAIN, user_id=user_id, **kwargs).count()
+
+    def _expected_counts(self, report, user_id):
+        now = report.utc_now
+        expected = {
+            'active': self._count(report, user_id, modified_after=now - report.milestone,
+                                  modified_before=now, closed=False),
+            'inactive': self._count(report, user_id, modified_before=now - report.milestone, closed=False),
+        }
+        for landmark in report.landmarks:
+            expected[('modified', landmark)] = self._count(
+                report, user_id, modified_after=now - landmark, modified_before=now)
+            expected[('closed', landmark)] = self._count(
+                report, user_id, modified_after=now - landmark, modified_before=now, closed=True)
+        return expected
+
+    def _test_case_counts(self, case_type):
+        report = CaseActivityReportForTest(case_type)
+        case_counts = report.get_case_counts(['user1', 'user2', 'user3'])
+        for user_id in ('user1', 'user2', 'user3'):
+            self.assertEqual(case_counts[user_id], self._expected_counts(report, user_id))
+        # make sure there is something to compare
+        self.assertTrue(all(case_counts['user1'].values()))
+        self.assertFalse(any(case_counts['user3'].values()))
+
+    def test_case_counts(self):
+        self._test_case_counts('')
+
+    def test_case_counts_by_case_type(self):
+        self._test_case_counts('a')
+
+    def test_no_users(self):
+        report = CaseActivityReportForTest('')
+        self.assertEqual(report.get_case_counts([]), {})
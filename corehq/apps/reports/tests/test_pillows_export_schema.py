@@ -0,0 +1,53 @@
+from django.test import TestCase
+from mock import patch
+from corehq.pillows.export_schema import ExportSchemaPillow, SCHEMA_CHECKPOINT_INTERVAL
+
+
+@patch('corehq.pillows.export_schema.update_schema_checkpoint')
+class ExportSchemaPillowTest(TestCase):
+
+    def setUp(self):
+        self.pillow = ExportSchemaPillow()
+
+    def _checkpointed_indices(self, update_schema_checkpoint):
+        indices = sorted(args[1] for args, kwargs in update_schema_checkpoint.call_args_list)
+        update_schema_checkpoint.reset_mock()
+        return indices
+
+    def _make_due(self):
+        self.pillow.last_checkpointed -= SCHEMA_CHECKPOINT_INTERVAL + 1
+
+    def test_checkpoint_interval(self, update_schema_checkpoint):
+        self.pillow.change_transport(['domain', 'x'])
+        self.assertEqual([], self._checkpointed_indices(update_schema_checkpoint))
+
+        self._make_due()
+        self.pillow.change_transport(['domain', 'y'])
+        self.pillow.change_transport(['domain', 'y'])
+        self.assertEqual([['domain', 'x'], ['domain', 'y']],
+                         self._checkpointed_indices(update_schema_checkpoint))
+
+        self.pillow.change_transport(['domain', 'x'])
+        self.assertEqual([], self._checkpointed_indices(update_schema_checkpoint))
+        self.pillow.checkpoint_schemas(force=True)
+        self.assertEqual([['domain', 'x']], self._checkpointed_indices(update_schema_checkpoint))
+
+    def test_checkpoint_without_new_changes(self, update_schema_checkpoint):
+        # what the timer thread does once the changes feed goes quiet
+        self.pillow.change_transport(['domain', 'x'])
+        self.pillow.checkpoint_schemas()
+        self.assertEqual([], self._checkpointed_indices(update_schema_checkpoint))
+        self._make_due()
+        self.pillow.checkpoint_schemas()
+        self.assertEqual([['domain', 'x']], self._checkpointed_indices(update_schema_checkpoint))
+        self._make_due()
+        self.pillow.checkpoint_schemas()
+        self.assertEqual([], self._checkpointed_indices(update_schema_checkpoint))
+
+    def test_errors_are_logged(self, update_schema_checkpoint):
+        update_schema_checkpoint.side_effect = Exception('boom')
+        self.pillow.change_transport(['domain', 'x'])
+        self.pillow.change_transport(['domain', 'y'])
+        self.pillow.checkpoint_schemas(force=True)
+        self.assertEqual([['domain', 'x'], ['domain', 'y']],
+                         self._checkpointed_indices(update_schema_checkpoint))
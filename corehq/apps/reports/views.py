@@ -409,6 +409,8 @@ def _export_default_or_custom_data(request, domain, export_id=None, bulk_export=
             previous_export_id=previous_export_id,
             format=format,
             max_column_size=max_column_size,
+            # only custom exports can be built in parallel
+            parallel=bool(export_id) and toggles.PARALLEL_EXPORTS.enabled(domain),
         )
     else:
         if not next:
@@ -1,3 +1,4 @@
+from optparse import make_option
 from django.core.management.base import LabelCommand, CommandError
 from corehq.apps.userreports import tasks
 
@@ -7,9 +8,20 @@ class Command(LabelCommand):
     args = '<indicator_config_id>'
     label = ""
 
+    option_list = LabelCommand.option_list + (
+        make_option('--resume',
+                    action='store_true',
+                    dest='resume',
+                    default=False,
+                    help="Only build the chunks an interrupted rebuild didn't finish"),
+    )
+
     def handle(self, *args, **options):
         if len(args) < 1:
             raise CommandError('Usage is rebuild_indicator_table %s' % self.args)
 
         config_id = args[0]
-        tasks.rebuild_indicators(config_id)
+        if options['resume']:
+            tasks.resume_building_indicators(config_id)
+        else:
+            tasks.rebuild_indicators(config_id)
@@ -6,6 +6,7 @@ from dimagi.ext.couchdbkit import (
     DateTimeProperty,
     Document,
     DocumentSchema,
+    SchemaListProperty,
     SchemaProperty,
     StringListProperty,
 )
@@ -36,6 +37,16 @@ from dimagi.utils.mixins import UnicodeMixIn
 from django.conf import settings
 
 
+class DataSourceBuildChunk(DocumentSchema):
+    """
+    A range of doc IDs that is built by a single task during a rebuild. Finished
+    chunks are skipped when an interrupted rebuild is resumed.
+    """
+    start_id = StringProperty()
+    end_id = StringProperty()
+    finished = BooleanProperty(default=False)
+
+
 class DataSourceBuildInformation(DocumentSchema):
     """
     A class to encapsulate meta information about the process through which
@@ -51,12 +62,44 @@ class DataSourceBuildInformation(DocumentSchema):
     finished = BooleanProperty(default=False)
     # Start time of the most recent build SQL table celery task.
     initiated = DateTimeProperty()
+    # The chunks of docs that make up the most recent build.
+    chunks = SchemaListProperty(DataSourceBuildChunk)
 
 
 class DataSourceMeta(DocumentSchema):
     build = SchemaProperty(DataSourceBuildInformation)
 
 
+def _get_required_property_value(filter_spec, property_name, named_filters):
+    if not filter_spec:
+        return None
+
+    value = None
+    filter_type = filter_spec.get('type')
+    if filter_type == 'and':
+        values = {
+            _get_required_property_value(spec, property_name, named_filters)
+            for spec in filter_spec.get('filters') or []
+        } - {None}
+        # conflicting values can never match anything so don't bother indexing on them
+        if len(values) == 1:
+            value = values.pop()
+    elif filter_type == 'named':
+        value = _get_required_property_value(named_filters.get(filter_spec.get('name')),
+                                             property_name, named_filters)
+    elif filter_type == 'property_match':
+        if filter_spec.get('property_name') == property_name and not filter_spec.get('property_path'):
+            value = filter_spec.get('property_value')
+    elif filter_type == 'boolean_expression':
+        expression = filter_spec.get('expression') or {}
+        if (filter_spec.get('operator') == 'eq'
+                and expression.get('type') == 'property_name'
+                and expression.get('property_name') == property_name
+                and not expression.get('datatype')):
+            value = filter_spec.get('property_value')
+    return value if isinstance(value, basestring) else None
+
+
 class DataSourceConfiguration(UnicodeMixIn, CachedCouchDocumentMixin, Document):
     """
     A data source configuration. These map 1:1 with database tables that get created.
@@ -133,6 +176,14 @@ class DataSourceConfiguration(UnicodeMixIn, CachedCouchDocumentMixin, Document):
             'property_value': self.domain,
         }
 
+    def get_required_property_value(self, property_name):
+        """
+        If the configured filter only matches docs with a specific value for the
+        (top-level) property, e.g. the xmlns of a form or the type of a case,
+        returns that value. Otherwise returns None.
+        """
+        return _get_required_property_value(self.configured_filter, property_name, self.named_filters)
+
     @property
     @memoized
     def named_filter_objects(self):
@@ -1,4 +1,6 @@
 from collections import defaultdict
+import logging
+import time
 from alembic.autogenerate.api import compare_metadata
 from datetime import datetime, timedelta
 from casexml.apps.case.models import CommCareCase
@@ -7,6 +9,7 @@ from corehq.apps.userreports.models import DataSourceConfiguration, StaticDataSo
 from corehq.apps.userreports.sql import IndicatorSqlAdapter, metadata
 from corehq.apps.userreports.tasks import rebuild_indicators
 from corehq.db import connection_manager
+from corehq.pillows.utils import get_deleted_doc_types
 from dimagi.utils.logging import notify_error
 from fluff.signals import get_migration_context, get_tables_to_rebuild
 from pillowtop.couchdb import CachedCouchDB
@@ -15,6 +18,13 @@ from pillowtop.listener import PythonPillow
 
 REBUILD_CHECK_INTERVAL = 10 * 60  # in seconds
 
+pillow_logging = logging.getLogger("pillowtop")
+
+
+def _empty_timings():
+    # per data source stats on how long the pillow spends on it
+    return defaultdict(lambda: {'checked': 0, 'saved': 0, 'filter_seconds': 0., 'save_seconds': 0.})
+
 
 class ConfigurableIndicatorPillow(PythonPillow):
 
@@ -25,6 +35,7 @@ class ConfigurableIndicatorPillow(PythonPillow):
         super(ConfigurableIndicatorPillow, self).__init__(couch_db=couch_db)
         self.bootstrapped = False
         self.last_bootstrapped = datetime.utcnow()
+        self.timings = _empty_timings()
 
     def get_all_configs(self):
         return DataSourceConfiguration.all()
@@ -50,6 +61,8 @@ class ConfigurableIndicatorPillow(PythonPillow):
 
         self.table_adapters = [IndicatorSqlAdapter(config) for config in configs]
         self.rebuild_tables_if_necessary()
+        self._log_timings()
+        self.adapter_index = AdapterIndex(self.table_adapters)
         self.bootstrapped = True
         self.last_bootstrapped = datetime.utcnow()
 
@@ -93,17 +106,94 @@ class ConfigurableIndicatorPillow(PythonPillow):
         return super(ConfigurableIndicatorPillow, self).change_trigger(changes_dict)
 
     def change_transport(self, doc):
-        for table in self.table_adapters:
-            if table.config.filter(doc):
+        for table, is_deletion in self.adapter_index.get_candidates(doc):
+            start = time.time()
+            if not is_deletion and table.config.filter(doc):
+                filtered = time.time()
                 table.save(doc)
-            elif table.config.deleted_filter(doc):
+            elif is_deletion and table.config.deleted_filter(doc):
+                filtered = time.time()
                 table.delete(doc)
+            else:
+                filtered = None
+            self._record_timing(table.config, start, filtered)
+
+    def _record_timing(self, config, start, filtered):
+        timing = self.timings[config._id]
+        if filtered is None:
+            timing['filter_seconds'] += time.time() - start
+        else:
+            timing['filter_seconds'] += filtered - start
+            timing['save_seconds'] += time.time() - filtered
+            timing['saved'] += 1
+        timing['checked'] += 1
+
+    def _log_timings(self):
+        for config_id, timing in sorted(self.timings.items(),
+                                        key=lambda item: -(item[1]['filter_seconds'] + item[1]['save_seconds'])):
+            pillow_logging.info(
+                '[{}] data source {}: {checked} docs checked in {filter_seconds:.2f}s, '
+                '{saved} saved in {save_seconds:.2f}s'.format(self.__class__.__name__, config_id, **timing)
+            )
+        self.timings = _empty_timings()
 
     def set_checkpoint(self, change):
         # override this to rebootstrap the tables
         super(ConfigurableIndicatorPillow, self).set_checkpoint(change)
 
 
+class AdapterIndex(object):
+    """
+    Index of table adapters by the docs they can possibly match, so that each change
+    is only run through the filters of data sources that might want it.
+
+    Adapters are keyed by (domain, doc_type), including the deleted doc types, and
+    where the data source filter requires a specific xmlns or case type, by that too.
+    """
+    indexed_properties = {
+        'XFormInstance': 'xmlns',
+        'CommCareCase': 'type',
+    }
+
+    def __init__(self, table_adapters):
+        # (domain, doc_type) -> (property name, {value: [(adapter, is_deletion)]}, [(adapter, is_deletion)])
+        self._index = {}
+        for adapter in table_adapters:
+            config = adapter.config
+            property_name = self.indexed_properties.get(config.referenced_doc_type)
+            value = config.get_required_property_value(property_name) if property_name else None
+            self._add(config.domain, config.referenced_doc_type, property_name, value, (adapter, False))
+            for doc_type in get_deleted_doc_types(config.referenced_doc_type):
+                self._add(config.domain, doc_type, property_name, value, (adapter, True))
+
+    def _add(self, domain, doc_type, property_name, value, candidate):
+        _, by_value, unindexed = self._index.setdefault(
+            (domain, doc_type), (property_name, defaultdict(list), [])
+        )
+        if value is None:
+            unindexed.append(candidate)
+        else:
+            by_value[value].append(candidate)
+
+    def get_candidates(self, doc):
+        """
+        Returns a list of (adapter, is_deletion) tuples for the data sources the doc
+        could belong to.
+        """
+        domain = doc.get('domain')
+        doc_type = doc.get('doc_type')
+        if not isinstance(domain, basestring) or not isinstance(doc_type, basestring):
+            return []
+        try:
+            property_name, by_value, unindexed = self._index[(domain, doc_type)]
+        except KeyError:
+            return []
+        value = doc.get(property_name) if property_name else None
+        if isinstance(value, basestring) and value in by_value:
+            return unindexed + by_value[value]
+        return unindexed
+
+
 class StaticDataSourcePillow(ConfigurableIndicatorPillow):
 
     def get_all_configs(self):
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import sqlalchemy
 from sqlalchemy.exc import IntegrityError, ProgrammingError
 from corehq.apps.userreports.exceptions import TableRebuildError
@@ -5,10 +6,13 @@ from corehq.apps.userreports.sql.columns import column_to_sql
 from corehq.apps.userreports.sql.connection import get_engine_id
 from corehq.apps.userreports.sql.util import get_table_name
 from corehq.db import connection_manager
+from dimagi.utils.chunked import chunked
 from dimagi.utils.decorators.memoized import memoized
 
 
 metadata = sqlalchemy.MetaData()
+# the most rows inserted by one INSERT statement
+INSERT_BATCH_SIZE = 1000
 
 
 class IndicatorSqlAdapter(object):
@@ -43,22 +47,39 @@ class IndicatorSqlAdapter(object):
         return self.session_helper.Session.query(self.get_table())
 
     def save(self, doc):
-        indicator_rows = self.config.get_all_values(doc)
-        if indicator_rows:
-            table = self.get_table()
-            with self.engine.begin() as connection:
-                # delete all existing rows for this doc to ensure we aren't left with stale data
-                delete = table.delete(table.c.doc_id == doc['_id'])
-                connection.execute(delete)
-                for indicator_row in indicator_rows:
-                    all_values = {i.column.database_column_name: i.value for i in indicator_row}
-                    insert = table.insert().values(**all_values)
+        self.bulk_save([doc])
+
+    def bulk_save(self, docs):
+        """
+        Saves the indicator rows for all of the docs in one transaction, with a
+        single DELETE and a single multi-row INSERT.
+        """
+        rows_by_doc_id = OrderedDict()
+        for doc in docs:
+            indicator_rows = self.config.get_all_values(doc)
+            if indicator_rows:
+                rows_by_doc_id[doc['_id']] = [
+                    {i.column.database_column_name: i.value for i in indicator_row}
+                    for indicator_row in indicator_rows
+                ]
+        if not rows_by_doc_id:
+            return
+
+        table = self.get_table()
+        with self.engine.begin() as connection:
+            try:
+                with connection.begin_nested():
+                    _replace_rows(connection, table, rows_by_doc_id)
+            except IntegrityError:
+                # Someone beat us to it. Concurrent inserts can happen
+                # when a doc is processed by the celery rebuild task
+                # at the same time as the pillow. Save the docs one by one
+                # so the rest still make it in.
+                for doc_id, rows in rows_by_doc_id.items():
                     try:
-                        connection.execute(insert)
+                        with connection.begin_nested():
+                            _replace_rows(connection, table, {doc_id: rows})
                     except IntegrityError:
-                        # Someone beat us to it. Concurrent inserts can happen
-                        # when a doc is processed by the celery rebuild task
-                        # at the same time as the pillow.
                         pass
 
     def delete(self, doc):
@@ -81,6 +102,16 @@ def get_indicator_table(indicator_config, custom_metadata=None):
     )
 
 
+def _replace_rows(connection, table, rows_by_doc_id):
+    # delete all existing rows for these docs to ensure we aren't left with stale data
+    connection.execute(table.delete(table.c.doc_id.in_(rows_by_doc_id.keys())))
+    all_rows = [row for rows in rows_by_doc_id.values() for row in rows]
+    for batch in chunked(all_rows, INSERT_BATCH_SIZE):
+        # a single INSERT with many VALUES rather than an executemany, which
+        # psycopg2 runs as one INSERT per row
+        connection.execute(table.insert().values(list(batch)))
+
+
 def rebuild_table(engine, table):
     with engine.begin() as connection:
         table.drop(connection, checkfirst=True)
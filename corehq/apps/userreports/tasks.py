@@ -1,44 +1,129 @@
 import datetime
 import logging
 from celery.task import task
+from couchdbkit import ResourceConflict
 from sqlalchemy.exc import DataError
 from casexml.apps.case.models import CommCareCase
 from corehq.apps.domain.utils import get_doc_ids
-from corehq.apps.userreports.models import DataSourceConfiguration, StaticDataSourceConfiguration
+from corehq.apps.userreports.models import DataSourceConfiguration, StaticDataSourceConfiguration, \
+    DataSourceBuildChunk
 from corehq.apps.userreports.sql import IndicatorSqlAdapter
 from couchforms.models import XFormInstance
+from dimagi.utils.chunked import chunked
 from dimagi.utils.couch.database import iter_docs
 
+# number of docs processed by each subtask of a rebuild
+REBUILD_CHUNK_SIZE = 10000
+MAX_BUILD_SAVE_ATTEMPTS = 10
+
+
+def _is_static(indicator_config_id):
+    return indicator_config_id.startswith(StaticDataSourceConfiguration._datasource_id_prefix)
+
+
+def _get_config_by_id(indicator_config_id):
+    if _is_static(indicator_config_id):
+        return StaticDataSourceConfiguration.by_id(indicator_config_id)
+    else:
+        return DataSourceConfiguration.get(indicator_config_id)
+
+
+def _get_relevant_ids(config):
+    couchdb = _get_db(config.referenced_doc_type)
+    return sorted(get_doc_ids(config.domain, config.referenced_doc_type, database=couchdb))
+
 
 @task(queue='ucr_queue', ignore_result=True, acks_late=True)
 def rebuild_indicators(indicator_config_id):
-    is_static = indicator_config_id.startswith(StaticDataSourceConfiguration._datasource_id_prefix)
-    if is_static:
-        config = StaticDataSourceConfiguration.by_id(indicator_config_id)
-    else:
-        config = DataSourceConfiguration.get(indicator_config_id)
+    """
+    Rebuilds the table from scratch. The docs are split into chunks of sorted IDs
+    which are built in parallel by `build_indicators_chunk`.
+    """
+    config = _get_config_by_id(indicator_config_id)
+    chunks = list(chunked(_get_relevant_ids(config), REBUILD_CHUNK_SIZE))
+    if not _is_static(indicator_config_id):
         # Save the start time now in case anything goes wrong. This way we'll be
         # able to see if the rebuild started a long time ago without finishing.
         config.meta.build.initiated = datetime.datetime.utcnow()
+        config.meta.build.finished = not chunks
+        config.meta.build.chunks = [
+            DataSourceBuildChunk(start_id=doc_ids[0], end_id=doc_ids[-1])
+            for doc_ids in chunks
+        ]
         config.save()
 
     adapter = IndicatorSqlAdapter(config)
     adapter.rebuild_table()
 
+    for doc_ids in chunks:
+        build_indicators_chunk.delay(indicator_config_id, list(doc_ids))
+
+
+@task(queue='ucr_queue', ignore_result=True, acks_late=True)
+def resume_building_indicators(indicator_config_id):
+    """
+    Picks up an interrupted rebuild where it left off, only building the chunks
+    that didn't finish. Docs created since the rebuild started are handled by
+    the pillow. Starts a new rebuild if there is nothing to resume from.
+    """
+    config = _get_config_by_id(indicator_config_id)
+    build = config.meta.build
+    if _is_static(indicator_config_id) or not build.initiated or not build.chunks:
+        # static data sources don't record their progress
+        rebuild_indicators(indicator_config_id)
+        return
+
+    relevant_ids = _get_relevant_ids(config)
+    for chunk in build.chunks:
+        if not chunk.finished:
+            doc_ids = [doc_id for doc_id in relevant_ids if chunk.start_id <= doc_id <= chunk.end_id]
+            build_indicators_chunk.delay(indicator_config_id, doc_ids,
+                                         start_id=chunk.start_id, end_id=chunk.end_id)
+
+
+@task(queue='ucr_queue', ignore_result=True, acks_late=True)
+def build_indicators_chunk(indicator_config_id, doc_ids, start_id=None, end_id=None):
+    config = _get_config_by_id(indicator_config_id)
+    adapter = IndicatorSqlAdapter(config)
     couchdb = _get_db(config.referenced_doc_type)
-    relevant_ids = get_doc_ids(config.domain, config.referenced_doc_type,
-                               database=couchdb)
+    for docs in chunked(iter_docs(couchdb, doc_ids, chunksize=500), 500):
+        _save_docs(adapter, docs)
+
+    if not _is_static(indicator_config_id):
+        _mark_chunk_finished(indicator_config_id,
+                             start_id or doc_ids[0],
+                             end_id or doc_ids[-1])
+
 
-    for doc in iter_docs(couchdb, relevant_ids, chunksize=500):
+def _mark_chunk_finished(indicator_config_id, start_id, end_id):
+    # chunks finish concurrently so retry on conflicts with a fresh copy of the config
+    for attempt in range(MAX_BUILD_SAVE_ATTEMPTS):
+        config = DataSourceConfiguration.wrap(DataSourceConfiguration.get_db().get(indicator_config_id))
+        build = config.meta.build
+        for chunk in build.chunks:
+            if chunk.start_id == start_id and chunk.end_id == end_id:
+                chunk.finished = True
+        build.finished = all(chunk.finished for chunk in build.chunks)
         try:
-            # save is a noop if the filter doesn't match
-            adapter.save(doc)
-        except DataError as e:
-            logging.exception('problem saving document {} to table. {}'.format(doc['_id'], e))
+            config.save()
+        except ResourceConflict:
+            if attempt == MAX_BUILD_SAVE_ATTEMPTS - 1:
+                raise
+        else:
+            return
 
-    if not is_static:
-        config.meta.build.finished = True
-        config.save()
+
+def _save_docs(adapter, docs):
+    try:
+        # docs that don't match the filter are skipped
+        adapter.bulk_save(docs)
+    except DataError:
+        # find the bad doc(s) and save the rest
+        for doc in docs:
+            try:
+                adapter.save(doc)
+            except DataError as e:
+                logging.exception('problem saving document {} to table. {}'.format(doc['_id'], e))
 
 
 def _get_db(doc_type):
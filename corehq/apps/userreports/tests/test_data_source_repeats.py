@@ -2,6 +2,7 @@ import json
 import os
 import datetime
 from django.test import SimpleTestCase, TestCase
+from mock import patch
 from corehq.apps.userreports.models import DataSourceConfiguration
 from corehq.apps.userreports.sql import IndicatorSqlAdapter
 
@@ -109,6 +110,45 @@ class RepeatDataSourceBuildTest(RepeatDataSourceTestMixin, TestCase):
             "The repeat data saved in the data source table did not match the expected data!"
         )
 
+    def test_bulk_save(self):
+        adapter = IndicatorSqlAdapter(self.config)
+        adapter.rebuild_table()
+
+        docs = _test_docs_with_two_logs(3)
+        adapter.bulk_save(docs)
+        self.assertEqual(6, adapter.get_query_object().count())
+
+        # saving again replaces the existing rows
+        docs[0]['form']['time_logs'] = docs[0]['form']['time_logs'][:1]
+        adapter.bulk_save(docs)
+        self.assertEqual(5, adapter.get_query_object().count())
+        self.assertEqual(
+            ['al'],
+            [r.person for r in adapter.get_query_object().filter(adapter.get_table().c.doc_id == 'doc-0')]
+        )
+
+    @patch('corehq.apps.userreports.sql.adapter.INSERT_BATCH_SIZE', 4)
+    def test_bulk_save_batches(self):
+        adapter = IndicatorSqlAdapter(self.config)
+        adapter.rebuild_table()
+
+        docs = _test_docs_with_two_logs(5)
+        adapter.bulk_save(docs)
+        # 10 rows, inserted 4 at a time
+        self.assertEqual(10, adapter.get_query_object().count())
+
+
+def _test_docs_with_two_logs(count):
+    now = datetime.datetime.now()
+    one_hour = datetime.timedelta(hours=1)
+    return [
+        _test_doc(_id='doc-{}'.format(i), form={'time_logs': [
+            {"start_time": now, "end_time": now + one_hour, "person": "al"},
+            {"start_time": now + one_hour, "end_time": now + (one_hour * 2), "person": "chris"},
+        ]})
+        for i in range(count)
+    ]
+
 
 def _test_doc(**extras):
     test_doc = {
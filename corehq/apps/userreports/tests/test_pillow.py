@@ -1,14 +1,15 @@
 from copy import copy
 import decimal
 import uuid
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from mock import patch
 from datetime import datetime, timedelta
 from casexml.apps.case.models import CommCareCase
 from corehq.apps.userreports.exceptions import StaleRebuildError
-from corehq.apps.userreports.pillow import ConfigurableIndicatorPillow, REBUILD_CHECK_INTERVAL
+from corehq.apps.userreports.pillow import ConfigurableIndicatorPillow, REBUILD_CHECK_INTERVAL, AdapterIndex
 from corehq.apps.userreports.sql import IndicatorSqlAdapter
-from corehq.apps.userreports.tasks import rebuild_indicators
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.tasks import rebuild_indicators, resume_building_indicators
 from corehq.apps.userreports.tests.utils import get_sample_data_source, get_sample_doc_and_indicators
 
 
@@ -38,6 +39,71 @@ class PillowBootstrapTest(TestCase):
         self.assertTrue(pillow.needs_bootstrap())
 
 
+class AdapterIndexTest(SimpleTestCase):
+
+    class FakeAdapter(object):
+        def __init__(self, config):
+            self.config = config
+
+    def _adapter(self, configured_filter=None, domain='user-reports', doc_type='XFormInstance'):
+        config = DataSourceConfiguration(
+            domain=domain,
+            referenced_doc_type=doc_type,
+            table_id=uuid.uuid4().hex,
+            configured_filter=configured_filter or {},
+        )
+        return self.FakeAdapter(config)
+
+    def _xmlns_filter(self, xmlns):
+        return {
+            'type': 'boolean_expression',
+            'operator': 'eq',
+            'expression': {'type': 'property_name', 'property_name': 'xmlns'},
+            'property_value': xmlns,
+        }
+
+    def test_candidates(self):
+        unfiltered = self._adapter()
+        form_a = self._adapter(self._xmlns_filter('http://a'))
+        form_b = self._adapter({'type': 'and', 'filters': [
+            self._xmlns_filter('http://b'),
+            {'type': 'property_match', 'property_name': 'app_id', 'property_value': 'abc'},
+        ]})
+        other_domain = self._adapter(domain='other')
+        cases = self._adapter(doc_type='CommCareCase')
+        index = AdapterIndex([unfiltered, form_a, form_b, other_domain, cases])
+
+        def _candidates(**doc):
+            return [(adapter, is_deletion) for adapter, is_deletion in index.get_candidates(doc)]
+
+        self.assertItemsEqual(
+            [(unfiltered, False), (form_a, False)],
+            _candidates(domain='user-reports', doc_type='XFormInstance', xmlns='http://a')
+        )
+        self.assertItemsEqual(
+            [(unfiltered, False), (form_b, False)],
+            _candidates(domain='user-reports', doc_type='XFormInstance', xmlns='http://b')
+        )
+        self.assertItemsEqual(
+            [(unfiltered, True), (form_a, True)],
+            _candidates(domain='user-reports', doc_type='XFormArchived', xmlns='http://a')
+        )
+        self.assertEqual([(cases, False)], _candidates(domain='user-reports', doc_type='CommCareCase'))
+        self.assertEqual([], _candidates(domain='missing', doc_type='XFormInstance'))
+        self.assertEqual([], _candidates(domain=['user-reports'], doc_type='XFormInstance'))
+
+    def test_or_filters_not_indexed(self):
+        either = self._adapter({'type': 'or', 'filters': [
+            self._xmlns_filter('http://a'),
+            self._xmlns_filter('http://b'),
+        ]})
+        index = AdapterIndex([either])
+        self.assertEqual(
+            [(either, False)],
+            index.get_candidates({'domain': 'user-reports', 'doc_type': 'XFormInstance', 'xmlns': 'http://c'})
+        )
+
+
 class IndicatorPillowTest(TestCase):
 
     def setUp(self):
@@ -89,6 +155,44 @@ class IndicatorPillowTest(TestCase):
         rebuild_indicators(self.config._id)
         self._check_sample_doc_state()
 
+    def _save_sample_docs(self, count):
+        docs = []
+        for i in range(count):
+            sample_doc, _ = get_sample_doc_and_indicators(self.fake_time_now)
+            sample_doc['_id'] = 'chunked-doc-{}'.format(i)
+            CommCareCase.get_db().save_doc(sample_doc)
+            docs.append(sample_doc)
+        self.addCleanup(CommCareCase.get_db().bulk_delete, docs)
+
+    @patch('corehq.apps.userreports.tasks.REBUILD_CHUNK_SIZE', 2)
+    def test_rebuild_indicators_in_chunks(self):
+        self._save_sample_docs(3)
+        rebuild_indicators(self.config._id)
+        self.assertEqual(3, self.adapter.get_query_object().count())
+
+        build = DataSourceConfiguration.get(self.config._id).meta.build
+        self.assertTrue(build.finished)
+        self.assertEqual(
+            [('chunked-doc-0', 'chunked-doc-1', True), ('chunked-doc-2', 'chunked-doc-2', True)],
+            [(chunk.start_id, chunk.end_id, chunk.finished) for chunk in build.chunks]
+        )
+
+    @patch('corehq.apps.userreports.tasks.REBUILD_CHUNK_SIZE', 2)
+    def test_resume_building_indicators(self):
+        self._save_sample_docs(3)
+        rebuild_indicators(self.config._id)
+        config = DataSourceConfiguration.get(self.config._id)
+        config.meta.build.finished = False
+        config.meta.build.chunks[1].finished = False
+        config.save()
+        with self.adapter.engine.begin() as connection:
+            connection.execute(self.adapter.get_table().delete())
+
+        resume_building_indicators(self.config._id)
+        # only the unfinished chunk is rebuilt
+        self.assertEqual(['chunked-doc-2'], [row.doc_id for row in self.adapter.get_query_object()])
+        self.assertTrue(DataSourceConfiguration.get(self.config._id).meta.build.finished)
+
     def test_bad_integer_datatype(self):
         self.config.save()
         bad_ints = ['a', '', None]
@@ -1,6 +1,11 @@
+from multiprocessing.dummy import Pool
 from casexml.apps.case.models import CommCareCase
 from dimagi.utils.parsing import json_format_datetime
 
+# upper bound on the number of concurrent view queries made by
+# get_case_ids_modified_with_owners_since
+MAX_CONCURRENT_OWNER_QUERIES = 8
+
 
 def get_case_ids_modified_with_owner_since(domain, owner_id, reference_date):
     """
@@ -16,3 +21,31 @@ def get_case_ids_modified_with_owner_since(domain, owner_id, reference_date):
             reduce=False
         )
     ]
+
+
+def get_case_ids_modified_with_owners_since(domain, owner_ids, reference_date):
+    """
+    Gets the set of all cases owned by any of the specified owner IDs that have been
+    modified since a particular reference_date.
+
+    Each owner requires its own range query against the view so these are run
+    concurrently on a small thread pool.
+    """
+    owner_ids = list(owner_ids)
+    case_ids = set()
+    if len(owner_ids) <= 1:
+        for owner_id in owner_ids:
+            case_ids.update(get_case_ids_modified_with_owner_since(domain, owner_id, reference_date))
+        return case_ids
+
+    pool = Pool(min(len(owner_ids), MAX_CONCURRENT_OWNER_QUERIES))
+    try:
+        for owner_case_ids in pool.imap_unordered(
+            lambda owner_id: get_case_ids_modified_with_owner_since(domain, owner_id, reference_date),
+            owner_ids
+        ):
+            case_ids.update(owner_case_ids)
+    finally:
+        pool.close()
+        pool.join()
+    return case_ids
@@ -1,10 +1,14 @@
 import copy
+import json
+import logging
+import time
 from urllib import unquote
 from elasticsearch import Elasticsearch
 import rawes
 from django.conf import settings
+from requests.exceptions import ConnectionError
 from corehq.pillows.mappings.reportxform_mapping import REPORT_XFORM_INDEX
-from pillowtop.listener import send_to_elasticsearch as send_to_es
+from dimagi.utils.chunked import chunked
 from corehq.pillows.mappings.app_mapping import APP_INDEX
 from corehq.pillows.mappings.case_mapping import CASE_INDEX
 from corehq.pillows.mappings.domain_mapping import DOMAIN_INDEX
@@ -37,24 +41,97 @@ def get_es(timeout=30):
                                     settings.ELASTICSEARCH_PORT),
                          timeout=timeout)
 
+ES_BULK_CHUNK_SIZE = 500
+ES_BULK_RETRIES = 3
+ES_BULK_RETRY_INTERVAL = 1  # in seconds, doubled after each attempt
+# item statuses that mean elasticsearch was too busy to handle the doc, rather than the doc being bad
+ES_BULK_RETRY_STATUSES = (429, 503)
+
+
 def send_to_elasticsearch(index, doc, delete=False):
     """
     Utility method to update the doc in elasticsearch.
     Duplicates the functionality of pillowtop but can be called directly.
     """
-    doc_id = doc['_id']
-    path = ES_URLS[index].replace('_search', doc_id)
-    doc_exists = get_es().head(path)
-    return send_to_es(
-        path=path,
-        es_getter=get_es,
-        name="{}.{} <{}>:".format(send_to_elasticsearch.__module__,
-                                  send_to_elasticsearch.__name__, index),
-        data=doc,
-        except_on_failure=True,
-        update=doc_exists,
-        delete=delete,
-    )
+    failures = bulk_send_to_elasticsearch(index, [doc], delete=delete)
+    if failures:
+        [(doc_id, error)] = failures
+        raise ESError("{} <{}>: failed to send doc {}: {}".format(
+            send_to_elasticsearch.__name__, index, doc_id, error))
+
+
+def bulk_send_to_elasticsearch(index, docs, chunk_size=ES_BULK_CHUNK_SIZE, delete=False,
+                               retries=ES_BULK_RETRIES):
+    """
+    Updates (or deletes) the docs in elasticsearch using the _bulk API, `chunk_size`
+    docs per request. Existing docs are updated with the fields in the doc and missing
+    ones are created, the same as `send_to_elasticsearch`.
+
+    Requests that fail to connect and docs that elasticsearch was too busy to handle
+    are retried with exponential backoff.
+
+    Returns a list of (doc_id, error) for the docs that could not be sent.
+    """
+    es_index, es_type = ES_URLS[index].split('/')[:2]
+    failures = []
+    for chunk in chunked(docs, chunk_size):
+        pending = list(chunk)
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(ES_BULK_RETRY_INTERVAL * 2 ** (attempt - 1))
+            is_last_attempt = attempt == retries
+            try:
+                results = _send_bulk_request(es_index, es_type, pending, delete)
+            except ConnectionError, e:
+                if is_last_attempt:
+                    failures.extend((doc['_id'], unicode(e)) for doc in pending)
+                    break
+                logging.warning("Couldn't connect to elasticsearch for bulk request, retrying: %s", e)
+                continue
+
+            retry_docs = []
+            for doc, (status, error) in zip(pending, results):
+                if error is None:
+                    continue
+                if status in ES_BULK_RETRY_STATUSES and not is_last_attempt:
+                    retry_docs.append(doc)
+                else:
+                    failures.append((doc['_id'], error))
+            pending = retry_docs
+            if not pending:
+                break
+
+    for doc_id, error in failures:
+        logging.error("Failed to send doc %s to elasticsearch index %s: %s", doc_id, index, error)
+    return failures
+
+
+def _send_bulk_request(es_index, es_type, docs, delete):
+    """
+    Returns a (status, error) pair for each doc, with error None if the doc was sent
+    """
+    lines = []
+    for doc in docs:
+        metadata = {"_index": es_index, "_type": es_type, "_id": doc['_id']}
+        if delete:
+            lines.append(json.dumps({"delete": metadata}))
+        else:
+            metadata["_retry_on_conflict"] = 2
+            lines.append(json.dumps({"update": metadata}))
+            lines.append(json.dumps({"doc": doc, "doc_as_upsert": True}))
+    response = get_es().post('_bulk', data='\n'.join(lines) + '\n')
+    if 'error' in response:
+        raise ESError(response['error'])
+
+    results = []
+    for item in response['items']:
+        [result] = item.values()
+        error = result.get('error')
+        if delete and result.get('status') == 404:
+            # deleting a doc that isn't there is fine
+            error = None
+        results.append((result.get('status'), error))
+    return results
 
 
 ES_URLS = {
@@ -314,29 +391,83 @@ def es_wrapper(index, domain=None, q=None, doc_type=None, fields=None,
     return hits
 
 
-def stream_es_query(chunksize=100, **kwargs):
+SCROLL_KEEPALIVE = '5m'
+SCROLL_CHUNKSIZE = 500
+
+
+def scroll_query(es_url, q, chunksize=SCROLL_CHUNKSIZE, keepalive=SCROLL_KEEPALIVE, limit=None):
+    """
+    Yields every hit for the query using the elasticsearch scroll API, fetching
+    `chunksize` at a time and stopping after `limit` hits if it is set.
+
+    Unlike paging with from/size each batch costs the same no matter how deep into
+    the results it is. Queries without a sort use the scan search type, which skips
+    scoring and sorting altogether (`chunksize` is then per shard).
+    `keepalive` is how long elasticsearch keeps the scroll open between batches.
+    """
+    q = copy.deepcopy(q)
+    q.pop("from", None)
+    q["size"] = chunksize
+    params = {"scroll": keepalive}
+    scan = "sort" not in q
+    if scan:
+        params["search_type"] = "scan"
+
+    es = get_es()
+    result = _check_scroll_result(es.get(es_url, params=params, data=q))
+    if scan:
+        # the initial scan response has no hits, only the scroll id
+        result = _get_next_scroll_page(es, result, keepalive)
+
+    count = 0
+    try:
+        while result["hits"]["hits"]:
+            for hit in result["hits"]["hits"]:
+                if limit is not None and count >= limit:
+                    return
+                yield hit
+                count += 1
+            result = _get_next_scroll_page(es, result, keepalive)
+    finally:
+        if result["hits"]["hits"]:
+            # stopped early (at the limit, or by the caller) so free the scroll
+            # rather than leaving it open until the keepalive runs out
+            _clear_scroll(es, result)
+
+
+def _get_next_scroll_page(es, result, keepalive):
+    return _check_scroll_result(es.get('_search/scroll', params={
+        "scroll": keepalive,
+        "scroll_id": result["_scroll_id"],
+    }))
+
+
+def _clear_scroll(es, result):
+    try:
+        es.delete('_search/scroll/{}'.format(result["_scroll_id"]))
+    except Exception as e:
+        logging.warning("Couldn't clear elasticsearch scroll: %s", e)
+
+
+def _check_scroll_result(result):
+    if 'error' in result:
+        raise ESError(result['error'])
+    return result
+
+
+def stream_es_query(chunksize=100, keepalive=SCROLL_KEEPALIVE, **kwargs):
+    """
+    Yields all hits for an `es_query`, with `size` limiting the total number returned
+    """
     size = kwargs.pop("size", None)
     kwargs.pop("start_at", None)
-    kwargs["size"] = chunksize
-    for i in range(0, size or SIZE_LIMIT, chunksize):
-        kwargs["start_at"] = i
-        res = es_query(**kwargs)
-        if not res["hits"]["hits"]:
-            return
-        for hit in res["hits"]["hits"]:
-            yield hit
-
-
-def stream_esquery(esquery, chunksize=SIZE_LIMIT):
-    size = esquery._size if esquery._size is not None else SIZE_LIMIT
-    start = esquery._start if esquery._start is not None else 0
-    for chunk_start in range(start, start + size, chunksize):
-        es_query_set = esquery.size(chunksize).start(chunk_start).run()
-        if not es_query_set.raw_hits:
-            break
-        else:
-            for hit in es_query_set.raw_hits:
-                yield hit
+    es_url = kwargs.pop("es_url", None) or DOMAIN_INDEX + '/hqdomain/_search'
+    q = es_query(dict_only=True, **kwargs)
+    return scroll_query(es_url, q, chunksize=chunksize, keepalive=keepalive, limit=size)
+
+
+def stream_esquery(esquery, chunksize=SCROLL_CHUNKSIZE, keepalive=SCROLL_KEEPALIVE):
+    return esquery.scroll(chunksize=chunksize, keepalive=keepalive)
 
 
 def parse_args_for_es(request, prefix=None):
@@ -0,0 +1,143 @@
+"""
+Lightweight, read-only views of case JSON.
+
+Wrapping full CommCareCase documents is expensive and during restore the only
+thing we do with most cases is decide whether they need to sync and serialize them
+to XML. These classes expose just enough of the CommCareCase API for that,
+reading directly from the raw couch JSON.
+"""
+import re
+from django.core.urlresolvers import reverse
+from casexml.apps.case.models import CommCareCase
+from corehq.util.dates import iso_string_to_datetime
+from dimagi.utils import web
+from dimagi.utils.decorators.memoized import memoized
+
+
+def _to_datetime(value):
+    return iso_string_to_datetime(value) if value else None
+
+
+@memoized
+def _get_known_case_properties():
+    return set(CommCareCase.properties())
+
+
+class LightweightCaseIndex(object):
+    __slots__ = ('identifier', 'referenced_type', 'referenced_id', 'relationship')
+
+    def __init__(self, index_json):
+        self.identifier = index_json.get('identifier')
+        self.referenced_type = index_json.get('referenced_type')
+        self.referenced_id = index_json.get('referenced_id')
+        self.relationship = index_json.get('relationship') or 'child'
+
+
+class LightweightCaseAction(object):
+    __slots__ = ('server_date', 'sync_log_id')
+
+    def __init__(self, action_json):
+        self.server_date = _to_datetime(action_json.get('server_date'))
+        self.sync_log_id = action_json.get('sync_log_id')
+
+
+class LightweightCase(object):
+    """
+    A read-only stand-in for CommCareCase backed by the raw case JSON.
+
+    Supports what `case_needs_to_sync`, `get_case_sync_updates` and the casexml
+    generators need from a case.
+    """
+    __slots__ = ('_doc', '_indices', '_actions')
+
+    def __init__(self, doc):
+        self._doc = doc
+        self._indices = None
+        self._actions = None
+
+    @classmethod
+    def wrap(cls, doc):
+        return cls(doc)
+
+    def to_json(self):
+        return self._doc
+
+    @property
+    def _id(self):
+        return self._doc['_id']
+
+    case_id = get_id = _id
+
+    @property
+    def domain(self):
+        return self._doc.get('domain')
+
+    @property
+    def type(self):
+        return self._doc.get('type')
+
+    @property
+    def name(self):
+        return self._doc.get('name')
+
+    @property
+    def external_id(self):
+        return self._doc.get('external_id')
+
+    @property
+    def user_id(self):
+        return self._doc.get('user_id')
+
+    @property
+    def owner_id(self):
+        return self._doc.get('owner_id')
+
+    @property
+    def closed(self):
+        return bool(self._doc.get('closed'))
+
+    @property
+    def modified_on(self):
+        return _to_datetime(self._doc.get('modified_on'))
+
+    @property
+    def server_modified_on(self):
+        return _to_datetime(self._doc.get('server_modified_on'))
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            self._indices = [LightweightCaseIndex(index) for index in self._doc.get('indices') or []]
+        return self._indices
+
+    @property
+    def actions(self):
+        if self._actions is None:
+            self._actions = [LightweightCaseAction(action) for action in self._doc.get('actions') or []]
+        return self._actions
+
+    @property
+    def case_attachments(self):
+        return self._doc.get('case_attachments') or {}
+
+    def dynamic_case_properties(self):
+        """(key, value) tuples sorted by key"""
+        known_properties = _get_known_case_properties()
+        return sorted([
+            (key, value) for key, value in self._doc.items()
+            if key not in known_properties and re.search(r'^[a-zA-Z]', key)
+        ])
+
+    def get_attachment_server_url(self, attachment_key):
+        """
+        Same as CommCareCase.get_attachment_server_url
+        """
+        if attachment_key in self.case_attachments:
+            return "%s%s" % (web.get_url_base(),
+                             reverse("api_case_attachment", kwargs={
+                                 "domain": self.domain,
+                                 "case_id": self._id,
+                                 "attachment_id": attachment_key,
+                             }))
+        else:
+            return None
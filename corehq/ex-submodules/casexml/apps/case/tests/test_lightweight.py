@@ -0,0 +1,64 @@
+from datetime import datetime
+from django.test import SimpleTestCase
+from casexml.apps.case import const
+from casexml.apps.case.lightweight import LightweightCase
+from casexml.apps.case.models import CommCareCase, CommCareCaseAction
+from casexml.apps.case.sharedmodels import CommCareCaseIndex
+from casexml.apps.case.xml import V1, V2
+from casexml.apps.phone.xml import get_case_xml
+
+
+class LightweightCaseTest(SimpleTestCase):
+
+    def setUp(self):
+        self.case = CommCareCase(
+            _id='lightweight-case',
+            domain='lightweight-domain',
+            type='patient',
+            name='Bilbo',
+            user_id='user-id',
+            owner_id='owner-id',
+            external_id='external-id',
+            modified_on=datetime(2015, 10, 1, 12, 30),
+            server_modified_on=datetime(2015, 10, 1, 12, 31),
+            indices=[CommCareCaseIndex(
+                identifier='parent',
+                referenced_type='household',
+                referenced_id='parent-id',
+            )],
+            actions=[CommCareCaseAction(
+                action_type=const.CASE_ACTION_CREATE,
+                server_date=datetime(2015, 10, 1, 12, 31),
+                sync_log_id='sync-log-id',
+            )],
+            foo='some property',
+            bar='some other property',
+        )
+        self.lightweight_case = LightweightCase(self.case.to_json())
+
+    def test_properties(self):
+        for attr in ['_id', 'case_id', 'get_id', 'domain', 'type', 'name', 'user_id', 'owner_id',
+                     'external_id', 'closed', 'modified_on', 'server_modified_on']:
+            self.assertEqual(getattr(self.case, attr), getattr(self.lightweight_case, attr), attr)
+
+    def test_indices_and_actions(self):
+        [index] = self.lightweight_case.indices
+        self.assertEqual('parent', index.identifier)
+        self.assertEqual('household', index.referenced_type)
+        self.assertEqual('parent-id', index.referenced_id)
+        self.assertEqual('child', index.relationship)
+
+        [action] = self.lightweight_case.actions
+        self.assertEqual(datetime(2015, 10, 1, 12, 31), action.server_date)
+        self.assertEqual('sync-log-id', action.sync_log_id)
+
+    def test_dynamic_properties(self):
+        self.assertEqual(self.case.dynamic_case_properties(), self.lightweight_case.dynamic_case_properties())
+
+    def test_case_xml(self):
+        updates = [const.CASE_ACTION_CREATE, const.CASE_ACTION_UPDATE, const.CASE_ACTION_CLOSE]
+        for version in (V1, V2):
+            self.assertEqual(
+                get_case_xml(self.case, updates, version),
+                get_case_xml(self.lightweight_case, updates, version),
+            )
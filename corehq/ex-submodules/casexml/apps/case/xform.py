@@ -1,4 +1,5 @@
 from collections import namedtuple
+import copy
 import logging
 import warnings
 
@@ -271,6 +272,36 @@ class CaseDbCache(object):
     def clear_changed(self):
         self._changed = set()
 
+    def checkpoint(self, case_ids):
+        """
+        Snapshot the state of the given cases so that changes made to them
+        afterwards can be undone with `rollback`. Used when processing several
+        forms against the same cache and one of them fails.
+        """
+        return {
+            'cases': {
+                case_id: copy.deepcopy(self.cache[case_id].to_json())
+                for case_id in case_ids if case_id in self.cache
+            },
+            'case_ids': set(case_ids),
+            'changed': set(self._changed),
+            'num_xforms': len(self.xforms),
+        }
+
+    def rollback(self, checkpoint):
+        for case_id in checkpoint['case_ids']:
+            if case_id in checkpoint['cases']:
+                self.cache[case_id] = CommCareCase.wrap(checkpoint['cases'][case_id])
+            elif case_id in self.cache:
+                # loaded after the checkpoint so reload what's in the database.
+                # any lock taken out on it is kept until the cache is closed.
+                try:
+                    self.cache[case_id] = CommCareCase.get(case_id)
+                except ResourceNotFound:
+                    del self.cache[case_id]
+        self._changed = checkpoint['changed']
+        del self.xforms[checkpoint['num_xforms']:]
+
     def get_cached_forms(self):
         """
         Get any in-memory forms being processed.
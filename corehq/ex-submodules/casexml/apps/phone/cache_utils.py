@@ -1,29 +1,48 @@
 from collections import namedtuple
+import gzip
 import os
 import shutil
 import tempfile
 import uuid
 import re
+import zlib
 from casexml.apps.phone.exceptions import SyncLogCachingError
 from casexml.apps.phone.models import get_properly_wrapped_sync_log
 
 
 FileReference = namedtuple('FileReference', ['file', 'path'])
 
+# wbits value that tells zlib to expect (or write) gzip headers
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+GZIP_CHUNK_SIZE = 64 * 1024
 
-def copy_payload_and_synclog_and_get_new_file(filelike_payload):
+RESTORE_ID_PATTERN = '<restore_id>([\w_-]+)</restore_id>'
+
+
+def copy_payload_and_synclog_and_get_new_file(filelike_payload, compressed=False):
     """
     Given a restore payload, extracts the sync log id and sync log from the payload,
     makes a copy of the sync log, and then returns a new FileReference with the same contents
     except using the new sync log ID.
+
+    If `compressed` is set the payload is expected to be gzip compressed (see
+    `replace_sync_log_id_in_gzipped_payload`).
     """
-    synclog_id, end_position = extract_synclog_id_from_filelike_payload(filelike_payload)
+    if compressed:
+        header, header_end = read_leading_gzip_members(filelike_payload, '</restore_id>')
+        synclog_id = _extract_synclog_id(header)
+    else:
+        synclog_id, end_position = extract_synclog_id_from_filelike_payload(filelike_payload)
     old_sync_log = get_properly_wrapped_sync_log(synclog_id)
     new_sync_log_doc = old_sync_log.to_json()
     new_sync_log_id = uuid.uuid4().hex
     new_sync_log_doc['_id'] = new_sync_log_id
     del new_sync_log_doc['_rev']
     old_sync_log.get_db().save_doc(new_sync_log_doc)
+    if compressed:
+        return replace_sync_log_id_in_gzipped_payload(
+            filelike_payload, header, header_end, old_sync_log._id, new_sync_log_id
+        )
     return replace_sync_log_id_in_filelike_payload(
         filelike_payload, old_sync_log._id, new_sync_log_id, end_position
     )
@@ -33,20 +52,25 @@ def extract_synclog_id_from_filelike_payload(filelike_payload):
     filelike_payload.seek(0)
     try:
         beginning_of_log = filelike_payload.read(500)
-        # i know, regex parsing xml is bad. not sure what to do since this is arbitrarily truncated
-        match = re.search('<restore_id>([\w_-]+)</restore_id>', beginning_of_log)
-        if not match:
-            raise SyncLogCachingError("Couldn't find synclog ID from beginning of restore!")
-        groups = match.groups()
-        if len(groups) != 1:
-            raise SyncLogCachingError("Found more than one synclog ID from beginning of restore! {}".format(
-                ', '.join(groups))
-            )
-        return groups[0], beginning_of_log.index(groups[0])
+        synclog_id = _extract_synclog_id(beginning_of_log)
+        return synclog_id, beginning_of_log.index(synclog_id)
     finally:
         filelike_payload.seek(0)
 
 
+def _extract_synclog_id(beginning_of_log):
+    # i know, regex parsing xml is bad. not sure what to do since this is arbitrarily truncated
+    match = re.search(RESTORE_ID_PATTERN, beginning_of_log)
+    if not match:
+        raise SyncLogCachingError("Couldn't find synclog ID from beginning of restore!")
+    groups = match.groups()
+    if len(groups) != 1:
+        raise SyncLogCachingError("Found more than one synclog ID from beginning of restore! {}".format(
+            ', '.join(groups))
+        )
+    return groups[0]
+
+
 def replace_sync_log_id_in_filelike_payload(filelike_payload, old_id, new_id, position):
     filelike_payload.seek(0)
     try:
@@ -65,3 +89,88 @@ def replace_sync_log_id_in_filelike_payload(filelike_payload, old_id, new_id, po
         return FileReference(open(path, 'r'), path)
     finally:
         filelike_payload.seek(0)
+
+
+def replace_sync_log_id_in_gzipped_payload(filelike_payload, header, header_end, old_id, new_id):
+    """
+    Replaces the sync log ID in a gzip compressed payload.
+
+    Compressed payloads are written as multiple gzip members with the sync element
+    in a member of its own, so only the leading members (`header`, which end at
+    `header_end` in the compressed file) need to be recompressed. The rest of the
+    compressed payload is copied as is.
+    """
+    old_block = '<restore_id>{}</restore_id>'.format(old_id)
+    if old_block not in header:
+        raise SyncLogCachingError('Error putting sync log back together. Expected ID {} but not found'.format(
+            old_id
+        ))
+    filelike_payload.seek(header_end)
+    try:
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as outfile:
+            write_gzip_member(outfile, header.replace(old_block, '<restore_id>{}</restore_id>'.format(new_id), 1))
+            shutil.copyfileobj(filelike_payload, outfile)
+        return FileReference(open(path, 'r'), path)
+    finally:
+        filelike_payload.seek(0)
+
+
+def write_gzip_member(fileobj, data):
+    """
+    Writes `data` to `fileobj` as a complete gzip member.
+    """
+    member = gzip.GzipFile(filename='', mode='wb', fileobj=fileobj)
+    try:
+        member.write(data)
+    finally:
+        member.close()
+
+
+def read_leading_gzip_members(fileobj, marker):
+    """
+    Decompresses whole gzip members from the start of `fileobj` until `marker`
+    has been seen.
+
+    Returns the decompressed text and the position in the file where the next member starts.
+    """
+    fileobj.seek(0)
+    try:
+        text = ''
+        position = 0
+        pending = fileobj.read(GZIP_CHUNK_SIZE)
+        while marker not in text:
+            if not pending:
+                raise SyncLogCachingError("Couldn't find {} in compressed restore!".format(marker))
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            while pending and not decompressor.unused_data:
+                text += decompressor.decompress(pending)
+                position += len(pending) - len(decompressor.unused_data)
+                pending = decompressor.unused_data or fileobj.read(GZIP_CHUNK_SIZE)
+        return text, position
+    finally:
+        fileobj.seek(0)
+
+
+def iter_gunzip(fileobj, chunk_size=GZIP_CHUNK_SIZE):
+    """
+    Incrementally decompresses a (possibly multi-member) gzip stream.
+
+    Unlike `gzip.GzipFile` this doesn't need `fileobj` to be seekable so it can be
+    used on streamed couch attachments.
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    data = fileobj.read(chunk_size)
+    while data:
+        decompressed = decompressor.decompress(data)
+        if decompressed:
+            yield decompressed
+        if decompressor.unused_data:
+            # the end of a member, anything left over belongs to the next one
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+        else:
+            data = fileobj.read(chunk_size)
+    remaining = decompressor.flush()
+    if remaining:
+        yield remaining
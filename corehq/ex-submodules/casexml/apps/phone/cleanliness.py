@@ -9,7 +9,7 @@ from casexml.apps.phone.exceptions import InvalidDomainError, InvalidOwnerIdErro
 from casexml.apps.phone.models import OwnershipCleanlinessFlag
 from corehq.apps.domain.models import Domain
 from corehq.apps.hqcase.dbaccessors import get_open_case_ids, \
-    get_closed_case_ids, get_all_case_owner_ids
+    get_closed_case_ids, get_all_case_owner_ids, get_case_ids_in_domain_by_owner
 from corehq.apps.users.util import WEIRD_USER_IDS
 from django.conf import settings
 from corehq.util.soft_assert import soft_assert
@@ -181,13 +181,28 @@ def get_case_footprint_info(domain, owner_id):
       2) doesn't return full blown case objects but just IDs
       3) differentiates between the base set and the complete list
     """
-    all_case_ids = set()
     # get base set of cases (anything open with this owner id)
     open_case_ids = get_open_case_ids(domain, owner_id)
-    new_case_ids = set(open_case_ids)
+    return _get_footprint_info_from_base_ids(domain, open_case_ids)
+
+
+def get_case_footprint_info_for_owners(domain, owner_ids):
+    """
+    Same as get_case_footprint_info, but for a list of owner IDs at once.
+
+    The base set for all owners is fetched in a single view query and the index
+    relationships are walked once for the combined set.
+    """
+    open_case_ids = get_case_ids_in_domain_by_owner(domain, owner_id__in=list(owner_ids), closed=False)
+    return _get_footprint_info_from_base_ids(domain, open_case_ids)
+
+
+def _get_footprint_info_from_base_ids(domain, base_case_ids):
+    all_case_ids = set()
+    new_case_ids = set(base_case_ids)
     while new_case_ids:
-        all_case_ids = all_case_ids | new_case_ids
+        all_case_ids.update(new_case_ids)
         referenced_case_ids = get_indexed_case_ids(domain, list(new_case_ids))
         new_case_ids = set(referenced_case_ids) - all_case_ids
 
-    return FootprintInfo(base_ids=set(open_case_ids), all_ids=all_case_ids)
+    return FootprintInfo(base_ids=set(base_case_ids), all_ids=all_case_ids)
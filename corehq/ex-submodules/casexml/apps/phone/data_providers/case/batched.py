@@ -17,7 +17,7 @@ logger = logging.getLogger(__name__)
 
 
 def get_case_payload_batched(restore_state):
-    response = restore_state.restore_class()
+    response = restore_state.new_response()
 
     sync_operation = BatchedCaseSyncOperation(restore_state)
     for update in sync_operation.get_all_case_updates():
@@ -2,16 +2,18 @@ from collections import defaultdict
 from copy import copy
 from functools import partial
 from datetime import datetime
+from casexml.apps.case.lightweight import LightweightCase
 from casexml.apps.case.models import CommCareCase
-from casexml.apps.phone.cleanliness import get_case_footprint_info
+from casexml.apps.phone.cleanliness import get_case_footprint_info_for_owners
+from casexml.apps.phone.data_providers.case.incremental_cache import get_incremental_restore_cache
 from casexml.apps.phone.data_providers.case.load_testing import append_update_to_response
 from casexml.apps.phone.data_providers.case.stock import get_stock_payload
 from casexml.apps.phone.data_providers.case.utils import get_case_sync_updates, CaseStub
 from casexml.apps.phone.models import OwnershipCleanlinessFlag, LOG_FORMAT_SIMPLIFIED, IndexTree, SimplifiedSyncLog
-from corehq.apps.hqcase.dbaccessors import get_open_case_ids, get_case_ids_in_domain_by_owner
+from corehq.apps.hqcase.dbaccessors import get_case_ids_in_domain_by_owner
 from corehq.apps.users.cases import get_owner_id
 from corehq.dbaccessors.couchapps.cases_by_server_date.by_owner_server_modified_on import \
-    get_case_ids_modified_with_owner_since
+    get_case_ids_modified_with_owners_since
 from corehq.dbaccessors.couchapps.cases_by_server_date.by_server_modified_on import get_last_modified_dates
 from dimagi.utils.couch.bulk import get_docs
 from dimagi.utils.decorators.memoized import memoized
@@ -45,10 +47,13 @@ class CleanOwnerCaseSyncOperation(object):
         return self.cleanliness_flags.get(owner_id, False)
 
     def get_payload(self):
-        response = self.restore_state.restore_class()
-        case_ids_to_sync = set()
-        for owner_id in self.restore_state.owner_ids:
-            case_ids_to_sync = case_ids_to_sync | set(self.get_case_ids_for_owner(owner_id))
+        response = self.restore_state.new_response()
+        fragment_cache = get_incremental_restore_cache(self.restore_state)
+        if fragment_cache:
+            fragment_cache.start()
+
+        id_collection_start = datetime.utcnow()
+        case_ids_to_sync = self.get_case_ids_for_owners(self.restore_state.owner_ids)
 
         if (not self.restore_state.is_initial and
                 any([not self.is_clean(owner_id) for owner_id in self.restore_state.owner_ids])):
@@ -58,39 +63,63 @@ class CleanOwnerCaseSyncOperation(object):
 
             # don't bother checking ones we've already decided to check
             other_ids_to_check = self.restore_state.last_sync_log.case_ids_on_phone - case_ids_to_sync
-            case_ids_to_sync = case_ids_to_sync | set(filter_cases_modified_since(
+            case_ids_to_sync.update(filter_cases_modified_since(
                 self.restore_state.domain, list(other_ids_to_check), self.restore_state.last_sync_log.date
             ))
 
+        # keep track of how long it took to figure out what to sync separately from the rest of the restore
+        self.restore_state.provider_log['case_id_collection_seconds'] = (
+            datetime.utcnow() - id_collection_start
+        ).total_seconds()
+
         all_maybe_syncing = copy(case_ids_to_sync)
         all_synced = set()
         all_indices = defaultdict(set)
         all_dependencies_syncing = set()
+
+        def _mark_synced(case_id, indices, is_live):
+            all_synced.add(case_id)
+            # update the indices in the new sync log
+            if indices:
+                all_indices[case_id] = indices
+                # and double check footprint for non-live cases
+                for referenced_id in indices.values():
+                    if referenced_id not in all_maybe_syncing:
+                        case_ids_to_sync.add(referenced_id)
+
+            if not is_live:
+                all_dependencies_syncing.add(case_id)
+
         while case_ids_to_sync:
             ids = pop_ids(case_ids_to_sync, chunk_size)
-            # todo: see if we can avoid wrapping - serialization depends on it heavily for now
+            # cases that haven't changed since the last cached initial restore don't need regenerating
+            fragments = fragment_cache.get_fragments(ids) if fragment_cache else {}
+            for case_id, fragment in fragments.items():
+                response.append(fragment.xml)
+                is_live = not fragment.closed and fragment.owner_id in self.restore_state.owner_ids
+                _mark_synced(case_id, fragment.indices, is_live)
+
+            ids_to_fetch = [case_id for case_id in ids if case_id not in fragments]
+            # avoid wrapping the full documents since that is expensive and we only need to read from them
             case_batch = filter(
                 partial(case_needs_to_sync, last_sync_log=self.restore_state.last_sync_log),
-                [CommCareCase.wrap(doc) for doc in get_docs(CommCareCase.get_db(), ids)]
-            )
+                [LightweightCase(doc) for doc in get_docs(CommCareCase.get_db(), ids_to_fetch)]
+            ) if ids_to_fetch else []
             updates = get_case_sync_updates(
                 self.restore_state.domain, case_batch, self.restore_state.last_sync_log
             )
             for update in updates:
                 case = update.case
-                all_synced.add(case._id)
-                append_update_to_response(response, update, self.restore_state)
-
-                # update the indices in the new sync log
-                if case.indices:
-                    all_indices[case._id] = {index.identifier: index.referenced_id for index in case.indices}
-                    # and double check footprint for non-live cases
-                    for index in case.indices:
-                        if index.referenced_id not in all_maybe_syncing:
-                            case_ids_to_sync.add(index.referenced_id)
+                if fragment_cache:
+                    response.append(fragment_cache.get_case_xml(case, update.required_updates))
+                else:
+                    append_update_to_response(response, update, self.restore_state)
 
-                if not _is_live(case, self.restore_state):
-                    all_dependencies_syncing.add(case._id)
+                _mark_synced(
+                    case._id,
+                    {index.identifier: index.referenced_id for index in case.indices},
+                    _is_live(case, self.restore_state),
+                )
 
             # commtrack ledger sections for this batch
             commtrack_elements = get_stock_payload(
@@ -100,7 +129,10 @@ class CleanOwnerCaseSyncOperation(object):
             response.extend(commtrack_elements)
 
             # add any new values to all_syncing
-            all_maybe_syncing = all_maybe_syncing | case_ids_to_sync
+            all_maybe_syncing.update(case_ids_to_sync)
+
+        if fragment_cache:
+            fragment_cache.finish(all_synced)
 
         # update sync token - marking it as the new format
         self.restore_state.current_sync_log = SimplifiedSyncLog.wrap(
@@ -128,20 +160,30 @@ class CleanOwnerCaseSyncOperation(object):
         self.restore_state.current_sync_log.prune_dependent_cases()
         return response
 
-    def get_case_ids_for_owner(self, owner_id):
-        if self.is_clean(owner_id):
+    def get_case_ids_for_owners(self, owner_ids):
+        """
+        Returns the base set of case IDs to sync for the owners. For a clean owner that is
+        its open cases on an initial sync, or anything modified since the last sync.
+        A dirty owner's whole footprint is returned and filtered later.
+
+        Owners are grouped by cleanliness so that their lookups can be batched into
+        multi-key view queries (or run concurrently when that isn't possible).
+        """
+        clean_owner_ids = [owner_id for owner_id in owner_ids if self.is_clean(owner_id)]
+        dirty_owner_ids = [owner_id for owner_id in owner_ids if not self.is_clean(owner_id)]
+        case_ids = set()
+        if clean_owner_ids:
             if self.restore_state.is_initial:
-                # for a clean owner's initial sync the base set is just the open ids
-                return set(get_open_case_ids(self.restore_state.domain, owner_id))
+                case_ids.update(get_case_ids_in_domain_by_owner(
+                    self.restore_state.domain, owner_id__in=clean_owner_ids, closed=False
+                ))
             else:
-                # for a clean owner's steady state sync, the base set is anything modified since last sync
-                return set(get_case_ids_modified_with_owner_since(
-                    self.restore_state.domain, owner_id, self.restore_state.last_sync_log.date
+                case_ids.update(get_case_ids_modified_with_owners_since(
+                    self.restore_state.domain, clean_owner_ids, self.restore_state.last_sync_log.date
                 ))
-        else:
-            # todo: we may want to be smarter than this
-            # right now just return the whole footprint and do any filtering later
-            return get_case_footprint_info(self.restore_state.domain, owner_id).all_ids
+        if dirty_owner_ids:
+            case_ids.update(get_case_footprint_info_for_owners(self.restore_state.domain, dirty_owner_ids).all_ids)
+        return case_ids
 
 
 def _is_live(case, restore_state):
@@ -0,0 +1,141 @@
+"""
+Incremental cache for the case portion of initial restores.
+
+The XML for a case in an initial restore only depends on the case itself, so
+rather than throwing away the whole payload whenever anything changes we store
+each case's XML fragment (plus the bits of the case needed to build the sync log)
+along with a manifest recording when the snapshot was taken. The next initial
+restore for the user only needs to fetch and serialize cases that are new or
+have been modified since then.
+"""
+from collections import namedtuple
+from datetime import datetime
+import hashlib
+from casexml.apps.phone.xml import tostring, get_case_element
+from corehq.dbaccessors.couchapps.cases_by_server_date.by_server_modified_on import get_last_modified_dates
+from corehq.toggles import INCREMENTAL_RESTORE_CACHE
+from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
+
+# how long a user's case fragments sit around for (in seconds).
+INCREMENTAL_RESTORE_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # 1 week
+
+
+CaseFragment = namedtuple('CaseFragment', ['xml', 'indices', 'owner_id', 'closed'])
+
+
+def get_incremental_restore_cache(restore_state):
+    """
+    Returns an IncrementalRestoreCache for the restore, or None if the restore
+    isn't eligible for incremental caching.
+    """
+    if (restore_state.is_initial
+            and INCREMENTAL_RESTORE_CACHE.enabled(restore_state.domain)
+            # ledgers aren't tracked by case modification dates
+            and not (restore_state.project and restore_state.project.commtrack_enabled)
+            # load testing multiplies the cases in the payload
+            and restore_state.loadtest_factor == 1):
+        return IncrementalRestoreCache(restore_state)
+    return None
+
+
+class IncrementalRestoreCache(object):
+    """
+    Per user store of case XML fragments for initial restores.
+
+    Usage is to call `start` before collecting case IDs, `get_fragments` with each chunk
+    of IDs to find the cases that can be reused, `add` for each case that was
+    regenerated, and `finish` once the payload is complete.
+    """
+
+    def __init__(self, restore_state):
+        self.restore_state = restore_state
+        self.cache = get_redis_default_cache()
+        self.snapshot_date = None
+        self.new_fragments = {}
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = self.cache.get(self._manifest_key()) or {}
+        return self._manifest
+
+    @property
+    def previous_snapshot_date(self):
+        return self.manifest.get('date')
+
+    def start(self):
+        # take the date before anything is read so cases modified during
+        # this restore are picked up the next time around
+        self.snapshot_date = datetime.utcnow()
+
+    def get_fragments(self, case_ids):
+        """
+        Returns a dict of case ID to CaseFragment for the cases in `case_ids` that were
+        cached in the previous snapshot and haven't been modified since.
+        """
+        cached_case_ids = self.manifest.get('case_ids', set())
+        candidate_ids = [case_id for case_id in case_ids if case_id in cached_case_ids]
+        if not candidate_ids:
+            return {}
+
+        reusable_ids = set(candidate_ids) - self._get_stale_case_ids(candidate_ids)
+        fragments = self.cache.get_many([self._fragment_key(case_id) for case_id in reusable_ids])
+        return {
+            case_id: CaseFragment(*fragments[self._fragment_key(case_id)])
+            for case_id in reusable_ids
+            if fragments.get(self._fragment_key(case_id))
+        }
+
+    def _get_stale_case_ids(self, candidate_ids):
+        """
+        Returns the cases in `candidate_ids` that were modified since the last snapshot.
+        Cases can leave the user's owners and still be synced (e.g. because they are
+        indexed by an owned case), so every case's last modified date is checked
+        rather than looking through the owners' recently modified cases.
+        """
+        last_modified_dates = get_last_modified_dates(self.restore_state.domain, candidate_ids)
+        # cases missing from the view (e.g. deleted) are never reused
+        return {
+            case_id for case_id in candidate_ids
+            if case_id not in last_modified_dates
+            or last_modified_dates[case_id] >= self.previous_snapshot_date
+        }
+
+    def get_case_xml(self, case, updates):
+        """
+        Serializes a regenerated case and keeps hold of it to be saved with the new snapshot.
+        """
+        case_xml = tostring(get_case_element(case, updates, self.restore_state.version))
+        self.new_fragments[case.case_id] = CaseFragment(
+            xml=case_xml,
+            indices={index.identifier: index.referenced_id for index in case.indices},
+            owner_id=case.owner_id or case.user_id,
+            closed=case.closed,
+        )
+        return case_xml
+
+    def finish(self, synced_case_ids):
+        """
+        Saves the new fragments and a manifest of everything in this payload.
+        """
+        self.cache.set_many({
+            self._fragment_key(case_id): tuple(fragment)
+            for case_id, fragment in self.new_fragments.items()
+        }, INCREMENTAL_RESTORE_CACHE_TIMEOUT)
+        self.cache.set(self._manifest_key(), {
+            'date': self.snapshot_date,
+            'case_ids': set(synced_case_ids),
+        }, INCREMENTAL_RESTORE_CACHE_TIMEOUT)
+
+    def _key_prefix(self):
+        return 'incremental-restore-{user}-{version}'.format(
+            user=self.restore_state.user.user_id,
+            version=self.restore_state.version,
+        )
+
+    def _manifest_key(self):
+        return hashlib.md5('{}-manifest'.format(self._key_prefix())).hexdigest()
+
+    def _fragment_key(self, case_id):
+        return hashlib.md5('{}-{}'.format(self._key_prefix(), case_id)).hexdigest()
@@ -1,5 +1,4 @@
 from copy import deepcopy
-from casexml.apps.case.models import CommCareCase
 from casexml.apps.phone.data_providers.case.utils import CaseSyncUpdate
 from casexml.apps.phone.xml import get_case_element
 from corehq.toggles import ENABLE_LOADTEST_USERS
@@ -23,11 +22,13 @@ def transform_loadtest_update(update, factor):
     """
     def _map_id(id, count):
         return '{}-{}'.format(id, count)
-    case = CommCareCase.wrap(deepcopy(update.case._doc))
-    case._id = _map_id(case._id, factor)
-    for index in case.indices:
-        index.referenced_id = _map_id(index.referenced_id, factor)
-    case.name = '{} ({})'.format(case.name, factor)
+    doc = deepcopy(update.case._doc)
+    doc['_id'] = _map_id(doc['_id'], factor)
+    for index in doc.get('indices') or []:
+        index['referenced_id'] = _map_id(index['referenced_id'], factor)
+    doc['name'] = '{} ({})'.format(doc.get('name'), factor)
+    # keep the same case class (full or lightweight) as the original update
+    case = type(update.case).wrap(doc)
     return CaseSyncUpdate(case, update.sync_token, required_updates=update.required_updates)
 
 
@@ -42,7 +42,7 @@ class FixtureElementProvider(RestoreDataProvider):
     """
     def get_elements(self, restore_state):
         # fixture block
-        for fixture in generator.get_fixtures(
+        for fixture in generator.get_restore_fixtures(
             restore_state.user,
             restore_state.version,
             restore_state.last_sync_log
@@ -1,4 +1,5 @@
 from collections import namedtuple
+from xml.etree import ElementTree
 from casexml.apps.case.xml import V1
 from django.conf import settings
 from corehq.apps.users.models import CommCareUser
@@ -30,6 +31,9 @@ class FixtureGenerator(object):
     provider(user, version, last_sync) --> [list of fixture objects]
     provider.id --> the ID of the fixture
 
+    A fixture object is an ElementTree element, or a string of already serialized
+    fixture XML that can be written straight into a restore.
+
     If the provider generates multiple fixtures it should use an ID format as follows:
         "prefix:dynamic"
     In this case 'provider.id' should just be the ID prefix.
@@ -79,15 +83,27 @@ class FixtureGenerator(object):
         Only get fixtures with the specified ID.
         """
         fixtures = self._get_fixtures(None, fixture_id, user, version, last_sync)
-        for fixture in fixtures:
+        for fixture in itertools.imap(_as_element, fixtures):
             if fixture.attrib.get("id") == fixture_id:
                 return fixture
 
     def get_fixtures(self, user, version, last_sync=None, group=None):
         """
-        Gets all fixtures associated with an OTA restore operation
+        Gets all fixtures associated with an OTA restore operation, as elements
+        """
+        return itertools.imap(_as_element, self._get_fixtures(group, None, user, version, last_sync))
+
+    def get_restore_fixtures(self, user, version, last_sync=None):
+        """
+        Same as get_fixtures, but fixtures that are already serialized are left as strings
         """
-        return self._get_fixtures(group, None, user, version, last_sync)
+        return self._get_fixtures(None, None, user, version, last_sync)
+
+
+def _as_element(fixture):
+    if isinstance(fixture, basestring):
+        return ElementTree.fromstring(fixture)
+    return fixture
 
 
 generator = FixtureGenerator()
@@ -107,6 +107,9 @@ class SyncLogAssertionError(AssertionError):
 LOG_FORMAT_LEGACY = 'legacy'
 LOG_FORMAT_SIMPLIFIED = 'simplified'
 
+# content type of cached payloads that were stored gzip compressed
+GZIP_CONTENT_TYPE = 'application/x-gzip'
+
 
 class AbstractSyncLog(SafeSaveDocument, UnicodeMixIn):
     date = DateTimeProperty()
@@ -188,9 +191,13 @@ class AbstractSyncLog(SafeSaveDocument, UnicodeMixIn):
         except ResourceNotFound:
             return None
 
-    def set_cached_payload(self, payload, version):
+    def set_cached_payload(self, payload, version, compressed=False):
         self.put_attachment(payload, name=self.get_payload_attachment_name(version),
-                            content_type='text/xml')
+                            content_type=GZIP_CONTENT_TYPE if compressed else 'text/xml')
+
+    def cached_payload_is_compressed(self, version):
+        attachment = self._doc.get('_attachments', {}).get(self.get_payload_attachment_name(version), {})
+        return attachment.get('content_type') == GZIP_CONTENT_TYPE
 
     def invalidate_cached_payloads(self):
         for name in copy(self._doc.get('_attachments', {})):
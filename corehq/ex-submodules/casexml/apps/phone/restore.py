@@ -1,18 +1,20 @@
 from io import FileIO
+import gzip
 import os
 from uuid import uuid4
 import shutil
 import hashlib
 from copy import copy
 from couchdbkit import ResourceConflict, ResourceNotFound
-from casexml.apps.phone.cache_utils import copy_payload_and_synclog_and_get_new_file
+from casexml.apps.phone.cache_utils import copy_payload_and_synclog_and_get_new_file, write_gzip_member, \
+    iter_gunzip
 from casexml.apps.phone.data_providers import get_restore_providers, get_long_running_providers
 from casexml.apps.phone.data_providers.case.load_testing import get_loadtest_factor
 from casexml.apps.phone.exceptions import (
     MissingSyncLog, InvalidSyncLogException, SyncLogUserMismatch,
     BadStateException, RestoreException,
 )
-from corehq.toggles import LOOSE_SYNC_TOKEN_VALIDATION, OWNERSHIP_CLEANLINESS_RESTORE
+from corehq.toggles import LOOSE_SYNC_TOKEN_VALIDATION, OWNERSHIP_CLEANLINESS_RESTORE, ASYNC_RESTORE
 from corehq.util.soft_assert import soft_assert
 from dimagi.utils.decorators.memoized import memoized
 from casexml.apps.phone.models import SyncLog, get_properly_wrapped_sync_log, LOG_FORMAT_SIMPLIFIED, \
@@ -24,6 +26,7 @@ from datetime import datetime, timedelta
 from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
 from couchforms.xml import (
     ResponseNature,
+    get_response_element,
     get_simple_response_xml,
 )
 from casexml.apps.case.xml import check_version, V1
@@ -31,6 +34,7 @@ from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from casexml.apps.phone.checksum import CaseStateHash
 from wsgiref.util import FileWrapper
+from soil import DownloadBase
 
 logger = logging.getLogger(__name__)
 
@@ -42,10 +46,20 @@ INITIAL_SYNC_CACHE_TIMEOUT = 60 * 60  # 1 hour
 # for rapid iteration on fixtures/cases/etc.
 INITIAL_SYNC_CACHE_THRESHOLD = 60  # 1 minute
 
+# how long (in seconds) a phone is asked to wait before polling an asynchronous restore again
+ASYNC_RESTORE_RETRY_AFTER = 5
+
+# how long the reference to a running asynchronous restore task sits around for (in seconds).
+ASYNC_RESTORE_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
 
 def stream_response(payload, headers=None):
+    """
+    :param payload: A file like object, or an iterator of strings
+    """
     try:
-        response = StreamingHttpResponse(FileWrapper(payload), content_type="text/xml")
+        content = FileWrapper(payload) if hasattr(payload, 'read') else payload
+        response = StreamingHttpResponse(content, content_type="text/xml")
         if headers:
             for header, value in headers.items():
                 response[header] = value
@@ -95,12 +109,15 @@ class RestoreResponse(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def write(self, content):
+        self.response_body.write(content)
+
     def append(self, xml_element):
         self.num_items += 1
         if isinstance(xml_element, basestring):
-            self.response_body.write(xml_element)
+            self.write(xml_element)
         else:
-            self.response_body.write(xml.tostring(xml_element))
+            self.write(xml.tostring(xml_element))
 
     def extend(self, iterable):
         for element in iterable:
@@ -120,15 +137,46 @@ class RestoreResponse(object):
 
 
 class FileRestoreResponse(RestoreResponse):
+    """
+    Restore response that is written to disk as it is generated.
+
+    If `compress` is set the response is gzip compressed as it is written. The
+    output is made up of multiple gzip members (which decompress to the
+    concatenation of their contents) so that the start tag, which can only be
+    written once all items are known, can be put in front of the body without
+    recompressing it. The first item (the sync element) is kept in a member of
+    its own so that cached payloads can have their restore ID swapped cheaply.
+    """
 
     BODY_TAG_SUFFIX = '-body'
     EXTENSION = 'xml'
 
-    def __init__(self, username=None, items=False):
+    def __init__(self, username=None, items=False, compress=False):
         super(FileRestoreResponse, self).__init__(username, items)
+        self.compress = compress
         self.filename = os.path.join(settings.SHARED_DRIVE_CONF.restore_dir, uuid4().hex)
 
         self.response_body = FileIO(self.get_filename(self.BODY_TAG_SUFFIX), 'w+')
+        self._gzip_member = None
+
+    def close(self):
+        self._end_gzip_member()
+        super(FileRestoreResponse, self).close()
+
+    def write(self, content):
+        if not self.compress:
+            return super(FileRestoreResponse, self).write(content)
+
+        if self._gzip_member is None:
+            self._gzip_member = gzip.GzipFile(filename='', mode='wb', fileobj=self.response_body)
+        self._gzip_member.write(content)
+        if self.num_items == 1:
+            self._end_gzip_member()
+
+    def _end_gzip_member(self):
+        if self._gzip_member is not None:
+            self._gzip_member.close()
+            self._gzip_member = None
 
     def get_filename(self, suffix=None):
         return "{filename}{suffix}.{ext}".format(
@@ -141,9 +189,14 @@ class FileRestoreResponse(RestoreResponse):
         if not isinstance(other, FileRestoreResponse):
             raise NotImplemented()
 
-        response = FileRestoreResponse(self.username, self.items)
+        if self.compress != other.compress:
+            raise ValueError("Can't combine compressed and uncompressed restore responses")
+
+        response = FileRestoreResponse(self.username, self.items, self.compress)
         response.num_items = self.num_items + other.num_items
 
+        self._end_gzip_member()
+        other._end_gzip_member()
         self.response_body.seek(0)
         other.response_body.seek(0)
 
@@ -156,10 +209,17 @@ class FileRestoreResponse(RestoreResponse):
         """
         Creates the final file with start and ending tag
         """
+        def _write(fileobj, content):
+            if self.compress:
+                write_gzip_member(fileobj, content)
+            else:
+                fileobj.write(content)
+
+        self._end_gzip_member()
         with open(self.get_filename(), 'w') as response:
             # Add 1 to num_items to account for message element
             items = self.items_template.format(self.num_items + 1) if self.items else ''
-            response.write(self.start_tag_template.format(
+            _write(response, self.start_tag_template.format(
                 items=items,
                 username=self.username,
                 nature=ResponseNature.OTA_RESTORE_SUCCESS
@@ -168,33 +228,40 @@ class FileRestoreResponse(RestoreResponse):
             self.response_body.seek(0)
             shutil.copyfileobj(self.response_body, response)
 
-            response.write(self.closing_tag)
-        
+            _write(response, self.closing_tag)
+
         self.finalized = True
         self.close()
 
     def get_cache_payload(self, full=False):
         return {
-            'data': self.get_filename() if not full else open(self.get_filename(), 'r')
+            'data': self.get_filename() if not full else open(self.get_filename(), 'r'),
+            'compressed': self.compress,
         }
 
     def as_string(self):
         with open(self.get_filename(), 'r') as f:
+            if self.compress:
+                return ''.join(iter_gunzip(f))
             return f.read()
 
     def get_http_response(self):
         headers = {'Content-Length': os.path.getsize(self.get_filename())}
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
         return stream_response(open(self.get_filename(), 'r'), headers)
 
 
 class CachedPayload(object):
 
-    def __init__(self, payload, is_initial):
+    def __init__(self, payload, is_initial, compressed=False):
         self.is_initial = is_initial
         self.payload = payload
         self.payload_path = None
+        self.compressed = compressed
         if isinstance(payload, dict):
             self.payload_path = payload['data']
+            self.compressed = payload.get('compressed', False)
             if os.path.exists(self.payload_path):
                 self.payload = open(self.payload_path, 'r')
             else:
@@ -207,6 +274,8 @@ class CachedPayload(object):
 
     def as_string(self):
         try:
+            if self.compressed:
+                return ''.join(iter_gunzip(self.payload))
             return self.payload.read()
         finally:
             self.payload.close()
@@ -226,7 +295,7 @@ class CachedPayload(object):
         # touch the same cases
         if self and self.is_initial:
             try:
-                file_reference = copy_payload_and_synclog_and_get_new_file(self.payload)
+                file_reference = copy_payload_and_synclog_and_get_new_file(self.payload, self.compressed)
                 self.payload = file_reference.file
                 self.payload_path = file_reference.path
             except Exception, e:
@@ -235,8 +304,14 @@ class CachedPayload(object):
 
 
 class CachedResponse(object):
-    def __init__(self, payload):
+    """
+    :param payload:         The CachedPayload to respond with
+    :param accepts_gzip:    Whether the client accepts gzip encoded responses. Compressed
+                            payloads are decompressed on the fly for clients that don't.
+    """
+    def __init__(self, payload, accepts_gzip=False):
         self.payload = payload
+        self.accepts_gzip = accepts_gzip
 
     def exists(self):
         return bool(self.payload)
@@ -245,13 +320,56 @@ class CachedResponse(object):
         return self.payload.as_string()
 
     def get_http_response(self):
+        if self.payload.compressed and not self.accepts_gzip:
+            return stream_response(iter_gunzip(self.payload.as_file()))
+
         headers = {}
         content_length = self.payload.get_content_length()
         if content_length is not None:
             headers['Content-Length'] = content_length
+        if self.payload.compressed:
+            headers['Content-Encoding'] = 'gzip'
         return stream_response(self.payload.as_file(), headers)
 
 
+class AsyncRestoreResponse(object):
+    """
+    Response returned while a restore payload is being generated by a celery task.
+
+    The phone is given a 202 with the progress of the task and is expected to poll
+    again after `ASYNC_RESTORE_RETRY_AFTER` seconds. Once the task is complete the
+    payload is cached and the next poll will stream it.
+    """
+
+    def __init__(self, task, username):
+        self.task = task
+        self.username = username
+
+    @property
+    def progress(self):
+        info = self.task.info if self.task.state == 'PROGRESS' else None
+        if isinstance(info, dict):
+            return info.get('current', 0), info.get('total', 0)
+        return 0, 0
+
+    def compile_response(self):
+        done, total = self.progress
+        root = get_response_element(
+            u'Asynchronous restore under way for {}'.format(self.username),
+            ResponseNature.OTA_RESTORE_PENDING
+        )
+        root.append(xml.get_progress_element(done, total, ASYNC_RESTORE_RETRY_AFTER))
+        return xml.tostring(root)
+
+    def as_string(self):
+        return self.compile_response()
+
+    def get_http_response(self):
+        response = HttpResponse(self.compile_response(), content_type="text/xml", status=202)
+        response['Retry-After'] = ASYNC_RESTORE_RETRY_AFTER
+        return response
+
+
 class RestoreParams(object):
     """
     Lightweight class that just handles grouping the possible attributes of a restore together.
@@ -263,15 +381,18 @@ class RestoreParams(object):
     :param state_hash:          The case state hash string to use to verify the state of the phone
     :param include_item_count:  Set to `True` to include the item count in the response
     :param force_restore_mode:  Set to `clean` or `legacy` to force a particular restore type.
+    :param compress:            Set to `True` if the client accepts gzip encoded responses.
+                                The response (and any payload cached from it) will be compressed.
     """
 
     def __init__(self, sync_log_id='', version=V1, state_hash='', include_item_count=False,
-                 force_restore_mode=None):
+                 force_restore_mode=None, compress=False):
         self.sync_log_id = sync_log_id
         self.version = version
         self.state_hash = state_hash
         self.include_item_count = include_item_count
         self.force_restore_mode = force_restore_mode
+        self.compress = compress
 
 
 class RestoreCacheSettings(object):
@@ -373,6 +494,13 @@ class RestoreState(object):
     def is_initial(self):
         return self.last_sync_log is None
 
+    def new_response(self, username=None, items=False):
+        """
+        Returns a new (empty) response for this restore. Data providers that build
+        partial responses should use this so that they can be combined.
+        """
+        return self.restore_class(username, items, compress=self.params.compress)
+
     @property
     def version(self):
         return self.params.version
@@ -455,9 +583,11 @@ class RestoreConfig(object):
     :param user:            The mobile user requesting the restore
     :param params:          The RestoreParams associated with this (see above).
     :param cache_settings:  The RestoreCacheSettings associated with this (see above).
+    :param is_async:        Set to `True` to generate the payload in a celery task and have the
+                            phone poll for it. Defaults to the `ASYNC_RESTORE` toggle for the domain.
     """
 
-    def __init__(self, project=None, user=None, params=None, cache_settings=None):
+    def __init__(self, project=None, user=None, params=None, cache_settings=None, is_async=None):
         self.project = project
         self.domain = project.name if project else ''
         self.user = user
@@ -472,6 +602,13 @@ class RestoreConfig(object):
         self.overwrite_cache = self.cache_settings.overwrite_cache
 
         self.cache = get_redis_default_cache()
+        self._is_async = is_async
+
+    @property
+    def is_async(self):
+        if self._is_async is not None:
+            return self._is_async
+        return ASYNC_RESTORE.enabled(self.domain)
 
     @property
     @memoized
@@ -499,21 +636,37 @@ class RestoreConfig(object):
         if cached_response.exists():
             return cached_response
 
+        if self.is_async:
+            return self._get_asynchronous_payload()
+
+        return self.generate_payload()
+
+    def generate_payload(self, task=None):
+        """
+        Generates the restore payload in process and caches it if necessary.
+
+        :param task:    The celery task generating this payload (if any), used to report progress.
+        """
         self.restore_state.start_sync()
 
-        with self.restore_state.restore_class(
+        normal_providers = get_restore_providers()
+        long_running_providers = get_long_running_providers()
+        total_providers = len(normal_providers) + len(long_running_providers)
+        DownloadBase.set_progress(task, 0, total_providers)
+
+        with self.restore_state.new_response(
                 self.user.username, items=self.params.include_item_count) as response:
-            normal_providers = get_restore_providers()
-            for provider in normal_providers:
+            for i, provider in enumerate(normal_providers):
                 for element in provider.get_elements(self.restore_state):
                     response.append(element)
+                DownloadBase.set_progress(task, i + 1, total_providers)
 
-            # in the future these will be done asynchronously so keep them separate
-            long_running_providers = get_long_running_providers()
-            for provider in long_running_providers:
+            # these are kept separate since they can also be run asynchronously
+            for i, provider in enumerate(long_running_providers, start=len(normal_providers)):
                 partial_response = provider.get_response(self.restore_state)
                 response = response + partial_response
                 partial_response.close()
+                DownloadBase.set_progress(task, i + 1, total_providers)
 
             response.finalize()
 
@@ -535,6 +688,36 @@ class RestoreConfig(object):
             return HttpResponse(response, content_type="text/xml",
                                 status=412)  # precondition failed
 
+    def _get_asynchronous_payload(self):
+        """
+        Kicks off (or checks in on) the celery task that generates this restore.
+
+        Progress of an existing task is reported back to the phone. If there is no task
+        running a new one is queued up and its ID stored so that later polls can find it.
+        """
+        from casexml.apps.phone.tasks import get_async_restore_payload
+
+        task_id = self.cache.get(self._async_cache_key())
+        task = get_async_restore_payload.AsyncResult(task_id) if task_id else None
+        if task is None or task.ready():
+            # either nothing is running or the last task finished without leaving a
+            # cached payload behind (e.g. it failed), so start again
+            # the payload is always cached so that the next poll from the phone can pick it up
+            cache_settings = RestoreCacheSettings(force_cache=True, cache_timeout=self.cache_timeout)
+            task = get_async_restore_payload.delay(self.project, self.user, self.params, cache_settings)
+            self.cache.set(self._async_cache_key(), task.id, ASYNC_RESTORE_CACHE_TIMEOUT)
+        return AsyncRestoreResponse(task, self.user.username)
+
+    def clear_async_task(self):
+        self.cache.delete(self._async_cache_key())
+
+    def _async_cache_key(self):
+        return hashlib.md5('async-restore-{user}-{sync_log_id}-{version}'.format(
+            user=self.user.user_id,
+            sync_log_id=self.params.sync_log_id or '',
+            version=self.version,
+        )).hexdigest()
+
     def _initial_cache_key(self):
         return hashlib.md5('ota-restore-{user}-{version}'.format(
             user=self.user.user_id,
@@ -546,12 +729,16 @@ class RestoreConfig(object):
             return CachedResponse(None)
 
         if self.sync_log:
-            payload = CachedPayload(self.sync_log.get_cached_payload(self.version, stream=True), is_initial=False)
+            payload = CachedPayload(
+                self.sync_log.get_cached_payload(self.version, stream=True),
+                is_initial=False,
+                compressed=self.sync_log.cached_payload_is_compressed(self.version),
+            )
         else:
             payload = CachedPayload(self.cache.get(self._initial_cache_key()), is_initial=True)
 
         payload.finalize()
-        return CachedResponse(payload)
+        return CachedResponse(payload, accepts_gzip=self.params.compress)
 
     def set_cached_payload_if_necessary(self, resp, duration):
         cache_payload = resp.get_cache_payload(bool(self.sync_log))
@@ -562,7 +749,7 @@ class RestoreConfig(object):
                 self.sync_log.last_cached = datetime.utcnow()
                 self.sync_log.hash_at_last_cached = str(self.sync_log.get_state_hash())
                 self.sync_log.save()
-                self.sync_log.set_cached_payload(data, self.version)
+                self.sync_log.set_cached_payload(data, self.version, compressed=cache_payload['compressed'])
                 try:
                     data.close()
                 except AttributeError:
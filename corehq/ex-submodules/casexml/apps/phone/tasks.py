@@ -1,6 +1,7 @@
 from celery.schedules import crontab
-from celery.task import periodic_task
+from celery.task import periodic_task, task
 from casexml.apps.phone.cleanliness import set_cleanliness_flags_for_enabled_domains
+from casexml.apps.phone.restore import RestoreConfig
 
 
 @periodic_task(run_every=crontab(hour="2", minute="0", day_of_week="1"),
@@ -22,3 +23,22 @@ def force_update_cleanliness_flags():
     # that there are no bugs in the weekly task.
     # If we haven't seen any issues by the end of 2015 (so 6 runs) we should remove this.
     set_cleanliness_flags_for_enabled_domains(force_full=True)
+
+
+@task
+def get_async_restore_payload(project, user, params, cache_settings):
+    """
+    Generate and cache the restore payload for a phone that is polling for an
+    asynchronous restore.
+    """
+    restore_config = RestoreConfig(
+        project=project,
+        user=user,
+        params=params,
+        cache_settings=cache_settings,
+        is_async=False,
+    )
+    try:
+        restore_config.generate_payload(task=get_async_restore_payload)
+    finally:
+        restore_config.clear_async_task()
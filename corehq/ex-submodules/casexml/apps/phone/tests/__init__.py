@@ -3,6 +3,7 @@ try:
     from .test_caching_utils import *
     from .test_cleanliness import *
     from .test_new_sync import *
+    from .test_incremental_restore_cache import *
     from .test_index_tree import *
     from .test_ota_restore import *
     from .test_ota_restore_v3 import *
@@ -1,14 +1,18 @@
+import gzip
 import os
 import tempfile
 import uuid
 from StringIO import StringIO
 from django.test import SimpleTestCase, TestCase
 from casexml.apps.phone.cache_utils import extract_synclog_id_from_filelike_payload, \
-    replace_sync_log_id_in_filelike_payload, copy_payload_and_synclog_and_get_new_file
+    replace_sync_log_id_in_filelike_payload, copy_payload_and_synclog_and_get_new_file, \
+    read_leading_gzip_members, replace_sync_log_id_in_gzipped_payload, iter_gunzip
 from casexml.apps.phone.exceptions import SyncLogCachingError
 from casexml.apps.phone.models import SimplifiedSyncLog, get_properly_wrapped_sync_log
+from casexml.apps.phone.restore import FileRestoreResponse
 from casexml.apps.phone.tests.dummy import dummy_restore_xml
 from casexml.apps.phone.tests.utils import synclog_id_from_restore_payload
+from casexml.apps.phone.xml import get_sync_element
 
 
 class CacheUtilsTest(SimpleTestCase):
@@ -76,3 +80,37 @@ class CacheUtilsDbTest(TestCase):
 
 def _restore_id_block(sync_id):
     return '<restore_id>{}</restore_id>'.format(sync_id)
+
+
+class CompressedPayloadTest(SimpleTestCase):
+
+    def _get_compressed_response(self, restore_id):
+        response = FileRestoreResponse('someuser', compress=True)
+        response.append(get_sync_element(restore_id))
+        response.append('<data>some more data</data>')
+        response.finalize()
+        return response
+
+    def test_compressed_response(self):
+        restore_id = uuid.uuid4().hex
+        response = self._get_compressed_response(restore_id)
+        payload = response.as_string()
+        self.assertTrue(payload.startswith('<OpenRosaResponse'))
+        self.assertIn(_restore_id_block(restore_id), payload)
+        self.assertTrue(payload.endswith('<data>some more data</data></OpenRosaResponse>'))
+        with open(response.get_filename(), 'r') as f:
+            self.assertEqual(payload, gzip.GzipFile(fileobj=f).read())
+
+    def test_replace_synclog_id_compressed(self):
+        initial_id = uuid.uuid4().hex
+        response = self._get_compressed_response(initial_id)
+        restore_payload = response.as_string()
+
+        new_id = uuid.uuid4().hex
+        with open(response.get_filename(), 'r') as f:
+            header, header_end = read_leading_gzip_members(f, '</restore_id>')
+            self.assertIn(_restore_id_block(initial_id), header)
+            file_reference = replace_sync_log_id_in_gzipped_payload(f, header, header_end, initial_id, new_id)
+
+        updated_payload = ''.join(iter_gunzip(file_reference.file))
+        self.assertEqual(updated_payload, restore_payload.replace(initial_id, new_id))
@@ -0,0 +1,40 @@
+from django.test.utils import override_settings
+from mock import patch
+from casexml.apps.case.mock import CaseStructure
+from casexml.apps.case.tests.util import assert_user_has_cases
+from casexml.apps.phone.data_providers.case.incremental_cache import IncrementalRestoreCache
+from casexml.apps.phone.restore import RestoreConfig
+from casexml.apps.phone.tests.test_sync_mode import USER_ID, SyncBaseTest
+from casexml.apps.phone.tests.utils import generate_restore_payload
+from corehq.toggles import INCREMENTAL_RESTORE_CACHE
+
+
+# only patch this toggle since other static toggles (e.g. async restores) change restore behavior
+@patch.object(INCREMENTAL_RESTORE_CACHE, 'enabled', new=lambda *args: True)
+@override_settings(TESTS_SHOULD_USE_CLEAN_RESTORE=True)
+class IncrementalRestoreCacheTest(SyncBaseTest):
+
+    def tearDown(self):
+        super(IncrementalRestoreCacheTest, self).tearDown()
+        restore_config = RestoreConfig(project=self.project, user=self.user)
+        fragment_cache = IncrementalRestoreCache(restore_config.restore_state)
+        fragment_cache.cache.delete(fragment_cache._manifest_key())
+
+    def _initial_restore_generating(self, case_ids):
+        with patch.object(IncrementalRestoreCache, 'get_case_xml',
+                          autospec=True, side_effect=IncrementalRestoreCache.get_case_xml) as get_case_xml:
+            payload = generate_restore_payload(self.project, self.user, overwrite_cache=True)
+        self.assertEqual(set(case_ids), {call[0][1].case_id for call in get_case_xml.call_args_list})
+        return payload
+
+    def test_only_modified_cases_regenerated(self):
+        case_ids = ['case_{}'.format(i) for i in range(5)]
+        self._createCaseStubs(case_ids, owner_id=USER_ID)
+        self._initial_restore_generating(case_ids)
+
+        self.factory.create_or_update_case(CaseStructure(case_id='case_0', attrs={'update': {'color': 'blue'}}))
+        payload = self._initial_restore_generating(['case_0'])
+        self.assertIn('<color>blue</color>', payload)
+        assert_user_has_cases(self, self.user, case_ids)
+
+        self._initial_restore_generating([])
@@ -7,7 +7,8 @@ from casexml.apps.phone.tests.utils import generate_restore_payload, get_restore
 from corehq.form_processor.interfaces import FormProcessorInterface
 from casexml.apps.case.tests.util import check_xml_line_by_line, delete_all_cases, delete_all_sync_logs, \
     delete_all_xforms
-from casexml.apps.phone.restore import RestoreConfig, RestoreState, RestoreParams, CachedResponse
+from casexml.apps.phone.restore import RestoreConfig, RestoreState, RestoreParams, CachedResponse, \
+    AsyncRestoreResponse, ASYNC_RESTORE_RETRY_AFTER
 from datetime import datetime, date
 from casexml.apps.phone.models import User, SyncLog
 from casexml.apps.phone import xml
@@ -116,6 +117,21 @@ class OtaRestoreTest(TestCase):
         self.assertNotEqual(restore_payload, restore_config_cached.get_payload().as_string())
         self.assertNotEqual(restore_payload, restore_config_overwrite.get_payload().as_string())
 
+    def testAsyncRestore(self):
+        restore_config = get_restore_config(self.project, dummy_user(), items=True)
+        restore_config._is_async = True
+        async_response = restore_config.get_payload()
+        self.assertIsInstance(async_response, AsyncRestoreResponse)
+        http_response = async_response.get_http_response()
+        self.assertEqual(202, http_response.status_code)
+        self.assertEqual(str(ASYNC_RESTORE_RETRY_AFTER), http_response['Retry-After'])
+
+        # celery runs eagerly in tests so the next poll should pick up the cached payload
+        restore_config_poll = get_restore_config(self.project, dummy_user(), items=True)
+        restore_config_poll._is_async = True
+        self.assertIsInstance(restore_config_poll.get_payload(), CachedResponse)
+        restore_config_poll.clear_async_task()
+
     def testUserRestoreWithCase(self):
         file_path = os.path.join(os.path.dirname(__file__),
                                  "data", "create_short.xml")
@@ -31,6 +31,19 @@ def get_sync_element(restore_id):
     return elem
 
 
+def get_progress_element(done, total, retry_after):
+    elem = safe_element("Sync")
+    elem.attrib = {"xmlns": SYNC_XMLNS}
+    progress = safe_element("progress")
+    progress.attrib = {
+        "done": str(done),
+        "total": str(total),
+        "retry-after": str(retry_after),
+    }
+    elem.append(progress)
+    return elem
+
+
 def get_case_element(case, updates, version=V1):
 
     check_version(version)
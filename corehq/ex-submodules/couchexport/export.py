@@ -1,3 +1,4 @@
+from collections import defaultdict
 import itertools
 from couchexport.exceptions import SchemaMismatchException,\
     UnsupportedExportFormat
@@ -27,7 +28,6 @@ class ExportConfiguration(object):
         self.previous_export = previous_export
         self.filter = filter
         self.timestamp = datetime.utcnow()
-        self.potentially_relevant_ids = self._potentially_relevant_ids()
         self.disable_checkpoints = disable_checkpoints
         self.cleanup_fn = cleanup_fn
 
@@ -59,7 +59,9 @@ class ExportConfiguration(object):
                         **get_schema_index_view_keys(self.schema_index)
                     ).all()])
 
-    def _potentially_relevant_ids(self):
+    @property
+    @memoized
+    def potentially_relevant_ids(self):
         return self.previous_export.get_new_ids() if self.previous_export \
             else self.all_doc_ids
 
@@ -276,8 +278,7 @@ def get_headers(schema, separator="|"):
 
 
 def get_formatted_rows(docs, schema, separator, include_headers=True):
-    return _format_tables(_create_intermediate_tables(docs, schema),
-                          separator=separator, include_headers=include_headers)
+    return SchemaFlattener(schema).get_formatted_rows(docs, separator, include_headers=include_headers)
 
 
 def _create_intermediate_tables(docs, schema):
@@ -294,52 +295,138 @@ def _create_intermediate_tables(docs, schema):
     }
 
     """
+    return {
+        table_name: {id: dict(zip(columns, values)) for id, values in rows}
+        for table_name, columns, rows in SchemaFlattener(schema).get_tables(docs)
+    }
+
+
+def _schema_mismatch(msg, doc):
+    return SchemaMismatchException("doc-schema mismatch: %s (%s)" % (msg, doc))
+
+
+class SchemaFlattener(object):
+    """
+    Turns docs into the rows of the export tables for a schema.
 
+    The schema is compiled once into a tree of nodes which walk each doc in a single
+    pass, appending cell values straight onto the row for the current table. This
+    gives the same rows as fitting the doc to the schema and then flattening it,
+    without copying the doc or sorting all of its leaves. Columns come out in sorted
+    order because the nodes visit the keys of each dict in sorted order.
+
+    Create one per export and reuse it for every doc.
+    """
     INT = '#'
 
-    def lookup(doc, keys):
-        for key in keys:
-            doc = doc[key]
-        return doc
+    def __init__(self, schema):
+        # table name -> column names, filled in as the schema is compiled
+        self.columns = defaultdict(list)
+        self.root = _ListNode(self, [schema], (), ())
 
-    def split_path(path):
-        table = []
-        column = []
-        id = []
-        for k in path:
-            if isinstance(k, basestring):
-                column.append(k)
+    def get_tables(self, docs):
+        """
+        Returns [(table_name, columns, [(row_id, values), ...]), ...] sorted by
+        table name, with the rows of each table sorted by id
+        """
+        rows = defaultdict(list)
+        self.root.flatten(docs, None, (), rows)
+        return [(table_name, self.columns[table_name], rows[table_name])
+                for table_name in sorted(rows)]
+
+    def get_formatted_rows(self, docs, separator, include_headers=True):
+        return [
+            _format_table(table_name, columns, rows, separator=separator,
+                          include_headers=include_headers)
+            for table_name, columns, rows in self.get_tables(docs)
+        ]
+
+
+class _LeafNode(object):
+
+    def __init__(self, flattener, schema, table_name, column):
+        self.schema = schema
+        flattener.columns[table_name].append(column)
+
+    def flatten(self, doc, values, row_id, rows):
+        if self.schema is None:
+            if doc:
+                raise _schema_mismatch("%s is not null" % doc, doc)
+            values.append(None)
+        elif self.schema == "string":
+            if not doc:
+                doc = ""
+            if not isinstance(doc, basestring):
+                doc = unicode(doc)
+            values.append(doc)
+        else:
+            values.append(None)
+
+    def flatten_missing(self, values):
+        values.append(scalar_never_was)
+
+
+class _DictNode(object):
+
+    def __init__(self, flattener, schema, table_name, column):
+        self.keys = set(schema)
+        self.children = [
+            (key, _compile_node(flattener, schema[key], table_name, column + (key,)))
+            for key in sorted(schema)
+        ]
+
+    def flatten(self, doc, values, row_id, rows):
+        if not doc:
+            doc = {}
+        if not isinstance(doc, dict):
+            doc = {'': doc}
+        extra_keys = set(doc) - self.keys
+        if extra_keys:
+            raise _schema_mismatch("doc has keys not in schema: '%s'" % ("', '".join(extra_keys)), doc)
+        for key, node in self.children:
+            if key in doc:
+                node.flatten(doc[key], values, row_id, rows)
             else:
-                table.extend(column)
-                table.append(INT)
-                column = []
-                id.append(k)
-        return (tuple(table), tuple(column), tuple(id))
-
-    schema = [schema]
-    docs = fit_to_schema(docs, schema)
-    # first, flatten documents
-    queue = [()]
-    leaves = []
-    while queue:
-        path = queue.pop()
-        d = lookup(docs, path)
-        if isinstance(d, dict):
-            for key in d:
-                queue.append(path + (key,))
-        elif isinstance(d, list):
-            for i, _ in enumerate(d):
-                queue.append(path + (i,))
-        elif d != list_never_was:
-            leaves.append((split_path(path), d))
-    leaves.sort()
-    tables = {}
-    for (table_name, column_name, id), val in leaves:
-        table = tables.setdefault(table_name, {})
-        row = table.setdefault(id, {})
-        row[column_name] = val
-
-    return tables
+                node.flatten_missing(values)
+
+    def flatten_missing(self, values):
+        for _, node in self.children:
+            node.flatten_missing(values)
+
+
+class _ListNode(object):
+
+    def __init__(self, flattener, schema, table_name, column):
+        item_schema, = schema
+        self.table_name = table_name + column + (SchemaFlattener.INT,)
+        self.columns = flattener.columns[self.table_name]
+        self.item = _compile_node(flattener, item_schema, self.table_name, ())
+
+    def flatten(self, doc, values, row_id, rows):
+        if not doc:
+            doc = []
+        if not isinstance(doc, list):
+            doc = [doc]
+        for i, item in enumerate(doc):
+            item_id = row_id + (i,)
+            item_values = []
+            # tables without any columns (e.g. lists of lists) don't get rows
+            if self.columns:
+                rows[self.table_name].append((item_id, item_values))
+            self.item.flatten(item, item_values, item_id, rows)
+
+    def flatten_missing(self, values):
+        # a missing list has no rows and no columns in the parent table
+        pass
+
+
+def _compile_node(flattener, schema, table_name, column):
+    if isinstance(schema, list):
+        return _ListNode(flattener, schema, table_name, column)
+    elif isinstance(schema, dict):
+        return _DictNode(flattener, schema, table_name, column)
+    else:
+        return _LeafNode(flattener, schema, table_name, column)
 
 
 class FormattedRow(object):
@@ -429,27 +516,35 @@ def _format_tables(tables, id_label='id', separator='.', include_headers=True,
     ]
 
     """
-    answ = []
     assert include_data or include_headers, "This method is pretty useless if you don't include anything!"
 
+    answ = []
     for table_name, table in sorted(tables.items()):
-        new_table = []
         keys = sorted(table.items()[0][1].keys()) # the keys for every row are the same
-
-        if include_headers:
-            id_key = [id_label]
-            id_len = len(table.keys()[0]) # this is a proxy for the complexity of the ID
-            if id_len > 1:
-                id_key += ["{id}__{count}".format(id=id_label, count=i) \
-                           for i in range(id_len)]
-            header_vals = [separator.join(key) for key in keys]
-            new_table.append(FormattedRow(header_vals, id_key, separator,
-                                          is_header_row=True))
-
-        if include_data:
-            for id, row in sorted(table.items()):
-                values = [row[key] for key in keys]
-                new_table.append(FormattedRow(values, id, separator))
-
-        answ.append((separator.join(table_name), new_table))
+        rows = sorted((id, [row[key] for key in keys]) for id, row in table.items())
+        answ.append(_format_table(table_name, keys, rows, id_label, separator,
+                                  include_headers, include_data))
     return answ
+
+
+def _format_table(table_name, keys, rows, id_label='id', separator='.',
+                  include_headers=True, include_data=True):
+    """
+    rows is a list of (id, values) sorted by id, with the values in the order of keys
+    """
+    new_table = []
+    if include_headers:
+        id_key = [id_label]
+        id_len = len(rows[0][0]) # this is a proxy for the complexity of the ID
+        if id_len > 1:
+            id_key += ["{id}__{count}".format(id=id_label, count=i) \
+                       for i in range(id_len)]
+        header_vals = [separator.join(key) for key in keys]
+        new_table.append(FormattedRow(header_vals, id_key, separator,
+                                      is_header_row=True))
+
+    if include_data:
+        for id, values in rows:
+            new_table.append(FormattedRow(values, id, separator))
+
+    return separator.join(table_name), new_table
@@ -5,6 +5,7 @@ from itertools import islice
 import os
 import tempfile
 from urllib2 import URLError
+import uuid
 from dimagi.ext.couchdbkit import Document, DictProperty,\
     DocumentSchema, StringProperty, SchemaListProperty, ListProperty,\
     StringListProperty, DateTimeProperty, SchemaProperty, BooleanProperty, IntegerProperty
@@ -14,7 +15,7 @@ from couchexport.exceptions import CustomExportValidationError
 from couchexport.files import ExportFiles
 from couchexport.transforms import identity
 from couchexport.util import SerializableFunctionProperty,\
-    get_schema_index_view_keys, force_tag_to_list
+    get_schema_index_view_keys, force_tag_to_list, default_cleanup
 from dimagi.utils.decorators.memoized import memoized
 from dimagi.utils.mixins import UnicodeMixIn
 from dimagi.utils.couch.database import get_db, iter_docs
@@ -111,6 +112,9 @@ class ExportSchema(Document, UnicodeMixIn):
     index = JsonProperty()
     schema = DictProperty()
     timestamp = TimeStampProperty()
+    # a checkpoint that is brought up to date in place by update_schema_checkpoint,
+    # rather than one made by an export, which downloads refer back to by id
+    rolling = BooleanProperty(default=False)
 
     def __unicode__(self):
         return "%s: %s" % (json.dumps(self.index), self.timestamp)
@@ -466,15 +470,32 @@ class BaseSavedExportSchema(Document):
     def is_bulk(self):
         return False
 
-    def export_data_async(self, format=None, **kwargs):
+    def export_data_async(self, format=None, parallel=False, **kwargs):
+        """
+        Builds the export in a celery task. With `parallel` the docs are split into chunks
+        that are exported by separate tasks, which requires `get_partial_export`.
+        """
         format = format or self.default_format
         download = DownloadBase()
-        download.set_task(couchexport.tasks.export_async.delay(
-            self,
-            download.download_id,
-            format=format,
-            **kwargs
-        ))
+        if parallel:
+            # the download tracks the task that merges the chunks, which has to be
+            # set before the export starts so that it isn't overwritten
+            merge_task_id = uuid.uuid4().hex
+            download.set_task(couchexport.tasks.merge_export_chunks.AsyncResult(merge_task_id))
+            couchexport.tasks.parallel_export_async.delay(
+                self,
+                download.download_id,
+                merge_task_id,
+                format=format,
+                **kwargs
+            )
+        else:
+            download.set_task(couchexport.tasks.export_async.delay(
+                self,
+                download.download_id,
+                format=format,
+                **kwargs
+            ))
         return download.get_start_response()
 
     @property
@@ -520,7 +541,7 @@ class DefaultExportSchema(BaseSavedExportSchema):
                          use_cache=True, max_column_size=2000, separator='|', process=None, **kwargs):
         # the APIs of how these methods are broken down suck, but at least
         # it's DRY
-        from couchexport.export import get_writer, get_export_components, get_headers, get_formatted_rows
+        from couchexport.export import get_writer, get_export_components, get_headers, SchemaFlattener
         from django.core.cache import cache
         import hashlib
 
@@ -553,6 +574,7 @@ class DefaultExportSchema(BaseSavedExportSchema):
                 formatted_headers = self.remap_tables(get_headers(updated_schema, separator=separator))
                 writer.open(formatted_headers, tmp, max_column_size=max_column_size)
 
+                flattener = SchemaFlattener(updated_schema)
                 total_docs = len(config.potentially_relevant_ids)
                 if process:
                     DownloadBase.set_progress(process, 0, total_docs)
@@ -560,9 +582,8 @@ class DefaultExportSchema(BaseSavedExportSchema):
                     if self.transform:
                         doc = self.transform(doc)
 
-                    writer.write(self.remap_tables(get_formatted_rows(
-                        doc, updated_schema, include_headers=False,
-                        separator=separator)))
+                    writer.write(self.remap_tables(flattener.get_formatted_rows(
+                        doc, include_headers=False, separator=separator)))
                     if process:
                         DownloadBase.set_progress(process, i + 1, total_docs)
                 writer.close()
@@ -706,43 +727,25 @@ class SavedExportSchema(BaseSavedExportSchema, UnicodeMixIn):
 
     def get_export_files(self, format=None, previous_export=None, filter=None, process=None, max_column_size=None,
                          apply_transforms=True, limit=0, **kwargs):
-        from couchexport.export import get_writer, get_formatted_rows
+        from couchexport.export import SchemaFlattener
         if not format:
             format = self.default_format or Format.XLS_2007
 
         config, updated_schema, export_schema_checkpoint = self.get_export_components(previous_export, filter)
 
         # transform docs onto output and save
-        writer = get_writer(format)
-
-        # open the doc and the headers
-        formatted_headers = list(self.get_table_headers())
         fd, path = tempfile.mkstemp()
         with os.fdopen(fd, 'wb') as tmp:
-            writer.open(
-                formatted_headers,
-                tmp,
-                max_column_size=max_column_size,
-                table_titles=dict([
-                    (table.index, table.display)
-                    for table in self.tables if table.display
-                ])
-            )
+            writer = self.open_export_writer(format, tmp, max_column_size=max_column_size)
 
+            flattener = SchemaFlattener(updated_schema)
             total_docs = len(config.potentially_relevant_ids)
             if process:
                 DownloadBase.set_progress(process, 0, total_docs)
             for i, doc in config.enum_docs():
                 if limit and i > limit:
                     break
-                if self.transform and apply_transforms:
-                    doc = self.transform(doc)
-                formatted_tables = self.trim(
-                    get_formatted_rows(doc, updated_schema, separator="."),
-                    doc,
-                    apply_transforms=apply_transforms
-                )
-                writer.write(formatted_tables)
+                writer.write(self._get_doc_tables(doc, flattener, apply_transforms))
                 if process:
                     DownloadBase.set_progress(process, i + 1, total_docs)
 
@@ -750,6 +753,49 @@ class SavedExportSchema(BaseSavedExportSchema, UnicodeMixIn):
 
         return ExportFiles(path, export_schema_checkpoint, format)
 
+    def open_export_writer(self, format, file, max_column_size=None):
+        """
+        Returns a writer for the format that has been opened with the headers of this export
+        """
+        from couchexport.export import get_writer
+        writer = get_writer(format)
+        writer.open(
+            list(self.get_table_headers()),
+            file,
+            max_column_size=max_column_size,
+            table_titles=dict([
+                (table.index, table.display)
+                for table in self.tables if table.display
+            ])
+        )
+        return writer
+
+    def get_partial_export(self, schema, doc_ids, filter=None, apply_transforms=True):
+        """
+        Writes the rows for the docs in `doc_ids` with a PartialExportWriter and returns
+        its `partial_export`. Used to export chunks of docs in parallel.
+        """
+        from couchexport.export import SchemaFlattener
+        from couchexport.writers import PartialExportWriter
+        filter = self.filter & filter
+        flattener = SchemaFlattener(schema)
+        writer = PartialExportWriter()
+        writer.open_partial()
+        for doc in iter_docs(get_db(), doc_ids):
+            if not filter or filter(doc):
+                writer.write(self._get_doc_tables(default_cleanup(doc), flattener, apply_transforms))
+        writer.close()
+        return writer.partial_export
+
+    def _get_doc_tables(self, doc, flattener, apply_transforms=True):
+        if self.transform and apply_transforms:
+            doc = self.transform(doc)
+        return self.trim(
+            flattener.get_formatted_rows(doc, separator="."),
+            doc,
+            apply_transforms=apply_transforms
+        )
+
     def download_data(self, format="", previous_export=None, filter=None, limit=0):
         """
         If there is data, return an HTTPResponse with the appropriate data.
@@ -20,6 +20,41 @@ def build_latest_schema(schema_index):
     return updated_checkpoint
 
 
+def update_schema_checkpoint(db, index):
+    """
+    Extends the schema of the index's last checkpoint with the docs submitted since
+    it was taken. Returns the checkpoint, or None if the index has no checkpoint yet.
+
+    Checkpoints made by exports are left as they are, since downloads use them
+    to find the docs submitted after them. Instead a single rolling checkpoint per
+    index is updated in place, and any it supersedes are deleted.
+    """
+    from couchexport.export import ExportConfiguration
+    last_checkpoint = ExportSchema.last(index)
+    if not last_checkpoint or not last_checkpoint.timestamp:
+        return None
+    config = ExportConfiguration(db, index, previous_export=last_checkpoint)
+    schema = config.get_latest_schema()
+    if last_checkpoint.rolling:
+        last_checkpoint.schema = schema
+        last_checkpoint.timestamp = config.timestamp
+        last_checkpoint.save()
+        return last_checkpoint
+
+    old_checkpoints = [checkpoint for checkpoint in ExportSchema.get_all_checkpoints(index)
+                       if checkpoint.rolling]
+    checkpoint = ExportSchema(
+        schema=schema,
+        timestamp=config.timestamp,
+        index=config.schema_index,
+        rolling=True,
+    )
+    checkpoint.save()
+    if old_checkpoints:
+        ExportSchema.get_db().bulk_delete(old_checkpoints)
+    return checkpoint
+
+
 def get_kind(doc):
     if doc == "" or doc is None:
         return "null"
@@ -1,4 +1,6 @@
+from celery import chord
 from celery.utils.log import get_task_logger
+from django.core.cache import cache
 from unidecode import unidecode
 from celery.task import task
 import zipfile
@@ -6,27 +8,23 @@ from couchexport.files import Temp
 from couchexport.models import Format, ExportSchema, GroupExportConfiguration
 import tempfile
 import os
+from soil import DownloadBase
 from soil.util import expose_cached_download
 from couchexport.export import SchemaMismatchException, ExportConfiguration
 
 logging = get_task_logger(__name__)
 
+# number of docs exported by each task of a parallel export
+EXPORT_CHUNK_SIZE = 5000
+# how long the rows of each chunk are kept around waiting for the other chunks
+EXPORT_CHUNK_TIMEOUT = 24 * 60 * 60
+
 @task
 def export_async(custom_export, download_id, format=None, filename=None, **kwargs):
     try:
         export_files = custom_export.get_export_files(format=format, process=export_async, **kwargs)
     except SchemaMismatchException, e:
-        # fire off a delayed force update to prevent this from happening again
-        rebuild_schemas.delay(custom_export.index)
-        expiry = 10*60*60
-        expose_cached_download(
-            "Sorry, the export failed for %s, please try again later" % custom_export._id,
-            expiry,
-            None,
-            content_disposition="",
-            mimetype="text/html",
-            download_id=download_id
-        ).save(expiry)
+        _handle_schema_mismatch(custom_export, download_id)
     else:
         if export_files:
             if export_files.format is not None:
@@ -38,6 +36,119 @@ def export_async(custom_export, download_id, format=None, filename=None, **kwarg
             return cache_file_to_be_served(None, None, download_id, format, filename)
 
 
+def _handle_schema_mismatch(custom_export, download_id):
+    # fire off a delayed force update to prevent this from happening again
+    rebuild_schemas.delay(custom_export.index)
+    expiry = 10*60*60
+    expose_cached_download(
+        "Sorry, the export failed for %s, please try again later" % custom_export._id,
+        expiry,
+        None,
+        content_disposition="",
+        mimetype="text/html",
+        download_id=download_id
+    ).save(expiry)
+
+
+@task
+def parallel_export_async(custom_export, download_id, merge_task_id, format=None, filename=None,
+                          previous_export=None, filter=None, max_column_size=None, apply_transforms=True,
+                          chunk_size=EXPORT_CHUNK_SIZE, **kwargs):
+    """
+    Like export_async, but the docs are split into chunks that are exported by
+    separate `export_chunk` tasks. Once they are all done `merge_export_chunks`
+    combines them into the final file. Progress is reported on the merge task,
+    whose id is `merge_task_id`, so that is the task the download should track.
+    """
+    format = format or custom_export.default_format or Format.XLS_2007
+    config, schema, checkpoint = custom_export.get_export_components(previous_export, filter)
+    doc_ids = sorted(config.potentially_relevant_ids) if config else []
+
+    cache.set(_progress_key(merge_task_id), 0, EXPORT_CHUNK_TIMEOUT)
+
+    merge = merge_export_chunks.s(
+        custom_export, checkpoint.get_id if checkpoint else None, download_id, format, filename,
+        max_column_size=max_column_size,
+    ).set(task_id=merge_task_id)
+    if not doc_ids:
+        merge.delay([])
+        return
+
+    chord(
+        export_chunk.s(custom_export, schema, doc_ids[start:start + chunk_size], start,
+                       merge_task_id, len(doc_ids), filter=filter, apply_transforms=apply_transforms)
+        for start in range(0, len(doc_ids), chunk_size)
+    )(merge)
+
+
+@task
+def export_chunk(custom_export, schema, doc_ids, start, merge_task_id, total_docs,
+                 filter=None, apply_transforms=True):
+    """
+    Exports the rows for one chunk of a parallel export, returning the cache key they were saved to,
+    or None if a doc didn't match the export's schema
+    """
+    try:
+        partial_export = custom_export.get_partial_export(
+            schema, doc_ids, filter=filter, apply_transforms=apply_transforms
+        )
+    except SchemaMismatchException:
+        # the merge task handles this, so that the schemas are only rebuilt once
+        key = None
+    else:
+        key = '{}-chunk-{}'.format(merge_task_id, start)
+        cache.set(key, partial_export, EXPORT_CHUNK_TIMEOUT)
+
+    docs_done = cache.incr(_progress_key(merge_task_id), len(doc_ids))
+    DownloadBase.set_progress(_TaskProgress(merge_export_chunks, merge_task_id), docs_done, total_docs)
+    return key
+
+
+@task
+def merge_export_chunks(chunk_keys, custom_export, checkpoint_id, download_id, format, filename,
+                        max_column_size=None):
+    """
+    Combines the chunks of a parallel export, in order, into the final file
+    """
+    if not chunk_keys:
+        return cache_file_to_be_served(None, None, download_id, format, filename)
+    if None in chunk_keys:
+        cache.delete_many([key for key in chunk_keys if key is not None])
+        _handle_schema_mismatch(custom_export, download_id)
+        return
+
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as tmp:
+        writer = custom_export.open_export_writer(format, tmp, max_column_size=max_column_size)
+        for key in chunk_keys:
+            partial_export = cache.get(key)
+            if partial_export is None:
+                raise Exception("Export chunk {} has expired".format(key))
+            writer.write_partial_export(partial_export)
+            cache.delete(key)
+        writer.close()
+
+    checkpoint = ExportSchema.get(checkpoint_id)
+    return cache_file_to_be_served(Temp(path), checkpoint, download_id, format, filename or custom_export.name)
+
+
+def _progress_key(merge_task_id):
+    return '{}-progress'.format(merge_task_id)
+
+
+class _TaskProgress(object):
+    """
+    Lets DownloadBase.set_progress update the state of a task other than the current one
+    """
+
+    def __init__(self, task, task_id):
+        self.task = task
+        self.task_id = task_id
+
+    def update_state(self, state, meta):
+        self.task.update_state(task_id=self.task_id, state=state, meta=meta)
+
+
 @task
 def rebuild_schemas(index):
     """
@@ -2,6 +2,7 @@ from .test_cleanup import *
 from .test_raw import *
 from .test_saved import *
 from .test_schema import *
+from .test_tasks import *
 from .test_transforms import *
 from .test_writers import *
 from couchexport.properties import parse_date_string
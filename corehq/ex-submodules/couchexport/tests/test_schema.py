@@ -1,9 +1,10 @@
 from couchdbkit.ext.django.loading import get_db
 from django.test import TestCase, SimpleTestCase
-from couchexport.export import SCALAR_NEVER_WAS
+from couchexport.export import SCALAR_NEVER_WAS, SchemaFlattener, SchemaMismatchException, scalar_never_was
 from couchexport.models import ExportSchema, SavedExportSchema, SplitColumn
+from couchexport.schema import update_schema_checkpoint
 from datetime import datetime, timedelta
-from couchexport.util import SerializableFunction
+from couchexport.util import SerializableFunction, get_export_index
 from dimagi.utils.couch.database import get_safe_write_kwargs
 import json
 from couchexport.models import Format
@@ -43,6 +44,98 @@ class ExportSchemaTest(TestCase):
             self.assertEqual(schema2._id, ExportSchema.last(index)._id)
 
 
+class UpdateSchemaCheckpointTest(TestCase):
+    index = ['update-checkpoint-domain', 'http://update-checkpoint']
+
+    def tearDown(self):
+        ExportSchema.get_db().bulk_delete(list(ExportSchema.get_all_checkpoints(self.index)))
+
+    def _make_export_checkpoint(self, timestamp):
+        checkpoint = ExportSchema(index=self.index, timestamp=timestamp, schema={'form': {'q': 'string'}})
+        checkpoint.save()
+        return checkpoint
+
+    def _checkpoint_ids(self):
+        return sorted(checkpoint._id for checkpoint in ExportSchema.get_all_checkpoints(self.index))
+
+    def test_no_checkpoint(self):
+        self.assertIsNone(update_schema_checkpoint(ExportSchema.get_db(), self.index))
+        self.assertEqual([], self._checkpoint_ids())
+
+    def test_rolling_checkpoint(self):
+        db = ExportSchema.get_db()
+        export_checkpoint = self._make_export_checkpoint(datetime.utcnow() - timedelta(days=1))
+
+        rolling = update_schema_checkpoint(db, self.index)
+        self.assertTrue(rolling.rolling)
+        self.assertEqual(export_checkpoint.schema, rolling.schema)
+        self.assertEqual(rolling._id, ExportSchema.last(self.index)._id)
+        self.assertEqual(sorted([export_checkpoint._id, rolling._id]), self._checkpoint_ids())
+
+        # the rolling checkpoint is reused
+        updated = update_schema_checkpoint(db, self.index)
+        self.assertEqual(rolling._id, updated._id)
+        self.assertTrue(updated.timestamp > rolling.timestamp)
+        self.assertEqual(sorted([export_checkpoint._id, rolling._id]), self._checkpoint_ids())
+
+        # an export's checkpoint is left alone
+        self.assertEqual(export_checkpoint.timestamp, ExportSchema.get(export_checkpoint._id).timestamp)
+
+    def test_superseded_rolling_checkpoint_deleted(self):
+        db = ExportSchema.get_db()
+        first_export = self._make_export_checkpoint(datetime.utcnow() - timedelta(days=1))
+        old_rolling = update_schema_checkpoint(db, self.index)
+        second_export = self._make_export_checkpoint(datetime.utcnow())
+
+        rolling = update_schema_checkpoint(db, self.index)
+        self.assertNotEqual(old_rolling._id, rolling._id)
+        self.assertEqual(sorted([first_export._id, second_export._id, rolling._id]), self._checkpoint_ids())
+
+
+class GetExportIndexTest(SimpleTestCase):
+
+    def test_string_tag(self):
+        self.assertEqual('http://x', get_export_index({'#export_tag': 'xmlns', 'xmlns': 'http://x'}))
+
+    def test_list_tag(self):
+        doc = {'#export_tag': ['domain', 'xmlns'], 'domain': 'd', 'xmlns': 'http://x'}
+        self.assertEqual(['d', 'http://x'], get_export_index(doc))
+
+    def test_untagged(self):
+        self.assertEqual(None, get_export_index({'xmlns': 'http://x'}))
+
+
+class SchemaFlattenerTest(SimpleTestCase):
+    schema = {'name': 'string', 'children': [{'age': 'string', 'toys': ['string']}], 'empty': ['string']}
+
+    def _get_rows(self, doc):
+        return [
+            (name, [(row.id, list(row.data)) for row in rows])
+            for name, rows in SchemaFlattener(self.schema).get_formatted_rows(doc, separator='.')
+        ]
+
+    def test_flatten(self):
+        doc = {'name': 'a', 'children': [{'age': 3, 'toys': ['x', 'y']}, {'toys': 'z'}]}
+        self.assertEqual([
+            ('#', [(['id'], ['name']), ((0,), ['a'])]),
+            ('#.children.#', [
+                (['id', 'id__0', 'id__1'], ['age']),
+                ((0, 0), ['3']),
+                ((0, 1), [scalar_never_was]),
+            ]),
+            ('#.children.#.toys.#', [
+                (['id', 'id__0', 'id__1', 'id__2'], ['']),
+                ((0, 0, 0), ['x']),
+                ((0, 0, 1), ['y']),
+                ((0, 1, 0), ['z']),
+            ]),
+        ], self._get_rows(doc))
+
+    def test_mismatch(self):
+        with self.assertRaises(SchemaMismatchException):
+            self._get_rows({'name': 'a', 'surprise': 'b'})
+
+
 class SavedSchemaTest(TestCase):
     def setUp(self):
         self.db = get_db('couchexport')
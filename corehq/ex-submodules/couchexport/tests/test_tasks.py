@@ -0,0 +1,101 @@
+from codecs import BOM_UTF8
+from datetime import datetime
+import json
+from django.core.cache import cache
+from django.test import TestCase
+from mock import patch, Mock
+from couchexport.export import FormattedRow, SchemaMismatchException, get_writer
+from couchexport.models import ExportSchema, Format, SavedExportSchema
+from couchexport.tasks import _progress_key
+from couchexport.writers import PartialExportWriter
+from soil import DownloadBase
+
+INDEX = ['parallel-export-domain', 'http://parallel-export']
+MISMATCHED_DOC = 'mismatched'
+CHUNK_SIZE = 2
+
+
+class ParallelExportTest(TestCase):
+    """
+    Runs parallel exports with eager celery, with the export's couch lookups patched out
+    """
+
+    def setUp(self):
+        self.checkpoint = ExportSchema(index=INDEX, timestamp=datetime.utcnow(), schema={})
+        self.checkpoint.save()
+        self.export = SavedExportSchema(_id='parallel-export', index=INDEX, name='parallel export')
+        self.doc_ids = ['a', 'b', 'c', 'd', 'e']
+        self.patches = [
+            patch.object(SavedExportSchema, 'get_export_components', self._get_export_components),
+            patch.object(SavedExportSchema, 'get_partial_export', self._get_partial_export),
+            patch.object(SavedExportSchema, 'open_export_writer', self._open_export_writer),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.checkpoint.delete()
+
+    def _get_export_components(self, previous_export_id=None, filter=None):
+        return Mock(potentially_relevant_ids=self.doc_ids), {}, self.checkpoint
+
+    def _get_partial_export(self, schema, doc_ids, filter=None, apply_transforms=True):
+        if MISMATCHED_DOC in doc_ids:
+            raise SchemaMismatchException()
+        writer = PartialExportWriter()
+        writer.open_partial()
+        for doc_id in doc_ids:
+            writer.write([('t', [FormattedRow([doc_id], (0,))])])
+        writer.close()
+        return writer.partial_export
+
+    def _open_export_writer(self, format, file, max_column_size=None):
+        writer = get_writer(format)
+        writer.open([('t', [FormattedRow(['doc'], ['id'], is_header_row=True)])], file)
+        return writer
+
+    def _export(self):
+        response = self.export.export_data_async(format=Format.UNZIPPED_CSV, parallel=True,
+                                                 chunk_size=CHUNK_SIZE)
+        return json.loads(response.content)['download_id']
+
+    def _get_download_content(self, download_id):
+        download = DownloadBase.get(download_id)
+        return download.get_content() if download else None
+
+    def _chunk_keys(self, download_id):
+        task_id = DownloadBase(download_id=download_id).task_id
+        return ['{}-chunk-{}'.format(task_id, start) for start in range(0, len(self.doc_ids), CHUNK_SIZE)]
+
+    def test_parallel_export(self):
+        download_id = self._export()
+        self.assertEqual(
+            BOM_UTF8 + 'id,doc\r\n0,a\r\n1,b\r\n2,c\r\n3,d\r\n4,e\r\n',
+            self._get_download_content(download_id)
+        )
+        # the download tracks the progress of the merge task
+        task_id = DownloadBase(download_id=download_id).task_id
+        self.assertEqual(len(self.doc_ids), cache.get(_progress_key(task_id)))
+        self.assertEqual({}, cache.get_many(self._chunk_keys(download_id)))
+
+    def test_no_docs(self):
+        self.doc_ids = []
+        download_id = self._export()
+        self.assertEqual("Sorry, there wasn't any data.", self._get_download_content(download_id))
+
+    @patch('couchexport.tasks.rebuild_schemas')
+    def test_schema_mismatch(self, rebuild_schemas):
+        self.doc_ids = ['a', 'b', MISMATCHED_DOC, 'd', 'e']
+        download_id = self._export()
+        self.assertIn('please try again later', self._get_download_content(download_id))
+        rebuild_schemas.delay.assert_called_once_with(INDEX)
+        self.assertEqual({}, cache.get_many(self._chunk_keys(download_id)))
+
+    def test_chunk_expired(self):
+        with patch('couchexport.tasks.cache', Mock(wraps=cache)) as tasks_cache:
+            tasks_cache.get.return_value = None
+            download_id = self._export()
+        # the merge task fails without serving a download
+        self.assertIsNone(DownloadBase.get(download_id))
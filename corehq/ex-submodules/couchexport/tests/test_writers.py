@@ -1,6 +1,9 @@
 # coding: utf-8
 from codecs import BOM_UTF8
-from couchexport.writers import ZippedExportWriter, CsvFileWriter
+from StringIO import StringIO
+from couchexport.export import FormattedRow
+from couchexport.writers import ZippedExportWriter, CsvFileWriter, PartialExportWriter, \
+    InMemoryExportWriter, UnzippedCsvExportWriter
 from django.test import SimpleTestCase
 from mock import patch, Mock
 
@@ -48,3 +51,68 @@ class CsvFileWriterTests(SimpleTestCase):
         writer.finish()
         file_start = writer.get_file().read(6)
         self.assertEqual(file_start, BOM_UTF8 + 'ham')
+
+
+class PartialExportWriterTests(SimpleTestCase):
+    headers = [('t', [FormattedRow(['name'], ['id'], is_header_row=True)])]
+
+    def _get_partial_export(self, names):
+        writer = PartialExportWriter()
+        writer.open_partial()
+        for name in names:
+            writer.write([('t', [FormattedRow([name], (0,))])])
+        writer.close()
+        return writer.partial_export
+
+    def _merge(self, writer):
+        writer.open(self.headers, StringIO())
+        writer.write_partial_export(self._get_partial_export([u'ひ', 'b']))
+        writer.write_partial_export(self._get_partial_export(['c']))
+
+    def test_merge(self):
+        writer = InMemoryExportWriter()
+        self._merge(writer)
+        self.assertEqual(
+            [['id', 'name'], ['0', 'ひ'], ['1', 'b'], ['2', 'c']],
+            writer.tables['t']
+        )
+
+    def test_merge_csv(self):
+        writer = UnzippedCsvExportWriter()
+        self._merge(writer)
+        writer.close()
+        self.assertEqual(BOM_UTF8 + 'id,name\r\n0,ひ\r\n1,b\r\n2,c\r\n', writer.file.getvalue())
+
+    def test_merge_compound_ids(self):
+        headers = [
+            ('t', [FormattedRow(['name'], ['id'], is_header_row=True)]),
+            ('c', [FormattedRow(['child'], ['id', 'parent', 'index'], id_index=1, is_header_row=True)]),
+        ]
+
+        def _get_partial_export(names):
+            writer = PartialExportWriter()
+            writer.open_partial()
+            for name in names:
+                writer.write([
+                    ('t', [FormattedRow([name], (0,))]),
+                    ('c', [FormattedRow([name, 'child'], (0, i), id_index=1) for i in range(2)]
+                          + [FormattedRow(['no id', 'child'])]),
+                ])
+            writer.close()
+            return writer.partial_export
+
+        writer = InMemoryExportWriter()
+        writer.open(headers, StringIO())
+        writer.write_partial_export(_get_partial_export(['a']))
+        writer.write_partial_export(_get_partial_export(['b', 'c']))
+        self.assertEqual(
+            [['id', 'name'], ['0', 'a'], ['1', 'b'], ['2', 'c']],
+            writer.tables['t']
+        )
+        self.assertEqual(
+            [['child', 'id', 'parent', 'index'],
+             ['a', '0.0', '0', '0', 'child'], ['a', '0.1', '0', '1', 'child'], ['no id', 'child'],
+             ['b', '1.0', '1', '0', 'child'], ['b', '1.1', '1', '1', 'child'], ['no id', 'child'],
+             ['c', '2.0', '2', '0', 'child'], ['c', '2.1', '2', '1', 'child'], ['no id', 'child']],
+            writer.tables['c']
+        )
@@ -22,6 +22,20 @@ def get_schema_index_view_keys(export_tag):
             'endkey': export_tag + [{}]}
 
 
+def get_export_index(doc):
+    """
+    Get the schema index of a doc, or None if it isn't exported.
+    Mirrors getExportTagValue in _design/util/schema.js.
+    """
+    export_tag = doc.get('#export_tag')
+    if not export_tag:
+        return None
+    if isinstance(export_tag, basestring):
+        return doc.get(export_tag)
+    # ExportConfiguration only looks at the first two parts of the index
+    return [doc.get(tag) for tag in export_tag][:2]
+
+
 def intersect_functions(*functions):
     functions = [fn for fn in functions if fn]
     if functions:
@@ -1,6 +1,8 @@
 from codecs import BOM_UTF8
+from collections import namedtuple
 import os
 import re
+from StringIO import StringIO
 import tempfile
 import zipfile
 import csv
@@ -201,6 +203,24 @@ class ExportWriter(object):
 
         self._current_primary_id += 1
 
+    def write_partial_export(self, partial_export):
+        """
+        Adds the rows written by a PartialExportWriter, given its `partial_export`.
+        The part's doc ids are numbered on from the docs already written.
+        """
+        assert self._isopen
+        for table_index, content in partial_export.table_contents.items():
+            content = _strip_bom(content)
+            if self._current_primary_id:
+                content = _offset_primary_ids(content, self._current_primary_id,
+                                              partial_export.id_columns[table_index])
+            self._write_csv_rows(table_index, content)
+        self._current_primary_id += partial_export.doc_count
+
+    def _write_csv_rows(self, table_index, content):
+        for row in csv.reader(StringIO(content)):
+            self.write_row(table_index, row)
+
     def write_row(self, table_index, headers):
         """
         Currently just calls the subclass's implementation
@@ -272,6 +292,86 @@ class OnDiskExportWriter(ExportWriter):
         """
         raise NotImplementedError
 
+    def _write_csv_rows(self, table_index, content):
+        if self.writer_class is CsvFileWriter:
+            # the rows are already in the right format so can be copied as is
+            self.tables[table_index].get_file().write(content)
+        else:
+            super(OnDiskExportWriter, self)._write_csv_rows(table_index, content)
+
+
+class PartialExportWriter(OnDiskExportWriter):
+    """
+    Writes the rows for part of an export, without any headers, to a csv per table
+    so that they can be added to the full export with `write_partial_export`.
+    This lets different processes write the rows for different docs.
+
+    Tables are created as rows are written to them. Once the writer is closed
+    `partial_export` is a PartialExport of its rows.
+    """
+
+    def open_partial(self):
+        """
+        Use instead of `open`. Docs are numbered from 0 and renumbered when the
+        part is added to the full export.
+        """
+        self._isopen = True
+        self._current_primary_id = 0
+        self.file = None
+        self.partial_export = None
+        # for each table, where each row's id is so that it can be renumbered
+        self._id_columns = {}
+        self._init()
+
+    def write_row(self, table_index, row):
+        try:
+            row_has_id = row.has_id()
+        except AttributeError:
+            row_has_id = False
+        id_column = (row.id_index, row.separator, row.include_compound_id()) if row_has_id else None
+        self._id_columns.setdefault(table_index, []).append(id_column)
+        super(PartialExportWriter, self).write_row(table_index, row)
+
+    def _write_row(self, sheet_index, row):
+        if sheet_index not in self.tables:
+            self._init_table(sheet_index, sheet_index)
+        super(PartialExportWriter, self)._write_row(sheet_index, row)
+
+    def _write_final_result(self):
+        self.partial_export = PartialExport(
+            table_contents={
+                table_index: writer.get_file().read()
+                for table_index, writer in self.tables.items()
+            },
+            id_columns=self._id_columns,
+            doc_count=self._current_primary_id,
+        )
+
+
+# The rows written by a PartialExportWriter. table_contents is a dict of table index to
+# csv content, id_columns has the position of each row's id, or None for rows without one,
+# and doc_count is the number of docs the rows are for.
+PartialExport = namedtuple('PartialExport', ['table_contents', 'id_columns', 'doc_count'])
+
+
+def _offset_primary_ids(content, offset, id_columns):
+    output = StringIO()
+    writer = csv.writer(output, csv.excel)
+    for row, id_column in zip(csv.reader(StringIO(content)), id_columns):
+        if id_column:
+            id_index, separator, include_compound_id = id_column
+            primary_id, sep, rest = row[id_index].partition(separator)
+            primary_id = str(int(primary_id) + offset)
+            row[id_index] = primary_id + sep + rest
+            if include_compound_id:
+                row[id_index + 1] = primary_id
+        writer.writerow(row)
+    return output.getvalue()
+
+
+def _strip_bom(content):
+    return content[len(BOM_UTF8):] if content.startswith(BOM_UTF8) else content
+
 
 class ZippedExportWriter(OnDiskExportWriter):
     """
@@ -34,4 +34,12 @@ MULTIPART_EMPTY_PAYLOAD_ERROR = BadRequest((
 ) % MAGIC_PROPERTY)
 EMPTY_PAYLOAD_ERROR = BadRequest('Post may not have an empty body\n')
 
+# batch submissions name each form <BATCH_PROPERTY_PREFIX><n> and its attachments <n>/<name>
+BATCH_PROPERTY_PREFIX = '%s_' % MAGIC_PROPERTY
+BATCH_FILENAME_ERROR = BadRequest((
+    'Batch submissions must be multipart/form-data with the forms in files '
+    'named %s0, %s1, ... and their attachments named 0/<name>, 1/<name>, ...\n'
+) % (BATCH_PROPERTY_PREFIX, BATCH_PROPERTY_PREFIX))
+BATCH_EMPTY_PAYLOAD_ERROR = BadRequest('Forms in a batch submission must not have an empty payload\n')
+
 DEVICE_LOG_XMLNS = 'http://code.javarosa.org/devicereport'
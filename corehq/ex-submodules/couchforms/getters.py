@@ -1,18 +1,22 @@
 from django.utils.datastructures import MultiValueDictKeyError
 from couchforms.const import (
+    BATCH_EMPTY_PAYLOAD_ERROR,
+    BATCH_FILENAME_ERROR,
+    BATCH_PROPERTY_PREFIX,
     EMPTY_PAYLOAD_ERROR,
     MAGIC_PROPERTY,
     MULTIPART_EMPTY_PAYLOAD_ERROR,
     MULTIPART_FILENAME_ERROR,
 )
 import logging
+import re
 from datetime import datetime
 from django.conf import settings
 from dimagi.utils.parsing import string_to_utc_datetime
 from dimagi.utils.web import get_ip, get_site_domain
 
 
-__all__ = ['get_path', 'get_instance_and_attachment',
+__all__ = ['get_path', 'get_instance_and_attachment', 'get_batch_instances_and_attachments',
            'get_location', 'get_received_on', 'get_date_header',
            'get_submit_ip', 'get_last_sync_token', 'get_openrosa_headers']
 
@@ -50,6 +54,34 @@ def get_instance_and_attachment(request):
     return instance, attachments
 
 
+def get_batch_instances_and_attachments(request):
+    """
+    Returns a list of (instance, attachments) tuples for a batch submission,
+    ordered by the index in the file names, or a BadRequest.
+    """
+    if not request.META['CONTENT_TYPE'].startswith('multipart/form-data'):
+        return BATCH_FILENAME_ERROR
+
+    instance_re = re.compile(r'^%s(\d+)$' % re.escape(BATCH_PROPERTY_PREFIX))
+    attachment_re = re.compile(r'^(\d+)/(.+)$')
+    instances = {}
+    attachments = {}
+    for key, item in request.FILES.items():
+        instance_match = instance_re.match(key)
+        attachment_match = attachment_re.match(key)
+        if instance_match:
+            instances[int(instance_match.group(1))] = item.read()
+        elif attachment_match:
+            index, name = attachment_match.groups()
+            attachments.setdefault(int(index), {})[name] = item
+
+    if not instances or set(attachments) - set(instances):
+        return BATCH_FILENAME_ERROR
+    if not all(instances.values()):
+        return BATCH_EMPTY_PAYLOAD_ERROR
+    return [(instances[index], attachments.get(index, {})) for index in sorted(instances)]
+
+
 def get_location(request=None):
     # this is necessary, because www.commcarehq.org always uses https,
     # but is behind a proxy that won't necessarily look like https
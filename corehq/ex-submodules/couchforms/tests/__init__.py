@@ -15,6 +15,8 @@ try:
     from .test_adjust_datetimes import *
     from .test_dbaccessors import *
     from .test_analytics import *
+    from .test_batch import *
+    from .test_conflicts import *
 except ImportError, e:
     # for some reason the test harness squashes these so log them here for clarity
     # otherwise debugging is a pain
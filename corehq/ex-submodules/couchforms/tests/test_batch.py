@@ -0,0 +1,121 @@
+import os
+import uuid
+from django.test import TestCase
+from mock import patch
+from casexml.apps.case.mock import CaseBlock
+from casexml.apps.case.models import CommCareCase
+from casexml.apps.case.util import make_form_from_case_blocks
+from couchforms.models import DefaultAuthContext, UnfinishedSubmissionStub
+from couchforms.util import BatchSubmissionPost
+from corehq.apps.commtrack.exceptions import MissingProductId
+from corehq.apps.commtrack.processing import process_stock
+from corehq.form_processor.interfaces import FormProcessorInterface
+
+
+class BatchSubmissionTest(TestCase):
+    domain = 'test-batch-submissions'
+
+    def tearDown(self):
+        FormProcessorInterface.delete_all_xforms()
+        FormProcessorInterface.delete_all_cases()
+
+    def _submit(self, instances):
+        return BatchSubmissionPost(
+            submissions=[(instance, {}) for instance in instances],
+            domain=self.domain,
+            auth_context=DefaultAuthContext(),
+        ).run()
+
+    def _case_forms(self, case_id, *updates):
+        return [
+            make_form_from_case_blocks([
+                CaseBlock(create=i == 0, case_id=case_id, user_id='whatever', update=update).as_xml()
+            ])
+            for i, update in enumerate(updates)
+        ]
+
+    def _submit_with_stock_error(self, instances, error, failing_form=1):
+        # processing fails for one form after its case changes have been made
+        calls = []
+
+        def _process_stock(xforms, case_db):
+            calls.append(xforms)
+            if len(calls) == failing_form + 1:
+                raise error
+            return process_stock(xforms, case_db)
+
+        with patch('corehq.apps.commtrack.processing.process_stock', _process_stock):
+            return self._submit(instances)
+
+    def test_forms_share_cases(self):
+        case_id = uuid.uuid4().hex
+        forms = self._case_forms(case_id, {'foo': 'bar'}, {'foo': 'baz'})
+        response, results = self._submit(forms)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(2, len(results))
+        self.assertEqual(2, response.content.count('submission '))
+        for form_response, xform, cases in results:
+            self.assertEqual(201, form_response.status_code)
+            self.assertEqual('XFormInstance', xform.doc_type)
+            self.assertEqual([case_id], [case.case_id for case in cases])
+
+        case = CommCareCase.get(case_id)
+        self.assertEqual('baz', case.foo)
+        self.assertEqual([xform.get_id for _, xform, _ in results], case.xform_ids)
+        self.assertEqual(0, UnfinishedSubmissionStub.objects.filter(domain=self.domain).count())
+
+    def test_edit_within_batch(self):
+        data_dir = os.path.join(os.path.dirname(__file__), "data", "deprecation")
+        with open(os.path.join(data_dir, "original.xml"), "rb") as f:
+            original = f.read()
+        with open(os.path.join(data_dir, "edit.xml"), "rb") as f:
+            edit = f.read()
+
+        response, results = self._submit([original, edit])
+        self.assertEqual(201, response.status_code)
+        [(_, original_xform, _), (_, edited_xform, _)] = results
+        self.assertEqual(original_xform.get_id, edited_xform.get_id)
+        self.assertTrue(edited_xform.deprecated_form_id)
+        [deprecated] = FormProcessorInterface.get_by_doc_type(self.domain, 'XFormDeprecated')
+        self.assertEqual(edited_xform.get_id, deprecated.orig_id)
+
+    def test_known_error_is_rolled_back(self):
+        case_id = uuid.uuid4().hex
+        forms = self._case_forms(case_id, {'foo': 'bar'}, {'foo': 'baz'}, {'other': 'x'})
+        response, results = self._submit_with_stock_error(forms, MissingProductId('missing'))
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            ['XFormInstance', 'XFormError', 'XFormInstance'],
+            [xform.doc_type for _, xform, _ in results]
+        )
+        for form_response, _, _ in results:
+            self.assertEqual(201, form_response.status_code)
+
+        case = CommCareCase.get(case_id)
+        self.assertEqual('bar', case.foo)
+        self.assertEqual('x', case.other)
+        self.assertEqual([results[0][1].get_id, results[2][1].get_id], case.xform_ids)
+        self.assertEqual(0, UnfinishedSubmissionStub.objects.filter(domain=self.domain).count())
+
+    def test_unexpected_error_mid_batch(self):
+        case_id = uuid.uuid4().hex
+        forms = self._case_forms(case_id, {'foo': 'bar'}, {'foo': 'baz'}, {'other': 'x'})
+        response, results = self._submit_with_stock_error(forms, Exception('boom'))
+        self.assertEqual(207, response.status_code)
+        self.assertEqual(2, len(results))
+        [(first_response, first_xform, _), (error_response, error_xform, _)] = results
+        self.assertEqual(201, first_response.status_code)
+        self.assertEqual(500, error_response.status_code)
+        self.assertEqual('XFormError', error_xform.doc_type)
+        # the form after the error is left for the phone to resubmit
+        self.assertEqual(3, response.content.count('submission '))
+        self.assertEqual(
+            [first_xform.get_id],
+            [xform.get_id for xform in FormProcessorInterface.get_by_doc_type(self.domain, 'XFormInstance')]
+        )
+
+        case = CommCareCase.get(case_id)
+        self.assertEqual('bar', case.foo)
+        self.assertFalse(hasattr(case, 'other'))
+        self.assertEqual([first_xform.get_id], case.xform_ids)
+        self.assertEqual(0, UnfinishedSubmissionStub.objects.filter(domain=self.domain).count())
@@ -0,0 +1,43 @@
+import uuid
+from django.test import TestCase
+from mock import patch
+from casexml.apps.case.mock import CaseBlock
+from casexml.apps.case.models import CommCareCase
+from casexml.apps.case.util import post_case_blocks
+from couchforms.util import get_current_revs
+from corehq.form_processor.interfaces import FormProcessorInterface
+
+
+class CaseConflictTest(TestCase):
+
+    def tearDown(self):
+        FormProcessorInterface.delete_all_xforms()
+        FormProcessorInterface.delete_all_cases()
+
+    def _create_case(self):
+        case_id = uuid.uuid4().hex
+        post_case_blocks([
+            CaseBlock(create=True, case_id=case_id, user_id='whatever',
+                      update={'foo': 'bar'}).as_xml()
+        ])
+        return CommCareCase.get(case_id)
+
+    def test_get_current_revs(self):
+        case = self._create_case()
+        deleted = self._create_case()
+        deleted.delete()
+        missing_id = uuid.uuid4().hex
+        self.assertEqual(
+            {case.case_id: case.get_rev},
+            get_current_revs(CommCareCase.get_db(), [case.case_id, deleted.case_id, missing_id])
+        )
+
+    def test_conflict_aborts_save(self):
+        case = self._create_case()
+        with patch('couchforms.util.get_current_revs', return_value={case.case_id: '2-conflict'}):
+            with self.assertRaises(AssertionError):
+                post_case_blocks([
+                    CaseBlock(create=False, case_id=case.case_id, user_id='whatever',
+                              update={'foo': 'baz'}).as_xml()
+                ])
+        self.assertEqual('bar', CommCareCase.get(case.case_id).foo)
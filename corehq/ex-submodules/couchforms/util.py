@@ -1,5 +1,6 @@
 # coding: utf-8
 from __future__ import absolute_import
+from collections import namedtuple
 import hashlib
 import datetime
 import logging
@@ -45,10 +46,13 @@ from .models import (
 from .signals import (
     successful_form_received,
 )
-from .xml import ResponseNature, OpenRosaResponse
+from .xml import ResponseNature, OpenRosaResponse, get_batch_response_xml
 
 legacy_soft_assert = soft_assert('{}@{}'.format('skelly', 'dimagi.com'))
 
+_ProcessedForm = namedtuple('_ProcessedForm', ['xforms', 'case_result', 'stock_result'])
+
+
 class SubmissionError(Exception, UnicodeMixIn):
     """
     When something especially bad goes wrong during a submission, this
@@ -444,28 +448,37 @@ class SubmissionPost(object):
 
         return doc
 
-    def run(self):
+    def _process(self, xform):
+        self._attach_shared_props(xform)
+        if xform.doc_type != 'SubmissionErrorLog':
+            found_old = scrub_meta(xform)
+            legacy_soft_assert(not found_old, 'Form with old metadata submitted', xform._id)
+
+    def _get_request_error_response(self):
+        """
+        Checks that apply to the whole request rather than an individual form.
+        Returns a response if the request can't be processed, otherwise None.
+        """
         if timezone_migration_in_progress(self.domain):
             # keep submissions on the phone
             # until ready to start accepting again
-            return HttpResponse(status=503), None, []
+            return HttpResponse(status=503)
 
         if not self.auth_context.is_valid():
-            return self.failed_auth_response, None, []
+            return self.failed_auth_response
 
         if isinstance(self.instance, BadRequest):
-            return HttpResponseBadRequest(self.instance.message), None, []
+            return HttpResponseBadRequest(self.instance.message)
 
-        def process(xform):
-            self._attach_shared_props(xform)
-            if xform.doc_type != 'SubmissionErrorLog':
-                found_old = scrub_meta(xform)
-                legacy_soft_assert(not found_old, 'Form with old metadata submitted', xform._id)
+    def run(self):
+        error_response = self._get_request_error_response()
+        if error_response is not None:
+            return error_response, None, []
 
         try:
             lock_manager = process_xform(self.instance,
                                          attachments=self.attachments,
-                                         process=process,
+                                         process=self._process,
                                          domain=self.domain)
         except SubmissionError as e:
             logging.exception(
@@ -534,23 +547,7 @@ class SubmissionPost(object):
                         # todo: this property is only used by the MVPFormIndicatorPillow
                         instance.initial_processing_complete = True
 
-                        # in saving the cases, we have to do all the things
-                        # done in CommCareCase.save()
-                        for case in cases:
-                            legacy_soft_assert(case.version == "2.0", "v1.0 case updated", case.case_id)
-                            case.initial_processing_complete = True
-                            case.server_modified_on = now
-                            try:
-                                rev = CommCareCase.get_db().get_rev(case.case_id)
-                            except ResourceNotFound:
-                                pass
-                            else:
-                                assert rev == case.get_rev, (
-                                    "Aborting because there would have been "
-                                    "a document update conflict. {} {} {}".format(
-                                        case.get_id, case.get_rev, rev
-                                    )
-                                )
+                        _prepare_cases_for_save(cases, now)
 
                         # verify that these DB's are the same so that we can save them with one call to bulk_save
                         assert XFormInstance.get_db().uri == CommCareCase.get_db().uri
@@ -662,6 +659,292 @@ class SubmissionPost(object):
         ).response()
 
 
+class BatchSubmissionPost(SubmissionPost):
+    """
+    Processes a bundle of form submissions from the same device in one request.
+
+    Forms are processed in order against a single CaseDbCache, so each form sees
+    the case changes made by the ones before it, and the forms, cases and
+    submission stubs are then persisted with a few bulk writes rather than
+    several round trips per form.
+
+    `submissions` is a list of (instance, attachments) tuples.
+    """
+
+    def __init__(self, submissions=None, **kwargs):
+        assert submissions, submissions
+        # a BadRequest for the whole batch is handled like a bad single instance
+        super(BatchSubmissionPost, self).__init__(instance=submissions, **kwargs)
+        self.submissions = submissions
+
+    def run(self):
+        """
+        Returns the response for the batch and a list of (response, instance, cases)
+        tuples for the submissions that were processed, in order. If a form fails
+        in a way the device should retry, it and all the forms after it are
+        left unprocessed.
+        """
+        error_response = self._get_request_error_response()
+        if error_response is not None:
+            return error_response, []
+
+        results = []
+        for submissions in _split_on_repeated_instance_ids(self.submissions):
+            segment_results, complete = self._run_segment(submissions)
+            results.extend(segment_results)
+            if not complete:
+                break
+        return self.get_batch_response(results), results
+
+    def get_response(self):
+        response, _ = self.run()
+        return response
+
+    def _run_segment(self, submissions):
+        from casexml.apps.case.xform import (
+            get_and_check_xform_domain, CaseDbCache, get_case_ids_from_form, process_cases_with_casedb
+        )
+        from casexml.apps.case.exceptions import IllegalCaseId, UsesReferrals
+        from corehq.apps.commtrack.processing import process_stock
+        from corehq.apps.commtrack.exceptions import MissingProductId
+
+        known_errors = (IllegalCaseId, UsesReferrals, MissingProductId,
+                        PhoneDateValueError)
+        processed = []
+        failure = None
+        with _LockManagerStack() as lock_managers, \
+                CaseDbCache(domain=self.domain, lock=True, deleted_ok=True) as case_db:
+            for instance, attachments in submissions:
+                try:
+                    lock_manager = process_xform(instance,
+                                                 attachments=attachments,
+                                                 process=self._process,
+                                                 domain=self.domain)
+                except SubmissionError as e:
+                    logging.exception(
+                        u"Problem receiving batch submission to %s. %s" % (
+                            self.path,
+                            unicode(e),
+                        )
+                    )
+                    failure = (self.get_exception_response(e.error_log), None, [])
+                    break
+
+                xforms = lock_managers.enter(lock_manager)
+                if xforms[0].doc_type != 'XFormInstance':
+                    processed.append(_ProcessedForm(xforms, None, None))
+                    continue
+                if len(xforms) > 1:
+                    assert len(xforms) == 2
+                    assert is_deprecation(xforms[1])
+                get_and_check_xform_domain(xforms[0])
+
+                case_ids = {case_id for xform in xforms for case_id in get_case_ids_from_form(xform)}
+                checkpoint = case_db.checkpoint(case_ids)
+                case_db.xforms.extend(xforms)
+                try:
+                    case_result = process_cases_with_casedb(xforms, case_db)
+                    stock_result = process_stock(xforms, case_db)
+                except known_errors as e:
+                    # undo this form's changes to the shared cases and save it as an error
+                    # so the phone doesn't keep sending it (see SubmissionPost.run)
+                    case_db.rollback(checkpoint)
+                    xforms[0] = _handle_known_error(e, xforms[0])
+                    processed.append(_ProcessedForm(xforms, None, None))
+                except Exception as e:
+                    # save the forms before this one and have the phone resubmit the rest
+                    case_db.rollback(checkpoint)
+                    error_message = u'{}: {}'.format(type(e).__name__, unicode(e))
+                    instance = _handle_unexpected_error(xforms[0], error_message)
+                    instance.save()
+                    failure = (self.get_exception_response(instance), instance, [])
+                    break
+                else:
+                    processed.append(_ProcessedForm(xforms, case_result, stock_result))
+
+            results = self._save_processed_forms(processed, case_db)
+
+        if failure:
+            results.append(failure)
+        return results, failure is None
+
+    def _save_processed_forms(self, processed, case_db):
+        from casexml.apps.case.models import CommCareCase
+        from casexml.apps.case.signals import case_post_save
+
+        if not processed:
+            return []
+
+        now = datetime.datetime.utcnow()
+        instances = [form.xforms[0] for form in processed if form.case_result]
+        instance_ids = [instance.get_id for instance in instances]
+        UnfinishedSubmissionStub.objects.bulk_create([
+            UnfinishedSubmissionStub(
+                xform_id=instance_id,
+                timestamp=now,
+                saved=False,
+                domain=self.domain,
+            )
+            for instance_id in instance_ids
+        ])
+        # the stubs created above, and not any left by an earlier submission of these forms
+        stubs = UnfinishedSubmissionStub.objects.filter(domain=self.domain, xform_id__in=instance_ids,
+                                                        timestamp=now)
+
+        cases = case_db.get_changed()
+        for instance in instances:
+            # todo: this property is only used by the MVPFormIndicatorPillow
+            instance.initial_processing_complete = True
+        _prepare_cases_for_save(cases, now)
+
+        # verify that these DB's are the same so that we can save them with one call to bulk_save
+        assert XFormInstance.get_db().uri == CommCareCase.get_db().uri
+        docs = [xform for form in processed for xform in form.xforms] + cases
+        try:
+            XFormInstance.get_db().bulk_save(docs)
+        except BulkSaveError as e:
+            logging.error('BulkSaveError saving forms', exc_info=1,
+                          extra={'details': {'errors': e.errors}})
+            raise
+        except Exception as e:
+            docs_being_saved = [doc['_id'] for doc in docs]
+            error_message = u'Unexpected error bulk saving docs {}: {}, doc_ids: {}'.format(
+                type(e).__name__,
+                unicode(e),
+                ', '.join(docs_being_saved)
+            )
+            for instance in instances:
+                _handle_unexpected_error(instance, error_message).save()
+            raise
+        stubs.update(saved=True)
+
+        for form in processed:
+            if form.case_result:
+                # a form that failed later on may have replaced cases in the cache
+                form.case_result.set_cases([case_db.get(case.case_id) for case in form.case_result.cases])
+                form.case_result.commit_dirtiness_flags()
+                form.stock_result.commit()
+        for case in cases:
+            case_post_save.send(CommCareCase, case=case)
+
+        results = []
+        for form in processed:
+            instance = form.xforms[0]
+            errors = []
+            if form.case_result:
+                errors = self.process_signals(instance)
+                if errors:
+                    # .problems was added to instance
+                    instance.save()
+            cases = form.case_result.cases if form.case_result else []
+            results.append((self._get_open_rosa_response(instance, errors), instance, cases))
+        stubs.delete()
+        return results
+
+    def get_batch_response(self, results):
+        """
+        Forms without a result weren't processed and should be resubmitted.
+        """
+        responses = [(response, instance.get_id if instance else None)
+                     for response, instance, _ in results]
+        not_processed = OpenRosaResponse(
+            message=u"Form was not processed, please resubmit it",
+            nature=ResponseNature.SUBMIT_ERROR,
+            status=503,
+        ).response()
+        responses.extend([(not_processed, None)] * (len(self.submissions) - len(results)))
+
+        all_accepted = all(response.status_code == 201 for response, _ in responses)
+        response = HttpResponse(get_batch_response_xml(responses),
+                                status=201 if all_accepted else 207)
+        # this hack is required for ODK
+        response["Location"] = self.location
+        return response
+
+
+class _LockManagerStack(object):
+    """
+    Holds the locks of the lock managers entered with `enter` until the block
+    exits, like a nested `with` statement for each of them.
+    """
+
+    def __init__(self):
+        self._lock_managers = []
+
+    def enter(self, lock_manager):
+        xforms = lock_manager.__enter__()
+        self._lock_managers.append(lock_manager)
+        return xforms
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        while self._lock_managers:
+            self._lock_managers.pop().__exit__(exc_type, exc_val, exc_tb)
+
+
+def _split_on_repeated_instance_ids(submissions):
+    """
+    Splits a batch into runs of submissions with distinct instance IDs. A form that
+    is edited or resubmitted within the batch has to find the earlier version in
+    the database, so it starts a new run.
+    """
+    segments = [[]]
+    seen_ids = set()
+    for instance, attachments in submissions:
+        instance_id = _get_instance_id(instance)
+        if instance_id and instance_id in seen_ids:
+            segments.append([])
+            seen_ids = set()
+        if instance_id:
+            seen_ids.add(instance_id)
+        segments[-1].append((instance, attachments))
+    return segments
+
+
+def _get_instance_id(instance):
+    try:
+        return _extract_meta_instance_id(convert_xform_to_json(instance))
+    except couchforms.XMLSyntaxError:
+        return None
+
+
+def _prepare_cases_for_save(cases, now):
+    """
+    In saving the cases, we have to do all the things done in CommCareCase.save()
+    """
+    from casexml.apps.case.models import CommCareCase
+    current_revs = get_current_revs(CommCareCase.get_db(), [case.case_id for case in cases])
+    for case in cases:
+        legacy_soft_assert(case.version == "2.0", "v1.0 case updated", case.case_id)
+        case.initial_processing_complete = True
+        case.server_modified_on = now
+        if case.case_id in current_revs:
+            rev = current_revs[case.case_id]
+            assert rev == case.get_rev, (
+                "Aborting because there would have been "
+                "a document update conflict. {} {} {}".format(
+                    case.get_id, case.get_rev, rev
+                )
+            )
+
+
+def get_current_revs(db, doc_ids):
+    """
+    Returns a dict of doc ID to the current revision of the doc, fetched with a
+    single _all_docs request. Docs that don't exist or have been deleted are
+    left out, the same as the ones `db.get_rev` raises ResourceNotFound for.
+    """
+    if not doc_ids:
+        return {}
+    return {
+        row['id']: row['value']['rev']
+        for row in db.view('_all_docs', keys=list(doc_ids))
+        if 'value' in row and not row['value'].get('deleted')
+    }
+
+
 def _handle_known_error(e, instance):
     error_message = '{}: {}'.format(
         type(e).__name__, unicode(e))
@@ -20,6 +20,7 @@ class ResponseNature(object):
 
     OTA_RESTORE_SUCCESS = 'ota_restore_success'
     OTA_RESTORE_ERROR = 'ota_restore_error'
+    OTA_RESTORE_PENDING = 'ota_restore_pending'
 
 
 def get_response_element(message, nature=''):
@@ -56,3 +57,27 @@ class OpenRosaResponse(object):
 
     def response(self):
         return HttpResponse(self.xml(), status=self.status)
+
+
+def get_batch_response_xml(results):
+    """
+    Combines the OpenRosa responses for the forms in a batch submission into
+    one document with a <submission> element per form.
+
+    `results` is a list of (response, form_id) tuples in submission order.
+    """
+    elem = ElementTree.Element('OpenRosaBatchResponse')
+    elem.attrib = {'xmlns': RESPONSE_XMLNS}
+    for index, (response, form_id) in enumerate(results):
+        submission_elem = ElementTree.Element('submission')
+        submission_elem.attrib = {'index': unicode(index), 'status': unicode(response.status_code)}
+        if form_id:
+            submission_elem.attrib['form_id'] = form_id
+        message = ElementTree.fromstring(response.content).find('{%s}message' % RESPONSE_XMLNS)
+        if message is not None:
+            msg_elem = ElementTree.Element('message')
+            msg_elem.attrib = dict(message.attrib)
+            msg_elem.text = message.text
+            submission_elem.append(msg_elem)
+        elem.append(submission_elem)
+    return ElementTree.tostring(elem, encoding='utf-8')
@@ -0,0 +1,73 @@
+import json
+import logging
+import threading
+import time
+from casexml.apps.case.models import CommCareCase
+from couchexport.schema import update_schema_checkpoint
+from couchexport.util import get_export_index
+from pillowtop.listener import BasicPillow
+
+pillow_logging = logging.getLogger("pillowtop")
+
+# how often (in seconds) the schemas of export indices with new docs are checkpointed
+SCHEMA_CHECKPOINT_INTERVAL = 10 * 60
+# how often (in seconds) to check for pending indices when no changes are coming in
+SCHEMA_CHECKPOINT_POLL_INTERVAL = 60
+
+
+class ExportSchemaPillow(BasicPillow):
+    """
+    Keeps the couchexport schema checkpoints of exported docs up to date, so that
+    building an export only has to look at the docs submitted in the last few minutes
+    rather than everything since the export was last downloaded.
+
+    Indices that have had new docs are checkpointed every SCHEMA_CHECKPOINT_INTERVAL
+    seconds, by the change feed or, once it goes quiet, by a timer thread. Indices
+    that have never been exported have no checkpoint to extend and are left for the
+    first export to build.
+    """
+    document_class = CommCareCase  # forms and cases share the main db
+
+    def __init__(self, **kwargs):
+        super(ExportSchemaPillow, self).__init__(**kwargs)
+        self.changed_indices = {}
+        self.last_checkpointed = time.time()
+        self._checkpoint_lock = threading.Lock()
+
+    def run(self):
+        timer = threading.Thread(target=self._checkpoint_periodically)
+        timer.daemon = True
+        timer.start()
+        super(ExportSchemaPillow, self).run()
+
+    def _checkpoint_periodically(self):
+        while True:
+            time.sleep(SCHEMA_CHECKPOINT_POLL_INTERVAL)
+            try:
+                self.checkpoint_schemas()
+            except Exception:
+                pillow_logging.exception("Problem checkpointing export schemas")
+
+    def change_transform(self, doc_dict):
+        return get_export_index(doc_dict)
+
+    def change_transport(self, index):
+        with self._checkpoint_lock:
+            self.changed_indices[json.dumps(index)] = index
+        self.checkpoint_schemas()
+
+    def checkpoint_schemas(self, force=False):
+        """
+        Checkpoints the indices with new docs if it's been SCHEMA_CHECKPOINT_INTERVAL
+        seconds since they were last checkpointed, or straight away with `force`
+        """
+        with self._checkpoint_lock:
+            if not force and time.time() - self.last_checkpointed <= SCHEMA_CHECKPOINT_INTERVAL:
+                return
+            indices, self.changed_indices = self.changed_indices.values(), {}
+            self.last_checkpointed = time.time()
+            for index in indices:
+                try:
+                    update_schema_checkpoint(self.document_class.get_db(), index)
+                except Exception:
+                    pillow_logging.exception("Couldn't update export schema for %s", index)
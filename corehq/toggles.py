@@ -384,6 +384,27 @@ PRIME_RESTORE = StaticToggle(
     [NAMESPACE_DOMAIN, NAMESPACE_USER]
 )
 
+ASYNC_RESTORE = StaticToggle(
+    'async_restore',
+    'Generate restore payloads asynchronously and have the phone poll for progress',
+    TAG_EXPERIMENTAL,
+    [NAMESPACE_DOMAIN]
+)
+
+COMPRESSED_RESTORE = StaticToggle(
+    'compressed_restore',
+    'Gzip compress restore payloads for phones that accept it',
+    TAG_EXPERIMENTAL,
+    [NAMESPACE_DOMAIN]
+)
+
+INCREMENTAL_RESTORE_CACHE = StaticToggle(
+    'incremental_restore_cache',
+    'Reuse cached case XML from the previous initial restore for unmodified cases',
+    TAG_EXPERIMENTAL,
+    [NAMESPACE_DOMAIN]
+)
+
 FORM_LINK_WORKFLOW = StaticToggle(
     'form_link_workflow',
     'Form linking workflow available on forms',
@@ -699,3 +720,10 @@ GRID_MENUS = StaticToggle(
     TAG_ONE_OFF,
     [NAMESPACE_DOMAIN]
 )
+
+PARALLEL_EXPORTS = StaticToggle(
+    'parallel_exports',
+    'Build custom exports in parallel chunks',
+    TAG_EXPERIMENTAL,
+    [NAMESPACE_DOMAIN]
+)
@@ -1,11 +1,13 @@
 # coding=utf-8
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import functools
 import hashlib
 import inspect
 from inspect import isfunction
 import logging
+import time
 from django.core.cache import caches as django_caches
+from corehq.util.quickcache_stats import quickcache_stats, ALL_TIERS
 from corehq.util.soft_assert.api import soft_assert
 
 logger = logging.getLogger('quickcache')
@@ -18,6 +20,12 @@ class CacheWithTimeout(namedtuple('CacheWithTimeout', ['cache', 'timeout'])):
     def set(self, key, value):
         return self.cache.set(key, value, timeout=self.timeout)
 
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, data):
+        return self.cache.set_many(data, timeout=self.timeout)
+
     def delete(self, key):
         return self.cache.delete(key)
 
@@ -35,10 +43,14 @@ class TieredCache(object):
     def __init__(self, caches):
         self.caches = caches
 
-    def get(self, key, default=None):
+    def get(self, key, default=None, stats_prefix=None):
+        """
+        stats_prefix is the prefix to record hits and misses for each tier under, if any
+        """
         missed = []
-        for cache in self.caches:
+        for tier, cache in enumerate(self.caches):
             content = cache.get(key, default=Ellipsis)
+            self._record(stats_prefix, tier, cache, hit=content is not Ellipsis)
             if content is not Ellipsis:
                 for missed_cache in missed:
                     missed_cache.set(key, content)
@@ -54,10 +66,53 @@ class TieredCache(object):
         for cache in self.caches:
             cache.set(key, value)
 
+    def get_many(self, keys, stats_prefix=None):
+        """
+        Like get, but for many keys at once, with one get_many call per cache.
+        Returns a dict of the keys that were found.
+        """
+        found = {}
+        missed = []
+        remaining = list(keys)
+        for tier, cache in enumerate(self.caches):
+            if not remaining:
+                break
+            hits = cache.get_many(remaining)
+            for key in remaining:
+                self._record(stats_prefix, tier, cache, hit=key in hits)
+            if hits:
+                for missed_cache in missed:
+                    missed_cache.set_many(hits)
+                found.update(hits)
+                remaining = [key for key in remaining if key not in hits]
+            missed.append(cache)
+        return found
+
+    def set_many(self, data):
+        for cache in self.caches:
+            cache.set_many(data)
+
     def delete(self, key):
         for cache in self.caches:
             cache.delete(key)
 
+    @staticmethod
+    def _record(stats_prefix, tier, cache, hit):
+        if stats_prefix is None:
+            return
+        quickcache_stats.record(
+            stats_prefix,
+            _get_tier_name(tier, cache),
+            hits=int(hit),
+            misses=int(not hit),
+        )
+
+
+def _get_tier_name(tier, cache):
+    if isinstance(cache, CacheWithTimeout):
+        cache = cache.cache
+    return '{}:{}'.format(tier, cache.__class__.__name__)
+
 
 class QuickCache(object):
     def __init__(self, fn, vary_on, cache):
@@ -91,13 +146,69 @@ class QuickCache(object):
         logger.debug('checking caches for {}'.format(self.fn.__name__))
         key = self.get_cache_key(*args, **kwargs)
         logger.debug(key)
-        content = self.cache.get(key, default=Ellipsis)
+        content = self.cache.get(key, default=Ellipsis, **self._stats_kwargs)
         if content is Ellipsis:
             logger.debug('cache miss, calling {}'.format(self.fn.__name__))
+            start = time.time()
             content = self.fn(*args, **kwargs)
+            quickcache_stats.record_fill(self.prefix, time.time() - start, [content])
             self.cache.set(key, content)
+        else:
+            quickcache_stats.record(self.prefix, ALL_TIERS, hits=1)
         return content
 
+    def get_many(self, list_of_args, batch_fn=None):
+        """
+        Returns the results for many calls at once, in order. Each item in
+        `list_of_args` is a tuple of positional args or a dict of kwargs for one call.
+
+        Cached values are fetched with a single get_many per cache. The function is
+        then called for each miss, or if `batch_fn` is passed it is called once with
+        the list of missing calls' args and should return their results in order.
+        """
+        calls = [
+            ((), args) if isinstance(args, dict) else (args if isinstance(args, tuple) else (args,), {})
+            for args in list_of_args
+        ]
+        keys = [self.get_cache_key(*args, **kwargs) for args, kwargs in calls]
+        if hasattr(self.cache, 'get_many'):
+            found = self.cache.get_many(keys, **self._stats_kwargs)
+        else:
+            found = {}
+            for key in keys:
+                content = self.cache.get(key, default=Ellipsis)
+                if content is not Ellipsis:
+                    found[key] = content
+
+        missing = OrderedDict(
+            (key, (item, call)) for key, item, call in zip(keys, list_of_args, calls)
+            if key not in found
+        )
+        if len(found):
+            quickcache_stats.record(self.prefix, ALL_TIERS, hits=len(found))
+        if missing:
+            logger.debug('{} cache misses, calling {}'.format(len(missing), self.fn.__name__))
+            start = time.time()
+            if batch_fn:
+                results = batch_fn([item for item, _ in missing.values()])
+            else:
+                results = [self.fn(*args, **kwargs) for _, (args, kwargs) in missing.values()]
+            quickcache_stats.record_fill(self.prefix, time.time() - start, results, count=len(missing))
+            new_values = dict(zip(missing.keys(), results))
+            if hasattr(self.cache, 'set_many'):
+                self.cache.set_many(new_values)
+            else:
+                for key, content in new_values.items():
+                    self.cache.set(key, content)
+            found.update(new_values)
+
+        return [found[key] for key in keys]
+
+    @property
+    def _stats_kwargs(self):
+        # only a TieredCache records stats for each tier
+        return {'stats_prefix': self.prefix} if isinstance(self.cache, TieredCache) else {}
+
     def clear(self, *args, **kwargs):
         key = self.get_cache_key(*args, **kwargs)
         self.cache.delete(key)
@@ -268,6 +379,10 @@ def quickcache(vary_on, timeout=None, memoize_timeout=None, cache=None,
           with the same args and kwargs as the function. It should return a list of simple
           values to be used for generating the cache key.
 
+        - Many values can be looked up at once with `fn.get_many(list_of_args)`
+          (see QuickCache.get_many), which only hits each cache once and only
+          calls the function for the misses.
+
         Note on unicode and strings in vary_on:
           When strings and unicode values are used as vary on parameters they will result in the
           same cache key if and only if the string values are UTF-8 or ascii encoded.
@@ -304,6 +419,7 @@ def quickcache(vary_on, timeout=None, memoize_timeout=None, cache=None,
             return helper(*args, **kwargs)
 
         inner.clear = helper.clear
+        inner.get_many = helper.get_many
         inner.get_cache_key = helper.get_cache_key
         inner.prefix = helper.prefix
 
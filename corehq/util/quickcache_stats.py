@@ -0,0 +1,155 @@
+"""
+Hit/miss/fill stats for quickcache, per function (the QuickCache prefix) and cache tier.
+
+Stats are collected in memory and every FLUSH_INTERVAL seconds are
+  - added to running totals in the shared cache, which is what the
+    `quickcache_stats` management command reports on, and
+  - passed to the function named by settings.QUICKCACHE_STATS_HOOK (if any) as
+    hook(metric_name, value, tags), e.g. to forward them to statsd/datadog.
+
+Stats are off unless settings.QUICKCACHE_STATS_ENABLED is set. Measuring the
+size of a value means pickling it again, so only a sample of the computed values
+(settings.QUICKCACHE_STATS_PAYLOAD_SAMPLE_RATE) is measured.
+
+The shared totals are updated without locking so they are approximate.
+"""
+from collections import defaultdict
+import cPickle
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches as django_caches
+from dimagi.utils.modules import to_function
+
+logger = logging.getLogger('quickcache')
+
+FLUSH_INTERVAL = 60  # in seconds
+STATS_TIMEOUT = 7 * 24 * 60 * 60  # 1 week
+STATS_KEY_PREFIX = 'quickcache-stats'
+PREFIXES_KEY = '{}-prefixes'.format(STATS_KEY_PREFIX)
+
+STAT_NAMES = ('hits', 'misses', 'fill_count', 'fill_seconds', 'payload_bytes', 'payload_samples')
+
+# tier name used for the totals across all tiers of a cache
+ALL_TIERS = 'all'
+
+
+def _empty_stats():
+    return defaultdict(lambda: defaultdict(lambda: dict.fromkeys(STAT_NAMES, 0)))
+
+
+class QuickCacheStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = _empty_stats()
+        self._last_flushed = time.time()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'QUICKCACHE_STATS_ENABLED', False)
+
+    def record(self, prefix, tier, **values):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stats[prefix][tier]
+            for name, value in values.items():
+                stats[name] += value
+            should_flush = time.time() - self._last_flushed > FLUSH_INTERVAL
+        if should_flush:
+            self.flush()
+
+    def record_fill(self, prefix, seconds, values, count=1):
+        """
+        Records the time it took to compute `count` values for the cache,
+        and the size of a sample of them
+        """
+        if not self.enabled:
+            return
+        sample_rate = getattr(settings, 'QUICKCACHE_STATS_PAYLOAD_SAMPLE_RATE', 0)
+        sample = [value for value in values if random.random() < sample_rate]
+        self.record(prefix, ALL_TIERS, misses=count, fill_count=count, fill_seconds=seconds,
+                    payload_bytes=sum(_get_payload_size(value) for value in sample),
+                    payload_samples=len(sample))
+
+    def flush(self):
+        with self._lock:
+            stats, self._stats = self._stats, _empty_stats()
+            self._last_flushed = time.time()
+        if not stats:
+            return
+        try:
+            _add_to_shared_totals(stats)
+            _send_to_hook(stats)
+        except Exception:
+            # stats should never break the code being cached
+            logger.exception('problem flushing quickcache stats')
+
+
+def _get_payload_size(value):
+    try:
+        return len(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _stats_key(prefix):
+    return '{}.{}'.format(STATS_KEY_PREFIX, prefix)
+
+
+def _get_stats_cache():
+    return django_caches['default']
+
+
+def _add_to_shared_totals(stats):
+    cache = _get_stats_cache()
+    prefixes = cache.get(PREFIXES_KEY) or set()
+    totals = cache.get_many([_stats_key(prefix) for prefix in stats])
+    for prefix, tiers in stats.items():
+        prefix_totals = totals.get(_stats_key(prefix)) or {}
+        for tier, values in tiers.items():
+            tier_totals = prefix_totals.setdefault(tier, dict.fromkeys(STAT_NAMES, 0))
+            for name, value in values.items():
+                tier_totals[name] = tier_totals.get(name, 0) + value
+        totals[_stats_key(prefix)] = prefix_totals
+    cache.set_many(totals, STATS_TIMEOUT)
+    if set(stats) - prefixes:
+        cache.set(PREFIXES_KEY, prefixes | set(stats), STATS_TIMEOUT)
+
+
+def _send_to_hook(stats):
+    hook_path = getattr(settings, 'QUICKCACHE_STATS_HOOK', None)
+    if not hook_path:
+        return
+    hook = to_function(hook_path)
+    for prefix, tiers in stats.items():
+        for tier, values in tiers.items():
+            tags = ['prefix:{}'.format(prefix), 'tier:{}'.format(tier)]
+            for name, value in values.items():
+                if value:
+                    hook('quickcache.{}'.format(name), value, tags)
+
+
+def get_shared_totals():
+    """
+    Returns {prefix: {tier: {stat name: total}}} for everything recorded in the shared cache
+    """
+    cache = _get_stats_cache()
+    prefixes = cache.get(PREFIXES_KEY) or set()
+    totals = cache.get_many([_stats_key(prefix) for prefix in prefixes])
+    return {
+        prefix: totals[_stats_key(prefix)]
+        for prefix in prefixes if _stats_key(prefix) in totals
+    }
+
+
+def reset_shared_totals():
+    cache = _get_stats_cache()
+    prefixes = cache.get(PREFIXES_KEY) or set()
+    cache.delete_many([_stats_key(prefix) for prefix in prefixes] + [PREFIXES_KEY])
+
+
+quickcache_stats = QuickCacheStats()
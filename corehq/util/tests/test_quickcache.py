@@ -2,8 +2,11 @@
 
 from django.core.cache.backends.locmem import LocMemCache
 from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from mock import patch
 import time
 from corehq.util.quickcache import quickcache, TieredCache, SkippableQuickCache, skippable_quickcache
+from corehq.util.quickcache_stats import quickcache_stats, _empty_stats
 
 BUFFER = []
 
@@ -137,6 +140,81 @@ class QuickcacheTest(SimpleTestCase):
         self.assertEqual(fred.get_name(), 'fred')
         self.assertEqual(self.consume_buffer(), ['local hit'])
 
+    def test_clear(self):
+        @quickcache(['n'], cache=_cache)
+        def halve(n):
+            BUFFER.append('called {}'.format(n))
+            return n / 2
+
+        self.assertEqual(halve(4), 2)
+        self.assertEqual(self.consume_buffer(), ['local miss', 'shared miss', 'called 4'])
+        self.assertEqual(halve(4), 2)
+        self.assertEqual(self.consume_buffer(), ['local hit'])
+        halve.clear(4)
+        self.assertEqual(halve(4), 2)
+        self.assertEqual(self.consume_buffer(), ['local miss', 'shared miss', 'called 4'])
+
+    def test_get_many(self):
+        @quickcache(['n'], cache=_cache)
+        def square(n):
+            BUFFER.append('called {}'.format(n))
+            return n * n
+
+        self.assertEqual(square(2), 4)
+        self.consume_buffer()
+        self.assertEqual(square.get_many([1, 2, 3]), [1, 4, 9])
+        self.assertEqual(self.consume_buffer(), ['local miss', 'local hit', 'local miss',
+                                                 'shared miss', 'shared miss', 'called 1', 'called 3'])
+        self.assertEqual(square.get_many([3, 1]), [9, 1])
+        self.assertEqual(self.consume_buffer(), ['local hit', 'local hit'])
+
+    def test_get_many_batch_fn(self):
+        @quickcache(['n'], cache=_cache)
+        def cube(n):
+            BUFFER.append('called {}'.format(n))
+            return n * n * n
+
+        def batch(items):
+            BUFFER.append('batch {}'.format(items))
+            return [8, 27]
+
+        self.assertEqual(cube.get_many([(2,), {'n': 3}], batch_fn=batch), [8, 27])
+        self.assertEqual(self.consume_buffer(), ['local miss', 'local miss', 'shared miss', 'shared miss',
+                                                 "batch [(2,), {'n': 3}]"])
+        self.assertEqual(cube(3), 27)
+        self.assertEqual(self.consume_buffer(), ['local hit'])
+
+    @override_settings(QUICKCACHE_STATS_ENABLED=True, QUICKCACHE_STATS_PAYLOAD_SAMPLE_RATE=1)
+    @patch('corehq.util.quickcache_stats.FLUSH_INTERVAL', 60 * 60)
+    def test_stats(self):
+        @quickcache(['n'], cache=_cache)
+        def double(n):
+            return n * 2
+
+        with patch.object(quickcache_stats, '_stats', _empty_stats()) as stats:
+            double(1)
+            double(1)
+
+        stats = stats[double.prefix]
+        self.assertEqual(1, stats['all']['hits'])
+        self.assertEqual(1, stats['all']['misses'])
+        self.assertEqual(1, stats['all']['fill_count'])
+        self.assertTrue(stats['all']['payload_bytes'] > 0)
+        self.assertEqual(1, stats['all']['payload_samples'])
+        self.assertEqual((1, 1), (stats['0:CacheMock']['hits'], stats['0:CacheMock']['misses']))
+        self.assertEqual((0, 1), (stats['1:CacheMock']['hits'], stats['1:CacheMock']['misses']))
+
+    @patch('corehq.util.quickcache_stats.FLUSH_INTERVAL', 60 * 60)
+    def test_stats_disabled(self):
+        @quickcache(['n'], cache=_cache)
+        def triple(n):
+            return n * 3
+
+        with patch.object(quickcache_stats, '_stats', _empty_stats()) as stats:
+            triple(1)
+            triple(1)
+        self.assertEqual({}, dict(stats))
+
     def test_bad_vary_on(self):
         with self.assertRaisesRegexp(ValueError, 'cucumber'):
             @quickcache(['cucumber'], cache=_cache)
@@ -435,6 +435,13 @@ LOGIN_REDIRECT_URL = '/'
 
 REPORT_CACHE = 'default'  # or e.g. 'redis'
 
+# collect hit/miss/fill stats for quickcached functions (see corehq.util.quickcache_stats)
+QUICKCACHE_STATS_ENABLED = False
+# the fraction of computed values whose pickled size is measured
+QUICKCACHE_STATS_PAYLOAD_SAMPLE_RATE = 0.01
+# optional path to a function called as hook(metric_name, value, tags) when stats are flushed
+QUICKCACHE_STATS_HOOK = None
+
 ####### Domain settings  #######
 
 DOMAIN_MAX_REGISTRATION_REQUESTS_PER_DAY = 99
@@ -1336,6 +1343,7 @@ PILLOWTOPS = {
         'corehq.pillows.reportxform.ReportXFormPillow',
         'corehq.apps.userreports.pillow.ConfigurableIndicatorPillow',
         'corehq.apps.userreports.pillow.StaticDataSourcePillow',
+        'corehq.pillows.export_schema.ExportSchemaPillow',
     ],
     'cache': [
         'corehq.pillows.cacheinvalidate.CacheInvalidatePillow',